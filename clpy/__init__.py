@@ -533,10 +533,25 @@ def asnumpy(a, stream=None):
             object, then this argument has no effect.
 
     Returns:
-        numpy.ndarray: Converted array on the host memory.
+        numpy.ndarray: Converted array on the host memory. If ``stream`` is
+        specified, it is a view of a pinned memory, which can be pooled by
+        ``clpy.backend.set_pinned_memory_allocator(
+        clpy.backend.PinnedMemoryPool().malloc)``. If ``stream`` is not
+        specified and the zero-copy mode is enabled (see
+        :func:`clpy.backend.memory.is_zero_copy_enabled`), it is a view of
+        the mapped device memory instead of a copy. The memory stays mapped
+        until the view and all arrays derived from it are destroyed, and
+        kernels must not access ``a`` meanwhile.
 
     """
     if isinstance(a, ndarray):
+        if stream is None and a.size > 0:
+            with a.device:
+                if backend.memory.is_zero_copy_enabled():
+                    a = ascontiguousarray(a)
+                    mapped = backend.memory.MappedMemory(a.data, a.nbytes)
+                    return numpy.asarray(mapped).view(a.dtype).reshape(
+                        a.shape)
         return a.get(stream=stream)
     else:
         return numpy.asarray(a)
@@ -0,0 +1,285 @@
+"""Auto-tuning of the launch configurations of elementwise kernels.
+
+Elementwise kernels process their elements by a grid-stride loop, so that
+they can be launched with any work-group size and any number of elements per
+work-item. The tuner is enabled by ``CLPY_AUTOTUNE=1`` or
+:func:`set_enabled`. Then the first launches of a kernel for each bucket of
+sizes on each device try the candidate configurations in turn, and their
+execution times are measured by profiling events without waiting for the
+kernels. When all candidates are measured, the fastest one is used for the
+following launches and saved into ``autotune-<device hash>.json`` in the
+kernel cache directory, which other processes load to skip the tuning.
+
+The measurements need the command queues created with profiling enabled,
+which ``CLPY_AUTOTUNE=1`` implies, so :func:`set_enabled` requires
+``CLPY_AUTOTUNE=1`` or ``CLPY_QUEUE_PROFILING=1``. Kernels whose operations
+contain jump statements are not tuned (see :class:`clpy.ElementwiseKernel`).
+"""
+import json
+import os
+import threading
+
+from clpy.backend import compiler
+from clpy.backend import device
+from clpy.backend.opencl import api
+from clpy.backend.opencl import env
+from clpy.backend.opencl import exceptions
+from clpy.backend.opencl import utility
+
+
+_enabled = os.environ.get('CLPY_AUTOTUNE') == '1'
+# number of measurements of each candidate
+_n_trials = 3
+# kernels with fewer elements are launched with the default configuration
+_min_tuning_size = 1 << 12
+_max_local_size = 1024
+_items_per_work_item = (1, 2, 4, 8)
+
+# default configuration of the OpenCL implementation
+_default_config = (0, 1)
+
+_lock = threading.Lock()
+# _DeviceTuner of each device ID
+_tuners = {}
+
+
+def is_enabled():
+    """Returns ``True`` if the auto-tuner is enabled."""
+    return _enabled
+
+
+def set_enabled(flag):
+    """Enables or disables the auto-tuner.
+
+    The auto-tuner can be enabled only if the command queues are created
+    with profiling enabled (see
+    :func:`clpy.backend.opencl.env.is_queue_profiling_enabled`).
+    """
+    global _enabled
+    if flag and not env.is_queue_profiling_enabled():
+        raise RuntimeError(
+            'The auto-tuner requires CLPY_AUTOTUNE=1 or '
+            'CLPY_QUEUE_PROFILING=1')
+    _enabled = bool(flag)
+
+
+def get_size_bucket(size):
+    """Returns the bucket of sizes sharing a tuned configuration.
+
+    Sizes are bucketed by powers of 2.
+    """
+    return int(size).bit_length()
+
+
+def get_candidates(info, max_local_size):
+    """Lists the candidate configurations of a kernel.
+
+    Args:
+        info (clpy.backend.DeviceInfo): Capabilities of the device.
+        max_local_size (int): Maximum work-group size of the kernel.
+
+    Returns:
+        list of tuples: Pairs of the work-group size, which is 0 for the
+        default of the OpenCL implementation, and the number of elements
+        processed by each work-item.
+
+    """
+    local_sizes = [0]
+    local_size = info.preferred_work_group_size_multiple
+    limit = min(max_local_size, info.max_work_group_size,
+                info.max_work_item_sizes[0], _max_local_size)
+    while local_size <= limit:
+        local_sizes.append(local_size)
+        local_size *= 2
+    return [(local_size, items) for local_size in local_sizes
+            for items in _items_per_work_item]
+
+
+class _Tuning(object):
+
+    """Measurements of the candidate configurations of a kernel.
+
+    Each measurement is the execution time per element, which makes the
+    launches of different sizes in a bucket comparable.
+    """
+
+    def __init__(self, candidates):
+        self.candidates = candidates
+        self.times = [[] for _ in candidates]
+        self.scheduled = [0] * len(candidates)
+        # tuples of the event, the index of the candidate and the size
+        self.pending = []
+
+    def next_candidate(self):
+        """Returns the index of the candidate to be measured, or ``None``."""
+        i = min(range(len(self.candidates)), key=self.scheduled.__getitem__)
+        if self.scheduled[i] >= _n_trials:
+            return None
+        self.scheduled[i] += 1
+        return i
+
+    def add_event(self, event, index, size):
+        self.pending.append((event, index, size))
+
+    def fail(self, index):
+        self.scheduled[index] = _n_trials
+        self.times[index] = [float('inf')] * _n_trials
+
+    def collect(self):
+        """Reads the times of the completed events."""
+        pending = []
+        for event, index, size in self.pending:
+            if not utility.IsEventComplete(event):
+                pending.append((event, index, size))
+                continue
+            try:
+                start = utility.GetEventProfilingInfo(
+                    event, api.PROFILING_COMMAND_START)
+                end = utility.GetEventProfilingInfo(
+                    event, api.PROFILING_COMMAND_END)
+                self.times[index].append(float(end - start) / size)
+            except exceptions.OpenCLRuntimeError:
+                # e.g. the command queue is created without profiling
+                self.times[index].append(float('inf'))
+            finally:
+                utility.ReleaseEvent(event)
+        self.pending = pending
+
+    def is_done(self):
+        return all(len(t) >= _n_trials for t in self.times)
+
+    def best(self):
+        """Returns the candidate with the smallest median time."""
+        def median(times):
+            return sorted(times)[len(times) // 2]
+        i = min(range(len(self.candidates)),
+                key=lambda i: median(self.times[i]))
+        return self.candidates[i]
+
+
+class _DeviceTuner(object):
+
+    """Tuned configurations and ongoing tunings of a device."""
+
+    def __init__(self, device_id):
+        info = device.get_device_info(device_id)
+        self.info = info
+        self.name = 'autotune-%s.json' % compiler.get_cache_key(
+            info.identity)
+        self.configs = self._load()
+        self.tunings = {}
+
+    def _load(self):
+        data = compiler.load_from_cache(self.name)
+        if data is None:
+            return {}
+        try:
+            return {k: tuple(v) for k, v in
+                    json.loads(data.decode('utf-8')).items()}
+        except ValueError:
+            return {}
+
+    def save(self, key, config):
+        self.configs[key] = config
+        if not compiler.is_cache_enabled():
+            return
+        # merges the configurations tuned by other processes
+        configs = self._load()
+        configs.update(self.configs)
+        compiler.save_to_cache(
+            self.name, json.dumps(configs, sort_keys=True).encode('utf-8'))
+
+
+def _get_tuner(device_id):
+    # must be called with _lock
+    tuner = _tuners.get(device_id)
+    if tuner is None:
+        tuner = _DeviceTuner(device_id)
+        _tuners[device_id] = tuner
+    return tuner
+
+
+def get_launch(kernel_key, size, max_local_size):
+    """Decides the configuration of a launch of an elementwise kernel.
+
+    Args:
+        kernel_key (str): Key of the source and the options of the kernel.
+        size (int): Number of the elements.
+        max_local_size (int): Maximum work-group size of the kernel.
+
+    Returns:
+        tuple: The work-group size, which is 0 for the default of the OpenCL
+        implementation, the number of elements processed by each work-item
+        and the tuning to which the event of the launch is given by
+        :func:`add_event`. The tuning is ``None`` if the launch is not
+        measured.
+
+    """
+    if kernel_key is None or size < _min_tuning_size:
+        return _default_config + (None,)
+    key = '%s:%d' % (kernel_key, get_size_bucket(size))
+    with _lock:
+        tuner = _get_tuner(device.get_device_id())
+        config = tuner.configs.get(key)
+        if config is not None:
+            return config + (None,)
+        tuning = tuner.tunings.get(key)
+        if tuning is None:
+            tuning = _Tuning(get_candidates(tuner.info, max_local_size))
+            tuner.tunings[key] = tuning
+        tuning.collect()
+        if tuning.is_done():
+            config = tuning.best()
+            del tuner.tunings[key]
+            tuner.save(key, config)
+            return config + (None,)
+        i = tuning.next_candidate()
+        if i is None:
+            # waits for the measurements of all candidates
+            return _default_config + (None,)
+        return tuning.candidates[i] + ((tuning, i),)
+
+
+def add_event(tuning, event, size):
+    """Gives the profiling event of a launch decided by :func:`get_launch`.
+
+    The event is released by the tuner.
+    """
+    tuning, index = tuning
+    with _lock:
+        tuning.add_event(event, index, size)
+
+
+def add_failure(tuning):
+    """Records that a launch decided by :func:`get_launch` failed."""
+    tuning, index = tuning
+    with _lock:
+        tuning.fail(index)
+
+
+def get_tuned_config(kernel_key, size, device_id=None):
+    """Returns the tuned configuration of a kernel, or ``None``.
+
+    It only looks up the configurations tuned or loaded by this process.
+    """
+    if device_id is None:
+        device_id = device.get_device_id()
+    key = '%s:%d' % (kernel_key, get_size_bucket(size))
+    with _lock:
+        tuner = _tuners.get(device_id)
+        if tuner is None:
+            return None
+        return tuner.configs.get(key)
+
+
+def clear():
+    """Discards the tuned configurations and the tunings in this process.
+
+    The configurations saved on disk are kept.
+    """
+    with _lock:
+        for tuner in _tuners.values():
+            for tuning in tuner.tunings.values():
+                for event, _, _ in tuning.pending:
+                    utility.ReleaseEvent(event)
+        _tuners.clear()
@@ -0,0 +1,274 @@
+import concurrent.futures
+import contextlib
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import threading
+import warnings
+
+import six
+
+
+_default_cache_dir = os.path.expanduser('~/.clpy/kernel_cache')
+
+
+def _get_bool_env_variable(name, default):
+    val = os.environ.get(name)
+    if val is None or len(val) == 0:
+        return default
+    try:
+        return int(val) == 1
+    except ValueError:
+        return False
+
+
+def get_cache_dir():
+    """Returns the directory of the persistent kernel cache.
+
+    The directory can be changed by ``CLPY_CACHE_DIR`` environment variable.
+    """
+    return os.environ.get('CLPY_CACHE_DIR', _default_cache_dir)
+
+
+def is_cache_enabled():
+    """Returns ``False`` if ``CLPY_DISABLE_KERNEL_CACHE=1`` is set."""
+    return not _get_bool_env_variable('CLPY_DISABLE_KERNEL_CACHE', False)
+
+
+def get_cache_key(*components):
+    """Makes a file-name-safe hash from the components of a cache key."""
+    key_src = ' '.join([repr(c) for c in components]).encode('utf-8')
+    return hashlib.md5(key_src).hexdigest()
+
+
+_file_hash_cache = {}
+
+
+def get_file_hash(path):
+    """Returns md5 hash of the file, which is memoized for each process."""
+    h = _file_hash_cache.get(path, None)
+    if h is None:
+        with open(path, 'rb') as f:
+            h = hashlib.md5(f.read()).hexdigest()
+        _file_hash_cache[path] = h
+    return h
+
+
+def get_dir_hash(path):
+    """Returns md5 hash of all files under the directory.
+
+    The result is memoized for each process.
+    """
+    h = _file_hash_cache.get(path, None)
+    if h is None:
+        md5 = hashlib.md5()
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                md5.update(os.path.relpath(file_path, path).encode('utf-8'))
+                with open(file_path, 'rb') as f:
+                    md5.update(f.read())
+        h = md5.hexdigest()
+        _file_hash_cache[path] = h
+    return h
+
+
+def load_from_cache(name, cache_dir=None):
+    """Loads data saved by :func:`save_to_cache`.
+
+    Args:
+        name (str): File name of the cache entry.
+        cache_dir (str): Cache directory. :func:`get_cache_dir` is used by
+            default.
+
+    Returns:
+        bytes: Cached data, or ``None`` if the entry does not exist or is
+        corrupted.
+
+    """
+    if cache_dir is None:
+        cache_dir = get_cache_dir()
+    path = os.path.join(cache_dir, name)
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except (IOError, OSError):
+        return None
+    if len(data) < 32:
+        return None
+    data_hash = data[:32]
+    body = data[32:]
+    if data_hash != six.b(hashlib.md5(body).hexdigest()):
+        return None
+    return body
+
+
+def save_to_cache(name, data, cache_dir=None):
+    """Saves data to the persistent cache atomically.
+
+    The data is written to a temporary file in the cache directory and then
+    renamed, so concurrent processes never see a half-written entry. The md5
+    hash of the data is prepended to detect any other corruption.
+
+    Args:
+        name (str): File name of the cache entry.
+        data (bytes): Data to be saved.
+        cache_dir (str): Cache directory. :func:`get_cache_dir` is used by
+            default.
+
+    """
+    if cache_dir is None:
+        cache_dir = get_cache_dir()
+    temp_path = None
+    try:
+        if not os.path.isdir(cache_dir):
+            try:
+                os.makedirs(cache_dir)
+            except OSError:
+                if not os.path.isdir(cache_dir):
+                    raise
+
+        with tempfile.NamedTemporaryFile(dir=cache_dir, delete=False) as tf:
+            temp_path = tf.name
+            tf.write(six.b(hashlib.md5(data).hexdigest()))
+            tf.write(data)
+        os.replace(temp_path, os.path.join(cache_dir, name))
+        temp_path = None
+    except (IOError, OSError) as e:
+        warnings.warn('Failed to save kernel cache to {}: {}'.format(
+            cache_dir, e))
+    finally:
+        # removes the temporary file left by a failed write or rename
+        if temp_path is not None:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+
+
+class _CompileBatch(object):
+
+    """Kernel programs whose compilation is deferred and done at once.
+
+    The modules of a batch are shared with the memoized kernels, so other
+    threads may launch them and flush the batch concurrently.
+    """
+
+    def __init__(self):
+        self._entries = []
+        self._lock = threading.RLock()
+
+    def add(self, entry):
+        with self._lock:
+            self._entries.append(entry)
+
+    def flush(self):
+        # The lock is held while building, so that a thread launching a
+        # module being built by another thread waits for its program.
+        with self._lock:
+            entries = self._entries
+            self._entries = []
+            if not entries:
+                return
+            from clpy.core import core
+            try:
+                core._build_programs(entries)
+            except Exception:
+                # The modules not built yet are built on their next launch,
+                # each alone, so that a broken source does not make the
+                # other kernels fail forever.
+                for entry in entries:
+                    if entry[0].batch is self:
+                        batch = _CompileBatch()
+                        batch.add(entry)
+                        entry[0].batch = batch
+                raise
+
+
+_batch_state = threading.local()
+
+
+def get_current_batch():
+    """Returns the compile batch of the current thread, or ``None``."""
+    return getattr(_batch_state, 'batch', None)
+
+
+@contextlib.contextmanager
+def compile_batch():
+    """Defers kernel compilation until the end of the with statement.
+
+    Kernels requested in the with statement are returned as functions whose
+    programs are not built yet. On leaving the statement, all pending
+    sources are translated by concurrent ultima processes and built at once.
+    A pending function is built immediately if it is launched in the
+    statement, together with all other pending kernels. Nested statements
+    are merged into the outermost one.
+
+    """
+    if get_current_batch() is not None:
+        yield
+        return
+    batch = _CompileBatch()
+    _batch_state.batch = batch
+    try:
+        yield
+    finally:
+        _batch_state.batch = None
+    batch.flush()
+
+
+_compile_executor = None
+_compile_executor_lock = threading.Lock()
+
+
+def get_compile_executor():
+    """Returns the thread pool which compiles kernels in background.
+
+    The number of threads is the number of CPUs by default, and can be
+    changed by ``CLPY_COMPILE_THREADS`` environment variable.
+    """
+    global _compile_executor
+    with _compile_executor_lock:
+        if _compile_executor is None:
+            n_threads = int(os.environ.get(
+                'CLPY_COMPILE_THREADS', multiprocessing.cpu_count()))
+            _compile_executor = concurrent.futures.ThreadPoolExecutor(
+                max(1, n_threads))
+    return _compile_executor
+
+
+def _precompile_on_device(kernel, spec, device_id):
+    from clpy.backend import device
+    with device.Device(device_id):
+        return kernel._precompile(spec)
+
+
+def compile_async(kernel, dtypes=None, ndims=(1,)):
+    """Starts compiling specializations of a kernel in background.
+
+    Each specialization is translated by an ultima process and built by
+    ``clBuildProgram`` without holding GIL on a thread of
+    :func:`get_compile_executor`, so the caller can go on with other work. A
+    launch of the kernel needing a specialization being compiled waits for it
+    instead of compiling it again. The kernels are built for the current
+    device.
+
+    Args:
+        kernel: :class:`clpy.ufunc`, a reduction function,
+            :class:`clpy.ElementwiseKernel` or :class:`clpy.ReductionKernel`.
+        dtypes: Sequence of dtypes. See :func:`clpy.backend.warmup`.
+        ndims: Sequence of the numbers of dimensions. See
+            :func:`clpy.backend.warmup`.
+
+    Returns:
+        list of concurrent.futures.Future: Futures of the compiled
+        :class:`clpy.backend.Function` for each specialization.
+
+    """
+    from clpy.backend import device
+    device_id = device.get_device_id()
+    executor = get_compile_executor()
+    return [executor.submit(_precompile_on_device, kernel, spec, device_id)
+            for spec in kernel._get_precompile_specs(dtypes, ndims)]
@@ -1,5 +1,7 @@
 cpdef int get_device_id() except *
+cpdef int get_device_count() except *
 cpdef get_cublas_handle()
+cpdef list partition_device(int equally=*, counts=*, device=*)
 
 cdef class Device:
     cdef:
@@ -8,3 +10,27 @@ cdef class Device:
 
     cpdef use(self)
     cpdef synchronize(self)
+
+
+cdef class DeviceInfo:
+    cdef:
+        readonly int device_id
+        readonly str name
+        readonly tuple identity
+        readonly Py_ssize_t max_work_group_size
+        readonly tuple max_work_item_sizes
+        readonly Py_ssize_t preferred_work_group_size_multiple
+        readonly Py_ssize_t local_mem_size
+        readonly int max_compute_units
+        readonly dict native_vector_widths
+        readonly bint fp64
+        readonly bint fp16
+        readonly bint host_unified_memory
+        readonly Py_ssize_t mem_base_addr_align
+        readonly unsigned long long global_mem_size
+
+    cpdef Py_ssize_t get_work_group_size(
+        self, Py_ssize_t limit, Py_ssize_t local_mem_per_item=*) except -1
+
+
+cpdef DeviceInfo get_device_info(device=*)
@@ -4,13 +4,175 @@ import atexit
 
 import six
 
+import clpy.backend.opencl.env
+cimport clpy.backend.opencl.env
+cimport clpy.backend.opencl.utility
+from clpy.backend.opencl.types cimport cl_device_id
+
 # from clpy.backend cimport cublas
 # from clpy.backend cimport cusparse
 # from clpy.backend cimport runtime
 
 cpdef int get_device_id() except *:
-    return 0  # TODO(LWisteria): Always zero until implement multi device
-#    return runtime.getDevice()
+    return clpy.backend.opencl.env.get_current_device_id()
+
+
+cpdef int get_device_count() except *:
+    """Returns the number of the devices of all OpenCL platforms."""
+    return clpy.backend.opencl.env.get_device_count()
+
+
+cpdef list partition_device(int equally=0, counts=None, device=None):
+    """Partitions a device into sub-devices.
+
+    The device is partitioned by ``clCreateSubDevices``, e.g. to run
+    independent workloads on groups of cores of a CPU device concurrently.
+    Each sub-device has its own context, command queue, memory pool and
+    compiled kernels, and is used like the other devices::
+
+       for dev in clpy.backend.partition_device(equally=4):
+           with dev:
+               do_something_on_sub_device()
+
+    Args:
+        equally (int): Number of compute units of each sub-device. The
+            device is partitioned into as many sub-devices as possible.
+        counts (sequence of ints): Numbers of compute units of the
+            sub-devices. Either ``equally`` or ``counts`` must be given.
+        device (int or clpy.backend.Device): Device to be partitioned. The
+            current device is used by default.
+
+    Returns:
+        list of Device: The sub-devices, whose IDs follow the IDs of the
+        existing devices.
+
+    """
+    if device is None:
+        device_id = get_device_id()
+    else:
+        device_id = int(device)
+    return [Device(i) for i in clpy.backend.opencl.env.create_sub_devices(
+        device_id, equally, counts)]
+
+
+cdef dict _device_infos = {}
+
+
+cpdef DeviceInfo get_device_info(device=None):
+    """Returns the capabilities of a device.
+
+    The capabilities are queried on the first call for each device and
+    cached.
+
+    Args:
+        device (int or clpy.backend.Device): Device to be queried. The
+            current device is used by default.
+
+    Returns:
+        DeviceInfo: The capabilities of the device.
+
+    """
+    cdef int device_id
+    if device is None:
+        device_id = get_device_id()
+    else:
+        device_id = int(device)
+    info = _device_infos.get(device_id)
+    if info is None:
+        info = DeviceInfo(device_id)
+        _device_infos[device_id] = info
+    return info
+
+
+cdef class DeviceInfo:
+
+    """Capabilities of an OpenCL device.
+
+    It is obtained by :func:`get_device_info` or :attr:`Device.info`, and
+    used to decide the sizes of work-groups of kernels instead of fixed
+    values.
+
+    Args:
+        device_id (int): ID of the device.
+
+    Attributes:
+        device_id (int): ID of the device.
+        name (str): Name of the device.
+        identity (tuple of str): Names and versions of the platform, the
+            device and the driver, which identify the device across
+            processes.
+        max_work_group_size (int): Maximum number of work-items in a
+            work-group.
+        max_work_item_sizes (tuple of ints): Maximum numbers of work-items in
+            each dimension of a work-group.
+        preferred_work_group_size_multiple (int): Preferred multiple of
+            work-group sizes, e.g. the warp size of NVIDIA GPUs.
+        local_mem_size (int): Size of the local memory in bytes.
+        max_compute_units (int): Number of compute units.
+        native_vector_widths (dict): Native vector widths keyed by the scalar
+            types ``'char'``, ``'short'``, ``'int'``, ``'long'``,
+            ``'float'``, ``'double'`` and ``'half'``.
+        fp64 (bool): ``True`` if the device supports double precision.
+        fp16 (bool): ``True`` if the device supports ``cl_khr_fp16``.
+        host_unified_memory (bool): ``True`` if the device shares its
+            physical memory with the host.
+        mem_base_addr_align (int): Alignment of sub-buffers in bytes.
+        global_mem_size (int): Size of the global memory in bytes.
+
+    """
+
+    def __init__(self, int device_id):
+        cdef cl_device_id device
+        self.device_id = device_id
+        with Device(device_id):
+            device = clpy.backend.opencl.env.get_primary_device()
+            caps = clpy.backend.opencl.utility.GetDeviceCapabilities(device)
+            self.identity = clpy.backend.opencl.utility.GetDeviceIdentity(
+                device)
+            self.preferred_work_group_size_multiple = \
+                clpy.backend.opencl.utility.GetPreferredWorkGroupSizeMultiple(
+                    clpy.backend.opencl.env.get_context(), device)
+        self.name = caps['name']
+        self.max_work_group_size = caps['max_work_group_size']
+        self.max_work_item_sizes = caps['max_work_item_sizes']
+        self.local_mem_size = caps['local_mem_size']
+        self.max_compute_units = caps['max_compute_units']
+        self.native_vector_widths = caps['native_vector_widths']
+        self.fp64 = caps['fp64']
+        self.fp16 = caps['fp16']
+        self.host_unified_memory = caps['host_unified_memory']
+        self.mem_base_addr_align = caps['mem_base_addr_align']
+        self.global_mem_size = caps['global_mem_size']
+
+    def __repr__(self):
+        return '<DeviceInfo of device %d: %s>' % (self.device_id, self.name)
+
+    cpdef Py_ssize_t get_work_group_size(
+            self, Py_ssize_t limit, Py_ssize_t local_mem_per_item=0) except -1:
+        """Returns a power-of-2 size of one-dimensional work-groups.
+
+        Args:
+            limit (int): Upper bound of the size.
+            local_mem_per_item (int): Bytes of the local memory used by each
+                work-item.
+
+        Returns:
+            int: The largest power of 2 which does not exceed ``limit``, the
+            maximum work-group size of the device, and the size whose local
+            memory fits the device.
+
+        """
+        cdef Py_ssize_t size = min(
+            limit, self.max_work_group_size, self.max_work_item_sizes[0])
+        if local_mem_per_item > 0:
+            size = min(size, self.local_mem_size // local_mem_per_item)
+        if size < 1:
+            raise ValueError(
+                'No work-group size fits device %d' % self.device_id)
+        cdef Py_ssize_t ret = 1
+        while ret * 2 <= size:
+            ret *= 2
+        return ret
 
 
 cdef dict _cublas_handles = {}
@@ -45,6 +207,10 @@ cdef class Device:
 
     This class provides some basic manipulations on CUDA devices.
 
+    Devices of all OpenCL platforms are numbered in order of the platforms,
+    and each device has its own context, default command queue, memory pool
+    and compiled kernels.
+
     It supports the context protocol. For example, the following code is an
     example of temporarily switching the current device::
 
@@ -77,34 +243,43 @@ cdef class Device:
         return self.id
 
     def __enter__(self):
-        # TODO(LWisteria): Nothing to do until implement multi device
-        # cdef int id = get_device_id()
-        # self._device_stack.append(id)
-        # if self.id != id:
-        #     self.use()
+        cdef int id = get_device_id()
+        self._device_stack.append(id)
+        if self.id != id:
+            self.use()
         return self
 
     def __exit__(self, *args):
-        pass  # TODO(LWisteria): Nothing to do until implement multi device
-        # runtime.setDevice(self._device_stack.pop())
+        clpy.backend.opencl.env.set_current_device_id(
+            self._device_stack.pop())
 
     def __repr__(self):
         return '<CUDA Device %d>' % self.id
 
+    @property
+    def info(self):
+        """Capabilities of this device as :class:`DeviceInfo`."""
+        return get_device_info(self.id)
+
+    @property
+    def parent(self):
+        """The device partitioned into this sub-device, or ``None``."""
+        parent_id = clpy.backend.opencl.env.get_parent_device_id(self.id)
+        if parent_id < 0:
+            return None
+        return Device(parent_id)
+
     cpdef use(self):
         """Makes this device current.
 
         If you want to switch a device temporarily, use the *with* statement.
 
         """
-        pass  # TODO(LWisteria): Nothing to do until implement multi device
-        # runtime.setDevice(self.id)
+        clpy.backend.opencl.env.set_current_device_id(self.id)
 
     cpdef synchronize(self):
         """Synchronizes the current thread to the device."""
-        with self:
-            raise NotImplementedError("clpy does not support this")
-            # runtime.deviceSynchronize()
+        clpy.backend.opencl.env.finish_all(self.id)
 
     @property
     def compute_capability(self):
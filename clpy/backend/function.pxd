@@ -1,5 +1,6 @@
 cimport clpy.backend.opencl.api
 cimport clpy.backend.opencl.types
+cimport clpy.backend.opencl.utility
 
 cdef class CPointer:
     cdef void* ptr
@@ -9,8 +10,10 @@ cdef class Function:
 
     cdef:
         Module module
-        clpy.backend.opencl.types.cl_kernel kernel
+        bytes funcname
+        public bint tunable
 
+    cdef clpy.backend.opencl.utility.CachedKernel _get_kernel(self)
     cpdef linear_launch(self, size_t size, args, size_t local_mem=*,
                         size_t local_size=*)
 
@@ -19,12 +22,15 @@ cdef class Module:
 
     cdef:
         clpy.backend.opencl.types.cl_program program
+        public object batch
+        public object key
 
     cpdef load_file(self, str filename)
     cpdef load(self, bytes cubin)
     cpdef get_global_var(self, str name)
     cpdef get_function(self, str name)
     cdef set(self, clpy.backend.opencl.types.cl_program program)
+    cdef clpy.backend.opencl.types.cl_program get_program(self) except *
 
 
 cdef class LinkState:
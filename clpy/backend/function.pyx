@@ -8,14 +8,29 @@ from libcpp cimport vector
 import cython
 
 # from clpy.cuda cimport driver
+from clpy.backend import autotune
+from clpy.backend cimport profiler
 from clpy.core cimport core
 import clpy.backend.opencl
 cimport clpy.backend.opencl.api
 cimport clpy.backend.opencl.utility
 import clpy.backend.opencl.env
 cimport clpy.backend.opencl.env
+import clpy.backend.opencl.exceptions
 import clpy.backend.opencl.types
 from clpy.backend.opencl.types cimport cl_event
+from clpy.backend.opencl.types cimport cl_kernel
+from clpy.backend.opencl.types cimport cl_mem
+from libc.stdint cimport int8_t
+from libc.stdint cimport int16_t
+from libc.stdint cimport int32_t
+from libc.stdint cimport int64_t
+from libc.stdint cimport uint8_t
+from libc.stdint cimport uint16_t
+from libc.stdint cimport uint32_t
+from libc.stdint cimport uint64_t
+from libc.string cimport memcmp
+from libc.string cimport memcpy
 import clpy.core
 
 cdef inline size_t _get_stream(strm) except *:
@@ -36,8 +51,234 @@ cdef struct _CArray:
 cdef struct _CArray0:
     char unused
 
-cdef void _launch(clpy.backend.opencl.types.cl_kernel kernel, global_work_size,
-                  local_work_size, args, Py_ssize_t local_mem) except *:
+cdef enum:
+    _ARG_NDARRAY = 0
+    _ARG_LOCAL_MEM = 1
+    _ARG_INDEXER = 2
+    _ARG_SIZE_T = 3
+    _ARG_INT = 4  # Python int and bool passed as long
+    _ARG_FLOAT = 5  # Python float passed as double
+    _ARG_SCALAR = 6  # NumPy scalar
+
+
+cdef inline size_t _align_arg(size_t offset):
+    return (offset + sizeof(Py_ssize_t) - 1) & ~(sizeof(Py_ssize_t) - 1)
+
+
+cdef void _write_scalar(char* ptr, char kind, size_t size, x) except *:
+    if kind == b'b':
+        (<uint8_t*>ptr)[0] = bool(x)
+    elif kind == b'i' and size == 1:
+        (<int8_t*>ptr)[0] = <int8_t>x
+    elif kind == b'i' and size == 2:
+        (<int16_t*>ptr)[0] = <int16_t>x
+    elif kind == b'i' and size == 4:
+        (<int32_t*>ptr)[0] = <int32_t>x
+    elif kind == b'i' and size == 8:
+        (<int64_t*>ptr)[0] = <int64_t>x
+    elif kind == b'u' and size == 1:
+        (<uint8_t*>ptr)[0] = <uint8_t>x
+    elif kind == b'u' and size == 2:
+        (<uint16_t*>ptr)[0] = <uint16_t>x
+    elif kind == b'u' and size == 4:
+        (<uint32_t*>ptr)[0] = <uint32_t>x
+    elif kind == b'u' and size == 8:
+        (<uint64_t*>ptr)[0] = <uint64_t>x
+    elif kind == b'f' and size == 4:
+        (<float*>ptr)[0] = <float>x
+    elif kind == b'f' and size == 8:
+        (<double*>ptr)[0] = <double>x
+    else:
+        data = x.tobytes()
+        memcpy(ptr, <char*>data, size)
+
+
+cdef class _ArgumentPlan:
+
+    """Marshalling plan of the arguments of a kernel.
+
+    A plan is built on the first launch of a kernel from the types of the
+    arguments, and is kept in the kernel cache entry of the thread. It knows
+    the kernel arguments each argument is expanded to and their places in a
+    reusable buffer, so that following launches write the values into the
+    buffer directly from the fields of the arrays and the scalars. The values
+    last set to the kernel are kept as well, and clSetKernelArg is called
+    only for the arguments which are changed.
+    """
+
+    cdef:
+        list arg_types
+        vector.vector[int] kinds
+        vector.vector[Py_ssize_t] ndims
+        vector.vector[char] scalar_kinds
+        # offsets and sizes of the values of each kernel argument
+        vector.vector[size_t] offsets
+        vector.vector[size_t] sizes
+        vector.vector[char] is_local_mem
+        vector.vector[char] values
+        vector.vector[char] last_values
+        bint last_values_valid
+
+    def __init__(self, args):
+        cdef Py_ssize_t ndim
+        cdef char scalar_kind
+        self.arg_types = []
+        for a in args:
+            ndim = 0
+            scalar_kind = 0
+            if isinstance(a, core.ndarray):
+                kind = _ARG_NDARRAY
+                ndim = (<core.ndarray>a)._shape.size()
+                if ndim > MAX_NDIM:
+                    raise ValueError(
+                        "Array dimension should be at most {0}"
+                        " but {1} was given".format(MAX_NDIM, ndim))
+                self._add_value(sizeof(cl_mem))
+                self._add_value(sizeof(Py_ssize_t) * (1 + 1 + 2 * ndim))
+            elif isinstance(a, clpy.core.core.LocalMem):
+                kind = _ARG_LOCAL_MEM
+                self._add_value(sizeof(size_t), True)
+            elif isinstance(a, core.Indexer):
+                kind = _ARG_INDEXER
+                ndim = len((<core.Indexer>a).shape)
+                if ndim > MAX_NDIM:
+                    raise ValueError(
+                        "Indexer dimension should be at most {0}"
+                        " but {1} was given".format(MAX_NDIM, ndim))
+                self._add_value(a.get_size())
+            elif isinstance(a, core.Size_t):
+                kind = _ARG_SIZE_T
+                if clpy.backend.opencl.types.device_typeof_size == 'uint':
+                    self._add_value(sizeof(uint32_t))
+                else:
+                    self._add_value(sizeof(uint64_t))
+            elif isinstance(a, int):
+                kind = _ARG_INT
+                self._add_value(sizeof(long))
+            elif isinstance(a, float):
+                kind = _ARG_FLOAT
+                self._add_value(sizeof(double))
+            elif numpy.issctype(type(a)):
+                kind = _ARG_SCALAR
+                dtype = numpy.dtype(type(a))
+                scalar_kind = ord(dtype.kind)
+                self._add_value(dtype.itemsize)
+            else:
+                raise TypeError('Unsupported type %s' % type(a))
+            self.arg_types.append(type(a))
+            self.kinds.push_back(kind)
+            self.ndims.push_back(ndim)
+            self.scalar_kinds.push_back(scalar_kind)
+        # the unused elements of the structs are kept zero for comparison
+        self.values.resize(self._end(), 0)
+        self.last_values.resize(self._end(), 0)
+        self.last_values_valid = False
+
+    cdef size_t _end(self):
+        if self.offsets.empty():
+            return 0
+        return self.offsets.back() + self.sizes.back()
+
+    cdef _add_value(self, size_t size, bint is_local_mem=False):
+        self.offsets.push_back(_align_arg(self._end()))
+        self.sizes.push_back(size)
+        self.is_local_mem.push_back(is_local_mem)
+
+    cdef bint marshal(self, args, size_t local_mem) except *:
+        """Writes the values of the arguments into the buffer.
+
+        Returns ``False`` if the arguments do not match the plan.
+        """
+        cdef Py_ssize_t k, d, ndim, stride, itemsize
+        cdef size_t j = 0
+        cdef int kind
+        cdef char* ptr
+        cdef core.ndarray arr
+        cdef core.Indexer indexer
+        cdef _CArray* array_info
+        cdef _CIndexer* indexer_info
+
+        if len(args) != <Py_ssize_t>self.kinds.size():
+            return False
+        k = 0
+        for a in args:
+            if type(a) is not self.arg_types[k]:
+                return False
+            kind = self.kinds[k]
+            ptr = self.values.data() + self.offsets[j]
+            if kind == _ARG_NDARRAY:
+                arr = a
+                ndim = arr._shape.size()
+                if ndim != self.ndims[k]:
+                    return False
+                (<size_t*>ptr)[0] = arr.data.buf.get()
+                j += 1
+                array_info = <_CArray*>(self.values.data() + self.offsets[j])
+                itemsize = arr.dtype.itemsize
+                for d in range(ndim):
+                    stride = arr._strides[d]
+                    if stride % itemsize != 0:
+                        raise ValueError("Stride of dim {0} = {1},"
+                                         " but item size is {2}"
+                                         .format(d, stride, itemsize))
+                    array_info.shape_and_index[d] = arr._shape[d]
+                    array_info.shape_and_index[d + ndim] = stride
+                array_info.offset = arr.data.cl_mem_offset()
+                array_info.size = arr.size
+            elif kind == _ARG_LOCAL_MEM:
+                (<size_t*>ptr)[0] = local_mem
+            elif kind == _ARG_INDEXER:
+                indexer = a
+                ndim = len(indexer.shape)
+                if ndim != self.ndims[k]:
+                    return False
+                indexer_info = <_CIndexer*>ptr
+                indexer_info.size = indexer.size
+                for d in range(ndim):
+                    indexer_info.shape_and_index[d] = indexer.shape[d]
+            elif kind == _ARG_SIZE_T:
+                if self.sizes[j] == sizeof(uint32_t):
+                    (<uint32_t*>ptr)[0] = (<core.Size_t>a).val
+                else:
+                    (<uint64_t*>ptr)[0] = (<core.Size_t>a).val
+            elif kind == _ARG_INT:
+                (<long*>ptr)[0] = a
+            elif kind == _ARG_FLOAT:
+                (<double*>ptr)[0] = a
+            else:
+                _write_scalar(ptr, self.scalar_kinds[k], self.sizes[j], a)
+            j += 1
+            k += 1
+        return True
+
+    cdef void set_args(self, cl_kernel kernel) except *:
+        """Sets the kernel arguments changed since the last launch."""
+        cdef size_t j, offset, size
+        cdef char* ptr
+        cdef char* last
+        cdef bint valid = self.last_values_valid
+        # the values are invalid until all arguments are set
+        self.last_values_valid = False
+        for j in range(self.offsets.size()):
+            offset = self.offsets[j]
+            size = self.sizes[j]
+            ptr = self.values.data() + offset
+            last = self.last_values.data() + offset
+            if valid and memcmp(ptr, last, size) == 0:
+                continue
+            if self.is_local_mem[j]:
+                clpy.backend.opencl.utility.SetKernelArgLocalMemory(
+                    kernel, j, (<size_t*>ptr)[0])
+            else:
+                clpy.backend.opencl.api.SetKernelArg(kernel, j, size, ptr)
+            memcpy(last, ptr, size)
+        self.last_values_valid = True
+
+
+cdef void _launch(clpy.backend.opencl.utility.CachedKernel entry,
+                  global_work_size, local_work_size, args,
+                  Py_ssize_t local_mem, bytes name,
+                  cl_event* tuning_event=NULL) except *:
     global_dim = len(global_work_size)
     local_dim = len(local_work_size)
     if global_dim < 1 or 3 < global_dim:
@@ -50,67 +291,14 @@ cdef void _launch(clpy.backend.opencl.types.cl_kernel kernel, global_work_size,
         raise ValueError("global_work_size dim is {0} but local is {1}"
                          .format(global_dim, local_dim))
 
-    cdef size_t i = 0
-    cdef _CIndexer indexer  # to keep lifetime until SetKernelArg
-    cdef _CArray arrayInfo  # to keep lifetime until SetKernelArg
-    cdef size_t ptr = 0
-    cdef size_t buffer_object = 0
-    for a in args:
-        if isinstance(a, core.ndarray):
-            buffer_object = a.data.buf.get()
-            clpy.backend.opencl.api.SetKernelArg(kernel, i, sizeof(void*),
-                                                 <void*>&buffer_object)
-            i+=1
-
-            ndim = len(a.strides)
-            for d in range(ndim):
-                if a.strides[d] % a.itemsize != 0:
-                    raise ValueError("Stride of dim {0} = {1},"
-                                     " but item size is {2}"
-                                     .format(d, a.strides[d], a.itemsize))
-                arrayInfo.shape_and_index[d] = a.shape[d]
-                arrayInfo.shape_and_index[d + ndim] = a.strides[d]
-            arrayInfo.offset = a.data.cl_mem_offset()
-            arrayInfo.size = a.size
-            clpy.backend.opencl.api.SetKernelArg(
-                kernel, i, cython.sizeof(Py_ssize_t)*(1+1+2*ndim),
-                <void*>&arrayInfo)
-        elif isinstance(a, clpy.core.core.LocalMem):
-            clpy.backend.opencl.utility.SetKernelArgLocalMemory(kernel, i,
-                                                                local_mem)
-        else:
-            if isinstance(a, core.Indexer):
-                for d in range(a.ndim):
-                    indexer.shape_and_index[d] = a.shape[d]
-                ptr = <size_t>&indexer
-                indexer.size = a.size
-                size = a.get_size()
-            else:
-                if isinstance(a, clpy.core.core.Size_t):
-                    if clpy.backend.opencl.types.device_typeof_size \
-                            == 'uint':
-                        a = numpy.uint32(a.val)
-                    elif clpy.backend.opencl.types.device_typeof_size \
-                            == 'ulong':
-                        a = numpy.uint64(a.val)
-                    else:
-                        raise "api_sizeof_size is illegal"
-                elif isinstance(a, int):
-                    a = numpy.int_(a)
-                elif isinstance(a, float):
-                    a = numpy.float_(a)
-                elif isinstance(a, bool):
-                    a = numpy.bool_(a)
-
-                if numpy.issctype(type(a)):
-                    ptr = <size_t>numpy.array(a).ctypes.get_as_parameter() \
-                                                       .value
-                    size = a.nbytes
-                else:
-                    raise TypeError('Unsupported type %s' % type(a))
-            clpy.backend.opencl.api.SetKernelArg(kernel, i, size, <void*>ptr)
-        i+=1
+    cdef _ArgumentPlan plan = entry.arg_plan
+    if plan is None or not plan.marshal(args, local_mem):
+        plan = _ArgumentPlan(args)
+        plan.marshal(args, local_mem)
+        entry.arg_plan = plan
+    plan.set_args(entry.kernel)
 
+    cdef size_t i
     cdef size_t gws[3]
     for i in range(global_dim):
         gws[i] = global_work_size[i]
@@ -124,25 +312,52 @@ cdef void _launch(clpy.backend.opencl.types.cl_kernel kernel, global_work_size,
     else:
         lws_ptr = <size_t*>NULL
 
+    cdef cl_event event = NULL
+    cdef cl_event* event_ptr = profiler.event_ptr(&event)
+    if tuning_event != NULL:
+        event_ptr = &event
     clpy.backend.opencl.utility.RunNDRangeKernel(
         command_queue=clpy.backend.opencl.env.get_command_queue(),
-        kernel=kernel,
+        kernel=entry.kernel,
         work_dim=global_dim,
         global_work_offset=<size_t*>NULL,
         global_work_size=&gws[0],
         local_work_size=lws_ptr,
         num_events_in_wait_list=0,
-        event_wait_list=<cl_event*>NULL)
+        event_wait_list=<cl_event*>NULL,
+        event=event_ptr)
+    if tuning_event != NULL:
+        tuning_event[0] = event
+        if not profiler.is_enabled():
+            return
+        # both the tuner and the profiler release the event
+        clpy.backend.opencl.api.RetainEvent(event)
+    profiler.record(event, name, 'kernel')
 
 
 cdef class Function:
 
-    """CUDA kernel function."""
+    """CUDA kernel function.
+
+    Attributes:
+        tunable (bool): If ``True``, the kernel covers any number of
+            work-items by a grid-stride loop over ``linear_launch`` size, so
+            that its launch configuration is tuned by
+            :mod:`clpy.backend.autotune`.
+
+    """
 
     def __init__(self, Module module, str funcname):
         self.module = module  # to keep module loaded
-        self.kernel = clpy.backend.opencl.api.CreateKernel(
-            module.program, funcname.encode('utf-8'))
+        self.funcname = funcname.encode('utf-8')
+        self.tunable = False
+        # the kernel of a module in a compile batch is created on launch
+        if module.batch is None:
+            self._get_kernel()
+
+    cdef clpy.backend.opencl.utility.CachedKernel _get_kernel(self):
+        return clpy.backend.opencl.utility.GetCachedKernelEntry(
+            self.module.get_program(), self.funcname)
 
     def __call__(self, tuple grid, tuple block, args, size_t shared_mem=0,
                  stream=None):
@@ -158,12 +373,44 @@ cdef class Function:
 
     cpdef linear_launch(self, size_t size, args, size_t local_mem=0,
                         size_t local_size=0):
-        # TODO(beam2d): Tune it
+        cdef clpy.backend.opencl.utility.CachedKernel entry = \
+            self._get_kernel()
+        cdef size_t global_size = size
+        cdef size_t items = 1
+        cdef cl_event event = NULL
+        cdef cl_event* tuning_event = NULL
+        tuning = None
+        if local_size == 0 and self.tunable and autotune.is_enabled():
+            if entry.work_group_size == 0:
+                entry.work_group_size = \
+                    clpy.backend.opencl.utility.GetKernelWorkGroupSize(
+                        entry.kernel,
+                        clpy.backend.opencl.env.get_primary_device())
+            local_size, items, tuning = autotune.get_launch(
+                self.module.key, size, entry.work_group_size)
+            global_size = (size + items - 1) // items
+            if local_size != 0:
+                global_size = ((global_size + local_size - 1) //
+                               local_size * local_size)
+            if tuning is not None:
+                tuning_event = &event
+
         if local_size == 0:
             local_work_size = []
         else:
             local_work_size = [local_size, ]
-        _launch(self.kernel, [size, ], local_work_size, args, local_mem)
+        try:
+            _launch(entry, [global_size, ], local_work_size, args,
+                    local_mem, self.funcname, tuning_event)
+        except clpy.backend.opencl.exceptions.OpenCLRuntimeError:
+            if tuning is None:
+                raise
+            # the candidate does not fit the kernel, e.g. its resources
+            autotune.add_failure(tuning)
+            _launch(entry, [size, ], [], args, local_mem, self.funcname)
+            return
+        if tuning is not None:
+            autotune.add_event(tuning, <size_t>event, size)
 
 
 cdef class Module:
@@ -173,8 +420,11 @@ cdef class Module:
     def __init__(self):
         pass
 
-    def __del__(self):
-        pass
+    def __dealloc__(self):
+        # the cached kernels would keep the program alive
+        if self.program != NULL:
+            clpy.backend.opencl.utility.ReleaseCachedKernelsOfProgram(
+                self.program)
 
     cpdef load_file(self, str filename):
         raise NotImplementedError("clpy does not support this")
@@ -190,6 +440,13 @@ cdef class Module:
 
     cdef set(self, clpy.backend.opencl.types.cl_program program):
         self.program = program
+        self.batch = None
+
+    cdef clpy.backend.opencl.types.cl_program get_program(self) except *:
+        if self.batch is not None:
+            # builds all pending programs including this one
+            self.batch.flush()
+        return self.program
 
     cpdef get_function(self, str name):
         return Function(self, name)
@@ -17,6 +17,7 @@ cdef class Chunk:
         public Chunk prev
         public Chunk next
         public bint in_use
+        public size_t queue
 
 cdef class MemoryPointer:
 
@@ -36,12 +37,20 @@ cdef class MemoryPointer:
     cpdef copy_to_host_async(self, mem, size_t size, stream)
     cpdef memset(self, int value, size_t size)
     cpdef memset_async(self, int value, size_t size, stream)
+    cpdef fill(self, bytes pattern, size_t size)
+    cpdef fill_async(self, bytes pattern, size_t size, stream)
     cpdef Py_ssize_t cl_mem_offset(self)
 
 
 cpdef MemoryPointer alloc(Py_ssize_t size)
 
 
+cpdef bint is_zero_copy_enabled()
+
+
+cpdef Py_ssize_t get_subbuffer_alignment() except -1
+
+
 cpdef set_allocator(allocator=*)
 
 
@@ -50,7 +59,7 @@ cdef class SingleDeviceMemoryPool:
     cdef:
         object _allocator
         dict _in_use
-        list _free
+        dict _free
         object __weakref__
         object _weakref
         object _free_lock
@@ -58,10 +67,17 @@ cdef class SingleDeviceMemoryPool:
         readonly Py_ssize_t _allocation_unit_size
         readonly Py_ssize_t _initial_bins_size
         readonly int _device_id
+        Py_ssize_t _limit
+        Py_ssize_t _total_bytes
+        Py_ssize_t _used_bytes
+        Py_ssize_t _peak_bytes
+        dict _stats
 
     cpdef MemoryPointer _alloc(self, Py_ssize_t size)
     cpdef MemoryPointer malloc(self, Py_ssize_t size)
     cpdef MemoryPointer _malloc(self, Py_ssize_t size)
+    cdef object _try_alloc(self, Py_ssize_t size)
+    cdef list _get_bin_stat(self, Py_ssize_t index)
     cpdef free(self, Buf buf, Py_ssize_t size, Py_ssize_t offset)
     cpdef free_all_blocks(self)
     cpdef free_all_free(self)
@@ -69,9 +85,15 @@ cdef class SingleDeviceMemoryPool:
     cpdef used_bytes(self)
     cpdef free_bytes(self)
     cpdef total_bytes(self)
+    cpdef set_limit(self, size=*, fraction=*)
+    cpdef get_limit(self)
+    cpdef get_statistics(self)
     cpdef Py_ssize_t _round_size(self, Py_ssize_t size)
     cpdef Py_ssize_t _bin_index_from_size(self, Py_ssize_t size)
-    cpdef void _grow_free_if_necessary(self, Py_ssize_t size)
+    cdef list _get_arena(self, size_t queue)
+    cdef Chunk _pop_free_chunk(self, list arena, Py_ssize_t index)
+    cpdef _reclaim_arena(self, size_t queue)
+    cpdef void _grow_free_if_necessary(self, list arena, Py_ssize_t size)
     cpdef tuple _split(self, Chunk chunk, Py_ssize_t size)
     cpdef Chunk _merge(self, Chunk head, Chunk remaining)
 
@@ -87,3 +109,6 @@ cdef class MemoryPool:
     cpdef used_bytes(self)
     cpdef free_bytes(self)
     cpdef total_bytes(self)
+    cpdef set_limit(self, size=*, fraction=*)
+    cpdef get_limit(self)
+    cpdef get_statistics(self)
@@ -3,30 +3,65 @@
 import collections
 import ctypes
 import gc
+import os
 import threading
 import warnings
 import weakref
 
 from fastrlock cimport rlock
+from libc.stdlib cimport free
+from libc.stdlib cimport malloc
 
 # from clpy.backend import driver
 # from clpy.backend import runtime
 
 from clpy.backend cimport device
-# from clpy.backend cimport memory_hook
+from clpy.backend cimport pinned_memory
+from clpy.backend cimport profiler
+from clpy.backend import stream as stream_module
+from clpy.backend cimport memory_hook
 # from clpy.backend cimport runtime
 
 import clpy.backend.opencl
 cimport clpy.backend.opencl.utility
 import clpy.backend.opencl.env
 cimport clpy.backend.opencl.env
+import clpy.backend.opencl.exceptions
 from clpy.backend.opencl.types cimport cl_event
 from clpy.backend.opencl.types cimport cl_mem
 
 thread_local = threading.local()
 
-subbuffer_alignment = clpy.backend.opencl.utility.GetDeviceMemBaseAddrAlign(
-    clpy.backend.opencl.env.get_primary_device()) // 8
+
+cpdef Py_ssize_t get_subbuffer_alignment() except -1:
+    """Returns the alignment of sub-buffers of the current device in bytes.
+
+    Offsets of sub-buffers must be multiples of it, so it is the allocation
+    unit of the memory pool of the device.
+    """
+    return device.get_device_info().mem_base_addr_align
+
+cdef bint _zero_copy = os.environ.get('CLPY_ZERO_COPY') == '1'
+
+
+cpdef bint is_zero_copy_enabled():
+    """Returns ``True`` if arrays may share memory with the host.
+
+    The zero-copy mode is enabled by setting ``CLPY_ZERO_COPY=1``. It takes
+    effect only if the device shares its physical memory with the host (i.e.
+    ``CL_DEVICE_HOST_UNIFIED_MEMORY`` is true) like CPUs and integrated GPUs.
+    In this mode, :func:`clpy.asarray` creates an array sharing the memory
+    of a suitably aligned :class:`numpy.ndarray`, and :func:`clpy.asnumpy`
+    returns a view of the mapped device memory. The aliased memory must not
+    be accessed by the host while kernels using it are queued, and a mapped
+    view blocks kernels from the array until the view is destroyed (see
+    :class:`HostMemory` and :class:`MappedMemory`). :func:`clpy.array`
+    always copies. The result depends on the current device.
+
+    """
+    if not _zero_copy:
+        return False
+    return device.get_device_info().host_unified_memory
 
 cdef inline _ensure_context(int device_id):
 
@@ -49,9 +84,13 @@ cdef inline _ensure_context(int device_id):
 
 class OutOfMemoryError(MemoryError):
 
-    def __init__(self, size, total):
-        msg = 'out of memory to allocate %d bytes ' \
-              '(total %d bytes)' % (size, total)
+    def __init__(self, size, total, limit=0):
+        if limit == 0:
+            msg = 'out of memory to allocate %d bytes ' \
+                  '(total %d bytes)' % (size, total)
+        else:
+            msg = 'out of memory to allocate %d bytes ' \
+                  '(total %d bytes, limit %d bytes)' % (size, total, limit)
         super(OutOfMemoryError, self).__init__(msg)
 
 
@@ -94,6 +133,107 @@ class Memory(object):
         # return self.ptr
 
 
+class HostMemory(Memory):
+
+    """Memory allocation sharing a host memory with the device.
+
+    The buffer is created with ``CL_MEM_USE_HOST_PTR`` so that a device
+    which shares its memory with the host accesses the host memory directly.
+    The host memory is kept alive while this object is alive. The host must
+    not access the memory until the kernels using it are completed, e.g. by
+    synchronizing the stream.
+
+    Args:
+        obj (numpy.ndarray): C-contiguous array whose memory is shared. Its
+            address should be a multiple of :func:`get_subbuffer_alignment`
+            to avoid copies by the driver.
+
+    """
+
+    def __init__(self, obj):
+        cdef size_t host_ptr = obj.ctypes.data
+        self.size = obj.nbytes
+        self.device = None
+        self.buf = Buf()
+        self.obj = obj
+        if self.size > 0:
+            self.device = device.Device()
+            self.buf = Buf(<size_t>clpy.backend.opencl.api.CreateBuffer(
+                clpy.backend.opencl.env.get_context(),
+                clpy.backend.opencl.api.MEM_READ_WRITE |
+                clpy.backend.opencl.api.MEM_USE_HOST_PTR,
+                self.size,
+                <void*>host_ptr))
+
+
+class MappedMemory(object):
+
+    """Device memory mapped to the host address space.
+
+    The region is mapped by ``clEnqueueMapBuffer`` after the preceding
+    commands of the current command queue are completed, and it is unmapped
+    by :meth:`unmap` or when this object is destroyed. The region is exposed
+    as a one-dimensional ``uint8`` array by ``__array_interface__``, which
+    aliases the device memory. Arrays made from it keep this object alive,
+    so the region stays mapped until they are destroyed unless :meth:`unmap`
+    is called. Kernels must not access the region while it is mapped.
+
+    Args:
+        memptr (MemoryPointer): Pointer to the head of the region.
+        size (int): Size of the region in bytes.
+
+    Attributes:
+        ptr (int): Pointer to the mapped host memory.
+
+    """
+
+    def __init__(self, MemoryPointer memptr, Py_ssize_t size):
+        self.memptr = memptr
+        self.size = size
+        self.ptr = 0
+        if size > 0:
+            self.ptr = <size_t>clpy.backend.opencl.api.EnqueueMapBuffer(
+                command_queue=clpy.backend.opencl.env.get_command_queue(),
+                buffer=memptr.buf.ptr,
+                blocking_map=clpy.backend.opencl.api.BLOCKING,
+                map_flags=(clpy.backend.opencl.api.MAP_READ |
+                           clpy.backend.opencl.api.MAP_WRITE),
+                offset=memptr.cl_mem_offset(),
+                size=size,
+                num_events_in_wait_list=0,
+                event_wait_list=<cl_event*>NULL,
+                event=<cl_event*>NULL)
+
+    def __del__(self):
+        self.unmap()
+
+    def unmap(self):
+        """Unmaps the region.
+
+        Arrays referring to the mapped host memory must not be used after
+        this method is called.
+
+        """
+        cdef MemoryPointer memptr = self.memptr
+        cdef size_t ptr = self.ptr
+        if ptr:
+            clpy.backend.opencl.api.EnqueueUnmapMemObject(
+                command_queue=(
+                    clpy.backend.opencl.env.get_device_command_queue(
+                        memptr.device.id)),
+                memobj=memptr.buf.ptr,
+                mapped_ptr=<void*>ptr,
+                num_events_in_wait_list=0,
+                event_wait_list=<cl_event*>NULL,
+                event=<cl_event*>NULL)
+            self.ptr = 0
+
+    @property
+    def __array_interface__(self):
+        return {'version': 3, 'shape': (self.size,), 'typestr': '|u1',
+                'data': (self.ptr, False)}
+
+
 class ManagedMemory(Memory):
 
     """Managed memory (Unified memory) allocation on a CUDA device.
@@ -193,6 +333,8 @@ cdef class Chunk:
         size (int): Chunk size in bytes.
         prev (Chunk): prev memory pointer if split from a larger allocation
         next (Chunk): next memory pointer if split from a larger allocation
+        queue (int): Pointer to the command queue on which the chunk is
+            allocated, or 0 if it is not allocated by a memory pool.
     """
 
     def __init__(self, mem, Py_ssize_t offset, Py_ssize_t size):
@@ -204,6 +346,80 @@ cdef class Chunk:
         self.size = size
         self.prev = None
         self.next = None
+        self.queue = 0
+
+
+cdef size_t _get_stream_ptr(stream):
+    if stream is None:
+        return clpy.backend.opencl.env.get_current_command_queue()
+    return stream.ptr
+
+
+cdef _watch_event(cl_event event, name, size_t stream_ptr, obj):
+    """Keeps ``obj`` alive until the command of the event completes.
+
+    The ownership of ``event`` is taken over by the event watcher.
+    """
+    if profiler.is_enabled():
+        clpy.backend.opencl.api.RetainEvent(event)
+        profiler.record(event, name, 'memcpy', stream_ptr)
+    watched = stream_module.Event()
+    watched.ptr = <size_t>event
+    pinned_memory._add_to_watch_list(watched, obj)
+
+
+cdef bint _is_peer_copy(MemoryPointer dst, MemoryPointer src):
+    return (dst.device is not None and src.device is not None and
+            dst.device.id != src.device.id)
+
+
+cdef _copy_peer(MemoryPointer dst, MemoryPointer src, size_t size):
+    """Copies a memory sequence between buffers of different devices.
+
+    A buffer cannot be copied to a buffer of another context directly, so the
+    sequence is staged in the host memory. The copy is synchronous with the
+    default command queues of both devices.
+    """
+    cdef void* host_ptr = malloc(size)
+    if host_ptr == NULL:
+        raise MemoryError()
+    try:
+        clpy.backend.opencl.api.EnqueueReadBuffer(
+            command_queue=clpy.backend.opencl.env.get_device_command_queue(
+                src.device.id),
+            buffer=src.buf.ptr,
+            blocking_read=clpy.backend.opencl.api.BLOCKING,
+            offset=src.cl_mem_offset(),
+            cb=size,
+            host_ptr=host_ptr,
+            num_events_in_wait_list=0,
+            event_wait_list=<cl_event*>NULL,
+            event=<cl_event*>NULL)
+        clpy.backend.opencl.api.EnqueueWriteBuffer(
+            command_queue=clpy.backend.opencl.env.get_device_command_queue(
+                dst.device.id),
+            buffer=dst.buf.ptr,
+            blocking_write=clpy.backend.opencl.api.BLOCKING,
+            offset=dst.cl_mem_offset(),
+            cb=size,
+            host_ptr=host_ptr,
+            num_events_in_wait_list=0,
+            event_wait_list=<cl_event*>NULL,
+            event=<cl_event*>NULL)
+    finally:
+        free(host_ptr)
+
+
+cdef _check_fill_pattern(MemoryPointer ptr, bytes pattern, size_t size):
+    cdef size_t pattern_size = len(pattern)
+    if pattern_size == 0 or pattern_size > 128 or \
+            pattern_size & (pattern_size - 1):
+        raise ValueError(
+            'Pattern size must be a power of 2 up to 128: %d' % pattern_size)
+    if size % pattern_size or ptr.cl_mem_offset() % pattern_size:
+        raise ValueError(
+            'Size and offset must be multiples of the pattern size')
+
 
 cdef class MemoryPointer:
 
@@ -275,7 +491,10 @@ cdef class MemoryPointer:
             size (int): Size of the sequence in bytes.
 
         """
-        if size > 0:
+        cdef cl_event event = NULL
+        if size > 0 and _is_peer_copy(self, src):
+            _copy_peer(self, src, size)
+        elif size > 0:
             clpy.backend.opencl.api.EnqueueCopyBuffer(
                 command_queue=clpy.backend.opencl.env.get_command_queue(),
                 src_buffer=src.buf.ptr,
@@ -285,20 +504,39 @@ cdef class MemoryPointer:
                 cb=size,
                 num_events_in_wait_list=0,
                 event_wait_list=<cl_event*>NULL,
-                event=<cl_event*>NULL)
+                event=profiler.event_ptr(&event))
+            profiler.record(event, 'copy_from_device', 'memcpy')
 
     cpdef copy_from_device_async(self, MemoryPointer src, size_t size, stream):
         """Copies a memory from a (possibly different) device asynchronously.
 
+        If the devices are different, the copy is staged in the host memory
+        and done synchronously.
+
         Args:
             src (clpy.cuda.MemoryPointer): Source memory pointer.
             size (int): Size of the sequence in bytes.
             stream (clpy.cuda.Stream): CUDA stream.
 
         """
-        if size > 0:
-            # TODO(LWisteria): Impelment async
-            self.copy_from_device(src, size)
+        cdef cl_event event
+        cdef size_t stream_ptr = _get_stream_ptr(stream)
+        if size > 0 and _is_peer_copy(self, src):
+            _copy_peer(self, src, size)
+        elif size > 0:
+            clpy.backend.opencl.api.EnqueueCopyBuffer(
+                command_queue=clpy.backend.opencl.env.to_command_queue(
+                    stream_ptr),
+                src_buffer=src.buf.ptr,
+                dst_buffer=self.buf.ptr,
+                src_offset=src.cl_mem_offset(),
+                dst_offset=self.cl_mem_offset(),
+                cb=size,
+                num_events_in_wait_list=0,
+                event_wait_list=<cl_event*>NULL,
+                event=&event)
+            _watch_event(event, 'copy_from_device_async', stream_ptr,
+                         (self, src))
 
     cpdef copy_from_host(self, mem, size_t size):
         """Copies a memory sequence from the host memory.
@@ -309,6 +547,7 @@ cdef class MemoryPointer:
 
         """
         cdef size_t host_ptr = mem.value
+        cdef cl_event event = NULL
         if size > 0:
             clpy.backend.opencl.api.EnqueueWriteBuffer(
                 command_queue=clpy.backend.opencl.env.get_command_queue(),
@@ -319,7 +558,8 @@ cdef class MemoryPointer:
                 host_ptr=<void*>host_ptr,
                 num_events_in_wait_list=0,
                 event_wait_list=<cl_event*>NULL,
-                event=<cl_event*>NULL)
+                event=profiler.event_ptr(&event))
+            profiler.record(event, 'copy_from_host', 'memcpy')
 
     cpdef copy_from_host_async(self, mem, size_t size, stream):
         """Copies a memory sequence from the host memory asynchronously.
@@ -331,9 +571,23 @@ cdef class MemoryPointer:
             stream (clpy.cuda.Stream): CUDA stream.
 
         """
+        cdef size_t host_ptr = mem.value
+        cdef cl_event event
+        cdef size_t stream_ptr = _get_stream_ptr(stream)
         if size > 0:
-            # TODO(LWisteria): Impelment async
-            self.copy_from_host(mem, size)
+            clpy.backend.opencl.api.EnqueueWriteBuffer(
+                command_queue=clpy.backend.opencl.env.to_command_queue(
+                    stream_ptr),
+                buffer=self.buf.ptr,
+                blocking_write=clpy.backend.opencl.api.NON_BLOCKING,
+                offset=self.cl_mem_offset(),
+                cb=size,
+                host_ptr=<void*>host_ptr,
+                num_events_in_wait_list=0,
+                event_wait_list=<cl_event*>NULL,
+                event=&event)
+            _watch_event(event, 'copy_from_host_async', stream_ptr,
+                         (self, mem))
 
     cpdef copy_from(self, mem, size_t size):
         """Copies a memory sequence from a (possibly different) device or host.
@@ -375,12 +629,15 @@ cdef class MemoryPointer:
     cpdef copy_to_host(self, mem, size_t size):
         """Copies a memory sequence to the host memory.
 
+        The copy blocks until all the preceding kernels are completed.
+
         Args:
             mem (ctypes.c_void_p): Target memory pointer.
             size (int): Size of the sequence in bytes.
 
         """
         cdef size_t host_ptr = mem.value
+        cdef cl_event event = NULL
         if size > 0:
             clpy.backend.opencl.api.EnqueueReadBuffer(
                 command_queue=clpy.backend.opencl.env.get_command_queue(),
@@ -391,7 +648,8 @@ cdef class MemoryPointer:
                 host_ptr=<void*>host_ptr,
                 num_events_in_wait_list=0,
                 event_wait_list=<cl_event*>NULL,
-                event=<cl_event*>NULL)
+                event=profiler.event_ptr(&event))
+            profiler.record(event, 'copy_to_host', 'memcpy')
 
     cpdef copy_to_host_async(self, mem, size_t size, stream):
         """Copies a memory sequence to the host memory asynchronously.
@@ -403,9 +661,23 @@ cdef class MemoryPointer:
             stream (clpy.cuda.Stream): CUDA stream.
 
         """
+        cdef size_t host_ptr = mem.value
+        cdef cl_event event
+        cdef size_t stream_ptr = _get_stream_ptr(stream)
         if size > 0:
-            # TODO(LWisteria): Impelment async
-            self.copy_to_host(mem, size)
+            clpy.backend.opencl.api.EnqueueReadBuffer(
+                command_queue=clpy.backend.opencl.env.to_command_queue(
+                    stream_ptr),
+                buffer=self.buf.ptr,
+                blocking_read=clpy.backend.opencl.api.NON_BLOCKING,
+                offset=self.cl_mem_offset(),
+                cb=size,
+                host_ptr=<void*>host_ptr,
+                num_events_in_wait_list=0,
+                event_wait_list=<cl_event*>NULL,
+                event=&event)
+            _watch_event(event, 'copy_to_host_async', stream_ptr,
+                         (self, mem))
 
     cpdef memset(self, int value, size_t size):
         """Fills a memory sequence by constant byte value.
@@ -415,9 +687,20 @@ cdef class MemoryPointer:
             size (int): Size of the sequence in bytes.
 
         """
+        cdef unsigned char pattern = <unsigned char>value
+        cdef cl_event event = NULL
         if size > 0:
-            raise NotImplementedError("clpy does not support this")
-#            runtime.memset(self.ptr, value, size)
+            clpy.backend.opencl.api.EnqueueFillBuffer(
+                command_queue=clpy.backend.opencl.env.get_command_queue(),
+                buffer=self.buf.ptr,
+                pattern=&pattern,
+                pattern_size=sizeof(unsigned char),
+                offset=self.cl_mem_offset(),
+                size=size,
+                num_events_in_wait_list=0,
+                event_wait_list=<cl_event*>NULL,
+                event=profiler.event_ptr(&event))
+            profiler.record(event, 'memset', 'memcpy')
 
     cpdef memset_async(self, int value, size_t size, stream):
         """Fills a memory sequence by constant byte value asynchronously.
@@ -428,9 +711,77 @@ cdef class MemoryPointer:
             stream (clpy.cuda.Stream): CUDA stream.
 
         """
+        cdef unsigned char pattern = <unsigned char>value
+        cdef cl_event event
+        cdef size_t stream_ptr = _get_stream_ptr(stream)
+        if size > 0:
+            clpy.backend.opencl.api.EnqueueFillBuffer(
+                command_queue=clpy.backend.opencl.env.to_command_queue(
+                    stream_ptr),
+                buffer=self.buf.ptr,
+                pattern=&pattern,
+                pattern_size=sizeof(unsigned char),
+                offset=self.cl_mem_offset(),
+                size=size,
+                num_events_in_wait_list=0,
+                event_wait_list=<cl_event*>NULL,
+                event=&event)
+            _watch_event(event, 'memset_async', stream_ptr, self)
+
+    cpdef fill(self, bytes pattern, size_t size):
+        """Fills a memory sequence by repeating a pattern.
+
+        Args:
+            pattern (bytes): Pattern of 1, 2, 4, 8, 16, 32, 64 or 128 bytes,
+                e.g. the bytes of a scalar value.
+            size (int): Size of the sequence in bytes. It and the offset of
+                the pointer must be multiples of the pattern size.
+
+        """
+        cdef const char* pattern_ptr = pattern
+        cdef cl_event event = NULL
+        _check_fill_pattern(self, pattern, size)
+        if size > 0:
+            clpy.backend.opencl.api.EnqueueFillBuffer(
+                command_queue=clpy.backend.opencl.env.get_command_queue(),
+                buffer=self.buf.ptr,
+                pattern=<void*>pattern_ptr,
+                pattern_size=len(pattern),
+                offset=self.cl_mem_offset(),
+                size=size,
+                num_events_in_wait_list=0,
+                event_wait_list=<cl_event*>NULL,
+                event=profiler.event_ptr(&event))
+            profiler.record(event, 'fill', 'memcpy')
+
+    cpdef fill_async(self, bytes pattern, size_t size, stream):
+        """Fills a memory sequence by repeating a pattern asynchronously.
+
+        Args:
+            pattern (bytes): Pattern of 1, 2, 4, 8, 16, 32, 64 or 128 bytes,
+                e.g. the bytes of a scalar value.
+            size (int): Size of the sequence in bytes. It and the offset of
+                the pointer must be multiples of the pattern size.
+            stream (clpy.cuda.Stream): CUDA stream.
+
+        """
+        cdef const char* pattern_ptr = pattern
+        cdef cl_event event
+        cdef size_t stream_ptr = _get_stream_ptr(stream)
+        _check_fill_pattern(self, pattern, size)
         if size > 0:
-            # TODO(LWisteria): Impelment async
-            self.memset(value, size)
+            clpy.backend.opencl.api.EnqueueFillBuffer(
+                command_queue=clpy.backend.opencl.env.to_command_queue(
+                    stream_ptr),
+                buffer=self.buf.ptr,
+                pattern=<void*>pattern_ptr,
+                pattern_size=len(pattern),
+                offset=self.cl_mem_offset(),
+                size=size,
+                num_events_in_wait_list=0,
+                event_wait_list=<cl_event*>NULL,
+                event=&event)
+            _watch_event(event, 'fill_async', stream_ptr, self)
 
     cpdef Py_ssize_t cl_mem_offset(self):
         cdef Py_ssize_t ret = self.offset
@@ -530,34 +881,69 @@ class PooledMemory(Memory):
         if pool is None:
             return
 
-        pool.free(buf, self.size, self.offset)
-#        hooks = None
-#        # to avoid error at exit
-#        hooks = memory_hook.get_memory_hooks()
-#        size = self.size
-#        if hooks:
-#            device_id = self.device.id
-#            pmem_id = id(self)
-#            hooks_values = hooks.values()  # avoid six for performance
-#            for hook in hooks_values:
-#                hook.free_preprocess(device_id=device_id,
-#                                     mem_size=size,
-#                                     mem_ptr=ptr,
-#                                     pmem_id=pmem_id)
-#            try:
-#                pool.free(ptr, size)
-#            finally:
-#                for hook in hooks_values:
-#                    hook.free_postprocess(device_id=device_id,
-#                                          mem_size=size,
-#                                          mem_ptr=ptr,
-#                                          pmem_id=pmem_id)
-#        else:
-#            pool.free(ptr, size)
+        hooks = None
+        # to avoid error at exit
+        hooks = memory_hook.get_memory_hooks()
+        size = self.size
+        if hooks:
+            device_id = self.device.id
+            mem_ptr = buf.get()
+            pmem_id = id(self)
+            hooks_values = hooks.values()  # avoid six for performance
+            for hook in hooks_values:
+                hook.free_preprocess(device_id=device_id,
+                                     mem_size=size,
+                                     mem_ptr=mem_ptr,
+                                     pmem_id=pmem_id)
+            try:
+                pool.free(buf, size, self.offset)
+            finally:
+                for hook in hooks_values:
+                    hook.free_postprocess(device_id=device_id,
+                                          mem_size=size,
+                                          mem_ptr=mem_ptr,
+                                          pmem_id=pmem_id)
+        else:
+            pool.free(buf, size, self.offset)
 
     __del__ = free
 
 
+# indices of the statistics of each bin
+cdef enum:
+    _STAT_ALLOCATIONS = 0
+    _STAT_HITS = 1
+    _STAT_MISSES = 2
+    _STAT_SPLITS = 3
+    _STAT_MERGES = 4
+    _STAT_USED_BYTES = 5
+    _STAT_PEAK_BYTES = 6
+    _N_STATS = 7
+
+
+cdef bint _is_out_of_memory(error):
+    if not isinstance(
+            error, clpy.backend.opencl.exceptions.OpenCLRuntimeError):
+        return False
+    return error.status in (
+        clpy.backend.opencl.api.MEM_OBJECT_ALLOCATION_FAILURE,
+        clpy.backend.opencl.api.OUT_OF_RESOURCES,
+        clpy.backend.opencl.api.OUT_OF_HOST_MEMORY)
+
+
+# pools whose free blocks of the released command queues are reclaimed
+cdef object _pools = weakref.WeakSet()
+
+
+def _reclaim_released_queue(size_t queue, int device_id):
+    for pool in list(_pools):
+        if (<SingleDeviceMemoryPool>pool)._device_id == device_id:
+            (<SingleDeviceMemoryPool>pool)._reclaim_arena(queue)
+
+
+clpy.backend.opencl.env._add_release_hook(_reclaim_released_queue)
+
+
 cdef class SingleDeviceMemoryPool:
     """Memory pool implementation for single device.
 
@@ -565,22 +951,49 @@ cdef class SingleDeviceMemoryPool:
       the requested size. If the block is larger than the requested size,
       it may be split. If no block is found, the allocator will delegate to
       cudaMalloc.
-    - If the cudaMalloc fails, the allocator will free all cached blocks that
-      are not split and retry the allocation.
+    - If the cudaMalloc fails or the allocation exceeds the limit, the
+      allocator will free all cached blocks that are not split and retry the
+      allocation, and then retry again after running the garbage collector.
+
+    - Free blocks are kept separately for each command queue on which they
+      are allocated, and reused only by the same queue. Commands of an
+      in-order queue are completed in order, so a block freed while a kernel
+      using it is still pending is never overwritten by another queue, e.g.
+      of a stream or of another thread (see
+      :func:`clpy.backend.opencl.env.is_per_thread_default_queue_enabled`).
+      When a queue is released, its blocks are reused by all queues.
+
+    The limit is initialized by ``CLPY_GPU_MEMORY_LIMIT`` environment
+    variable, which is a number of bytes like ``1073741824`` or a percentage
+    of the device memory like ``50%``.
     """
 
     def __init__(self, allocator=None):
         if allocator is None:
             allocator = _malloc
-        self._allocation_unit_size = subbuffer_alignment
+        self._allocation_unit_size = get_subbuffer_alignment()
         self._initial_bins_size = 1024
         self._in_use = {}
-        self._free = [None] * self._initial_bins_size
+        # bins of free chunks keyed by the pointers of the command queues
+        self._free = {}
         self._allocator = allocator
         self._weakref = weakref.ref(self)
         self._device_id = device.get_device_id()
         self._free_lock = rlock.create_fastrlock()
         self._in_use_lock = rlock.create_fastrlock()
+        _pools.add(self)
+        self._limit = 0
+        self._total_bytes = 0
+        self._used_bytes = 0
+        self._peak_bytes = 0
+        self._stats = {}
+
+        limit = os.environ.get('CLPY_GPU_MEMORY_LIMIT')
+        if limit:
+            if limit.endswith('%'):
+                self.set_limit(fraction=float(limit[:-1]) / 100)
+            else:
+                self.set_limit(size=int(limit))
 
     cpdef Py_ssize_t _round_size(self, Py_ssize_t size):
         """Round up the memory size to fit memory alignment of cudaMalloc."""
@@ -592,14 +1005,69 @@ cdef class SingleDeviceMemoryPool:
         unit = self._allocation_unit_size
         return (size - 1) // unit
 
-    cpdef void _grow_free_if_necessary(self, Py_ssize_t size):
+    cdef list _get_arena(self, size_t queue):
+        # must be called with _free_lock
+        cdef list arena = self._free.get(queue)
+        if arena is None:
+            arena = self._free[queue] = [None] * self._initial_bins_size
+        return arena
+
+    cdef Chunk _pop_free_chunk(self, list arena, Py_ssize_t index):
+        # must be called with _free_lock
+        cdef set free_list
+        # find best-fit, or a smallest larger allocation
+        for i in range(index, len(arena)):
+            free_list = arena[i]
+            if free_list:
+                return free_list.pop()
+        return None
+
+    cpdef _reclaim_arena(self, size_t queue):
+        """Makes the blocks of a released command queue reusable.
+
+        The free blocks and the blocks in use on the queue are moved to the
+        arena keyed by 0, which is searched by all queues, since all commands
+        of the queue are completed.
+        """
+        cdef list arena
+        cdef list idle_arena
+        cdef set free_list
+        cdef Chunk chunk
+        try:
+            rlock.lock_fastrlock(self._free_lock, -1, True)
+            arena = self._free.pop(queue, None)
+            if arena is not None:
+                idle_arena = self._get_arena(0)
+                self._grow_free_if_necessary(idle_arena, len(arena))
+                for i in range(len(arena)):
+                    free_list = arena[i]
+                    if not free_list:
+                        continue
+                    for chunk in free_list:
+                        chunk.queue = 0
+                    if idle_arena[i] is None:
+                        idle_arena[i] = free_list
+                    else:
+                        idle_arena[i].update(free_list)
+            # the blocks in use return to the arena keyed by 0 when freed
+            try:
+                rlock.lock_fastrlock(self._in_use_lock, -1, True)
+                for chunk in self._in_use.values():
+                    if chunk.queue == queue:
+                        chunk.queue = 0
+            finally:
+                rlock.unlock_fastrlock(self._in_use_lock)
+        finally:
+            rlock.unlock_fastrlock(self._free_lock)
+
+    cpdef void _grow_free_if_necessary(self, list arena, Py_ssize_t size):
         """Extend bins (_free) size if necessary"""
-        current_size = len(self._free)
+        current_size = len(arena)
         if current_size >= size:
             return
         growth_size = size - current_size
         growth = [None] * growth_size
-        self._free.extend(growth)
+        arena.extend(growth)
 
     cpdef tuple _split(self, Chunk chunk, Py_ssize_t size):
         """Split contiguous block of a larger allocation"""
@@ -610,6 +1078,7 @@ cdef class SingleDeviceMemoryPool:
         cdef Chunk remaining
         head = Chunk(chunk.mem, chunk.offset, size)
         remaining = Chunk(chunk.mem, chunk.offset + size, chunk.size - size)
+        head.queue = remaining.queue = chunk.queue
         if chunk.prev is not None:
             head.prev = chunk.prev
             chunk.prev.next = head
@@ -625,6 +1094,7 @@ cdef class SingleDeviceMemoryPool:
         cdef Chunk merged
         size = head.size + remaining.size
         merged = Chunk(head.mem, head.offset, size)
+        merged.queue = head.queue
         if head.prev is not None:
             merged.prev = head.prev
             merged.prev.next = merged
@@ -634,197 +1104,251 @@ cdef class SingleDeviceMemoryPool:
         return merged
 
     cpdef MemoryPointer _alloc(self, Py_ssize_t rounded_size):
-        return self._allocator(rounded_size)
-        # hooks = memory_hook.get_memory_hooks()
-        # if hooks:
-        #     memptr = None
-        #     device_id = self._device_id
-        #     hooks_values = hooks.values()  # avoid six for performance
-        #     for hook in hooks_values:
-        #         hook.alloc_preprocess(device_id=device_id,
-        #                               mem_size=rounded_size)
-        #     try:
-        #         memptr = self._allocator(rounded_size)
-        #     finally:
-        #         for hook in hooks_values:
-        #             mem_ptr = memptr.ptr if memptr is not None else 0
-        #             hook.alloc_postprocess(device_id=device_id,
-        #                                    mem_size=rounded_size,
-        #                                    mem_ptr=mem_ptr)
-        #     return memptr
-        # else:
-        #     return self._allocator(rounded_size)
+        cdef MemoryPointer memptr
+        hooks = memory_hook.get_memory_hooks()
+        if hooks:
+            memptr = None
+            device_id = self._device_id
+            hooks_values = hooks.values()  # avoid six for performance
+            for hook in hooks_values:
+                hook.alloc_preprocess(device_id=device_id,
+                                      mem_size=rounded_size)
+            try:
+                memptr = self._allocator(rounded_size)
+            finally:
+                for hook in hooks_values:
+                    mem_ptr = memptr.buf.get() if memptr is not None else 0
+                    hook.alloc_postprocess(device_id=device_id,
+                                           mem_size=rounded_size,
+                                           mem_ptr=mem_ptr)
+            return memptr
+        else:
+            return self._allocator(rounded_size)
 
     cpdef MemoryPointer malloc(self, Py_ssize_t size):
+        cdef MemoryPointer memptr
         rounded_size = self._round_size(size)
-        return self._malloc(rounded_size)
-        # hooks = memory_hook.get_memory_hooks()
-        # if hooks:
-        #     memptr = None
-        #     device_id = self._device_id
-        #     hooks_values = hooks.values()  # avoid six for performance
-        #     for hook in hooks_values:
-        #         hook.malloc_preprocess(device_id=device_id,
-        #                                size=size,
-        #                                mem_size=rounded_size)
-        #     try:
-        #         memptr = self._malloc(rounded_size)
-        #     finally:
-        #         if memptr is None:
-        #             mem_ptr = 0
-        #             pmem_id = 0
-        #         else:
-        #             mem_ptr = memptr.ptr
-        #             pmem_id = id(memptr.mem)
-        #         for hook in hooks_values:
-        #             hook.malloc_postprocess(device_id=device_id,
-        #                                     size=size,
-        #                                     mem_size=rounded_size,
-        #                                     mem_ptr=mem_ptr,
-        #                                     pmem_id=pmem_id)
-        #     return memptr
-        # else:
-        #     return self._malloc(rounded_size)
+        hooks = memory_hook.get_memory_hooks()
+        if hooks:
+            memptr = None
+            device_id = self._device_id
+            hooks_values = hooks.values()  # avoid six for performance
+            for hook in hooks_values:
+                hook.malloc_preprocess(device_id=device_id,
+                                       size=size,
+                                       mem_size=rounded_size)
+            try:
+                memptr = self._malloc(rounded_size)
+            finally:
+                if memptr is None:
+                    mem_ptr = 0
+                    pmem_id = 0
+                else:
+                    mem_ptr = memptr.buf.get()
+                    pmem_id = id(memptr.mem)
+                for hook in hooks_values:
+                    hook.malloc_postprocess(device_id=device_id,
+                                            size=size,
+                                            mem_size=rounded_size,
+                                            mem_ptr=mem_ptr,
+                                            pmem_id=pmem_id)
+            return memptr
+        else:
+            return self._malloc(rounded_size)
 
     cpdef MemoryPointer _malloc(self, Py_ssize_t size):
         cdef set free_list = None
+        cdef list arena
         cdef Chunk chunk = None
         cdef Chunk remaining = None
+        cdef size_t queue
 
         if size == 0:
             return MemoryPointer(Memory(0), 0)
 
         index = self._bin_index_from_size(size)
-        # find best-fit, or a smallest larger allocation
-        length = len(self._free)
-        for i in range(index, length):
-            free_list = self._free[i]
-            if free_list:
-                try:
-                    rlock.lock_fastrlock(self._free_lock, -1, True)
-                    free_list = self._free[i]
-                    if free_list:
-                        chunk = free_list.pop()
-                        break
-                finally:
-                    rlock.unlock_fastrlock(self._free_lock)
+        queue = <size_t>clpy.backend.opencl.env.get_command_queue()
+        # Chunks are split and merged with _free_lock held, since they update
+        # the links of their neighbors, which other threads may free at the
+        # same time.
+        try:
+            rlock.lock_fastrlock(self._free_lock, -1, True)
+            arena = self._get_arena(queue)
+            chunk = self._pop_free_chunk(arena, index)
+            if chunk is None and 0 in self._free:
+                # blocks of the released command queues
+                chunk = self._pop_free_chunk(self._free[0], index)
+                if chunk is not None:
+                    chunk.queue = queue
+            if chunk is not None:
+                chunk, remaining = self._split(chunk, size)
+                if remaining is not None:
+                    remaining_index = self._bin_index_from_size(
+                        remaining.size)
+                    free_list = arena[remaining_index]
+                    if free_list is None:
+                        arena[remaining_index] = free_list = set()
+                    free_list.add(remaining)
+        finally:
+            rlock.unlock_fastrlock(self._free_lock)
 
         if chunk is not None:
-            # # TODO(LWisteria): need on OpenCL?
-            # _ensure_context(self._device_id)
-            chunk, remaining = self._split(chunk, size)
+            hit = True
         else:
+            hit = False
             # cudaMalloc if a cache is not found
-            mem = self._alloc(size).mem
-            # try:
-            #     mem = self._alloc(size).mem
-            # except runtime.CUDARuntimeError as e:
-            #     if e.status != runtime.errorMemoryAllocation:
-            #         raise
-            #     self.free_all_blocks()
-            #     try:
-            #         mem = self._alloc(size).mem
-            #     except runtime.CUDARuntimeError as e:
-            #         if e.status != runtime.errorMemoryAllocation:
-            #             raise
-            #         gc.collect()
-            #         try:
-            #             mem = self._alloc(size).mem
-            #         except runtime.CUDARuntimeError as e:
-            #             if e.status != runtime.errorMemoryAllocation:
-            #                 raise
-            #             else:
-            #                 total = size + self.total_bytes()
-            #                 raise OutOfMemoryError(size, total)
+            mem = self._try_alloc(size)
             chunk = Chunk(mem, 0, size)
+            chunk.queue = queue
 
         try:
             rlock.lock_fastrlock(self._in_use_lock, -1, True)
             self._in_use[(chunk.buf, chunk.offset)] = chunk
+            stat = self._get_bin_stat(index)
+            stat[_STAT_ALLOCATIONS] += 1
+            if hit:
+                stat[_STAT_HITS] += 1
+            else:
+                stat[_STAT_MISSES] += 1
+            if remaining is not None:
+                stat[_STAT_SPLITS] += 1
+            stat[_STAT_USED_BYTES] += size
+            if stat[_STAT_USED_BYTES] > stat[_STAT_PEAK_BYTES]:
+                stat[_STAT_PEAK_BYTES] = stat[_STAT_USED_BYTES]
+            self._used_bytes += size
+            if self._used_bytes > self._peak_bytes:
+                self._peak_bytes = self._used_bytes
         finally:
             rlock.unlock_fastrlock(self._in_use_lock)
-        if remaining:
-            remaining_index = self._bin_index_from_size(remaining.size)
-            try:
-                rlock.lock_fastrlock(self._free_lock, -1, True)
-                free_list = self._free[remaining_index]
-                if free_list is None:
-                    self._free[remaining_index] = free_list = set()
-                free_list.add(remaining)
-            finally:
-                rlock.unlock_fastrlock(self._free_lock)
         pmem = PooledMemory(chunk, self._weakref)
         return MemoryPointer(pmem, 0)
 
+    cdef object _try_alloc(self, Py_ssize_t size):
+        """Allocates a new memory, releasing free blocks on failure."""
+        for retry in range(3):
+            if retry == 1:
+                self.free_all_blocks()
+            elif retry == 2:
+                gc.collect()
+                self.free_all_blocks()
+            if self._limit != 0 and self._total_bytes + size > self._limit:
+                continue
+            try:
+                mem = self._alloc(size).mem
+            except Exception as e:
+                if not _is_out_of_memory(e):
+                    raise
+                continue
+            try:
+                rlock.lock_fastrlock(self._in_use_lock, -1, True)
+                self._total_bytes += size
+            finally:
+                rlock.unlock_fastrlock(self._in_use_lock)
+            return mem
+        raise OutOfMemoryError(size, self._total_bytes, self._limit)
+
+    cdef list _get_bin_stat(self, Py_ssize_t index):
+        # must be called with _in_use_lock
+        cdef list stat = self._stats.get(index)
+        if stat is None:
+            stat = self._stats[index] = [0] * _N_STATS
+        return stat
+
     cpdef free(self, Buf buf, Py_ssize_t size, Py_ssize_t offset):
         cdef set free_list = None
+        cdef list arena
         cdef Chunk chunk
         cdef int index
+        cdef int merges = 0
+        cdef list stat
 
+        # _free_lock is held from the removal from _in_use, so that the
+        # command queue of the chunk is not released in the meantime (see
+        # _reclaim_arena)
         try:
-            rlock.lock_fastrlock(self._in_use_lock, -1, True)
-            chunk = self._in_use.pop((buf, offset), None)
-        finally:
-            rlock.unlock_fastrlock(self._in_use_lock)
-        if chunk is None:
-            raise RuntimeError('Cannot free out-of-pool memory')
-
-        if chunk.next:
-            chunk_next = None
-            index = self._bin_index_from_size(chunk.next.size)
+            rlock.lock_fastrlock(self._free_lock, -1, True)
             try:
-                rlock.lock_fastrlock(self._free_lock, -1, True)
-                free_list = self._free[index]
+                rlock.lock_fastrlock(self._in_use_lock, -1, True)
+                chunk = self._in_use.pop((buf, offset), None)
+                if chunk is not None:
+                    stat = self._get_bin_stat(
+                        self._bin_index_from_size(chunk.size))
+                    stat[_STAT_USED_BYTES] -= chunk.size
+                    self._used_bytes -= chunk.size
+            finally:
+                rlock.unlock_fastrlock(self._in_use_lock)
+            if chunk is None:
+                raise RuntimeError('Cannot free out-of-pool memory')
+
+            # the chunk returns to the free blocks of the command queue on
+            # which it is allocated, and only the chunks there are merged
+            arena = self._get_arena(chunk.queue)
+            if chunk.next:
+                index = self._bin_index_from_size(chunk.next.size)
+                free_list = arena[index]
                 if free_list is not None and chunk.next in free_list:
                     free_list.remove(chunk.next)
-                    chunk_next = chunk.next
-            finally:
-                rlock.unlock_fastrlock(self._free_lock)
-            if chunk_next:
-                chunk = self._merge(chunk, chunk_next)
+                    chunk = self._merge(chunk, chunk.next)
+                    merges += 1
 
-        if chunk.prev:
-            chunk_prev = None
-            index = self._bin_index_from_size(chunk.prev.size)
-            try:
-                rlock.lock_fastrlock(self._free_lock, -1, True)
-                free_list = self._free[index]
+            if chunk.prev:
+                index = self._bin_index_from_size(chunk.prev.size)
+                free_list = arena[index]
                 if free_list is not None and chunk.prev in free_list:
                     free_list.remove(chunk.prev)
-                    chunk_prev = chunk.prev
-            finally:
-                rlock.unlock_fastrlock(self._free_lock)
-            if chunk_prev:
-                chunk = self._merge(chunk_prev, chunk)
+                    chunk = self._merge(chunk.prev, chunk)
+                    merges += 1
 
-        index = self._bin_index_from_size(chunk.size)
-        self._grow_free_if_necessary(index + 1)
-        try:
-            rlock.lock_fastrlock(self._free_lock, -1, True)
-            free_list = self._free[index]
+            index = self._bin_index_from_size(chunk.size)
+            self._grow_free_if_necessary(arena, index + 1)
+            free_list = arena[index]
             if free_list is None:
-                self._free[index] = free_list = set()
+                arena[index] = free_list = set()
             free_list.add(chunk)
         finally:
             rlock.unlock_fastrlock(self._free_lock)
 
+        if merges:
+            try:
+                rlock.lock_fastrlock(self._in_use_lock, -1, True)
+                stat[_STAT_MERGES] += merges
+            finally:
+                rlock.unlock_fastrlock(self._in_use_lock)
+
     cpdef free_all_blocks(self):
         cdef set free_list = None
         cdef set keep_list = None
+        cdef list arena
+        cdef Py_ssize_t released = 0
+        cdef bint empty
         # Free all **non-split** chunks
         try:
             rlock.lock_fastrlock(self._free_lock, -1, True)
-            for i in range(len(self._free)):
-                free_list = self._free[i]
-                if free_list is None:
-                    continue
-                keep_list = set()
-                for chunk in free_list:
-                    if chunk.prev or chunk.next:
-                        keep_list.add(chunk)
-                self._free[i] = keep_list
+            for queue, arena in list(self._free.items()):
+                empty = True
+                for i in range(len(arena)):
+                    free_list = arena[i]
+                    if free_list is None:
+                        continue
+                    keep_list = set()
+                    for chunk in free_list:
+                        if chunk.prev or chunk.next:
+                            keep_list.add(chunk)
+                        else:
+                            released += chunk.size
+                    arena[i] = keep_list
+                    if keep_list:
+                        empty = False
+                # the command queue may have been released
+                if empty:
+                    del self._free[queue]
         finally:
             rlock.unlock_fastrlock(self._free_lock)
+        try:
+            rlock.lock_fastrlock(self._in_use_lock, -1, True)
+            self._total_bytes -= released
+        finally:
+            rlock.unlock_fastrlock(self._in_use_lock)
 
     cpdef free_all_free(self):
         warnings.warn(
@@ -835,11 +1359,13 @@ cdef class SingleDeviceMemoryPool:
     cpdef n_free_blocks(self):
         cdef Py_ssize_t n = 0
         cdef set free_list
+        cdef list arena
         try:
             rlock.lock_fastrlock(self._free_lock, -1, True)
-            for free_list in self._free:
-                if free_list is not None:
-                    n += len(free_list)
+            for arena in self._free.values():
+                for free_list in arena:
+                    if free_list is not None:
+                        n += len(free_list)
         finally:
             rlock.unlock_fastrlock(self._free_lock)
         return n
@@ -857,12 +1383,14 @@ cdef class SingleDeviceMemoryPool:
     cpdef free_bytes(self):
         cdef Py_ssize_t size = 0
         cdef set free_list = None
+        cdef list arena
         try:
             rlock.lock_fastrlock(self._free_lock, -1, True)
-            for free_list in self._free:
-                if free_list is not None:
-                    for chunk in free_list:
-                        size += chunk.size
+            for arena in self._free.values():
+                for free_list in arena:
+                    if free_list is not None:
+                        for chunk in free_list:
+                            size += chunk.size
         finally:
             rlock.unlock_fastrlock(self._free_lock)
         return size
@@ -870,6 +1398,50 @@ cdef class SingleDeviceMemoryPool:
     cpdef total_bytes(self):
         return self.used_bytes() + self.free_bytes()
 
+    cpdef set_limit(self, size=None, fraction=None):
+        if size is None:
+            if fraction is None:
+                size = 0
+            else:
+                if not 0 <= fraction <= 1:
+                    raise ValueError(
+                        'memory limit fraction out of range: %s' % fraction)
+                size = int(device.get_device_info(
+                    self._device_id).global_mem_size * fraction)
+        elif fraction is not None:
+            raise ValueError('size and fraction cannot be specified at once')
+        if size < 0:
+            raise ValueError('memory limit must be non-negative: %d' % size)
+        self._limit = self._round_size(size)
+
+    cpdef get_limit(self):
+        return self._limit
+
+    cpdef get_statistics(self):
+        cdef dict bins = {}
+        unit = self._allocation_unit_size
+        try:
+            rlock.lock_fastrlock(self._in_use_lock, -1, True)
+            for index, stat in self._stats.items():
+                bins[(index + 1) * unit] = {
+                    'allocations': stat[_STAT_ALLOCATIONS],
+                    'hits': stat[_STAT_HITS],
+                    'misses': stat[_STAT_MISSES],
+                    'splits': stat[_STAT_SPLITS],
+                    'merges': stat[_STAT_MERGES],
+                    'used_bytes': stat[_STAT_USED_BYTES],
+                    'peak_bytes': stat[_STAT_PEAK_BYTES],
+                }
+            return {
+                'used_bytes': self._used_bytes,
+                'peak_bytes': self._peak_bytes,
+                'total_bytes': self._total_bytes,
+                'limit': self._limit,
+                'bins': bins,
+            }
+        finally:
+            rlock.unlock_fastrlock(self._in_use_lock)
+
 
 cdef class MemoryPool(object):
 
@@ -973,3 +1545,46 @@ cdef class MemoryPool(object):
         """
         mp = <SingleDeviceMemoryPool>self._pools[device.get_device_id()]
         return mp.total_bytes()
+
+    cpdef set_limit(self, size=None, fraction=None):
+        """Sets the upper limit of memory allocation of the current device.
+
+        When the total size of the blocks acquired by the pool would exceed
+        the limit, the pool releases the free blocks and runs the garbage
+        collector, and then raises :class:`OutOfMemoryError` if it still
+        exceeds the limit.
+
+        Args:
+            size (int): Limit in bytes. ``0`` means no limit.
+            fraction (float): Limit as a fraction of the global memory size
+                of the device, which must be in ``[0, 1]``.
+
+        Only one of ``size`` and ``fraction`` can be specified. If neither
+        is specified, the limit is removed.
+
+        """
+        mp = <SingleDeviceMemoryPool>self._pools[device.get_device_id()]
+        mp.set_limit(size=size, fraction=fraction)
+
+    cpdef get_limit(self):
+        """Gets the upper limit of memory allocation of the current device.
+
+        Returns:
+            int: The limit in bytes, or ``0`` if there is no limit.
+        """
+        mp = <SingleDeviceMemoryPool>self._pools[device.get_device_id()]
+        return mp.get_limit()
+
+    cpdef get_statistics(self):
+        """Gets the allocation statistics of the current device.
+
+        Returns:
+            dict: ``used_bytes``, ``peak_bytes`` (peak of ``used_bytes``),
+            ``total_bytes`` (bytes acquired from the allocator), ``limit`` and
+            ``bins``, which maps the block size of each bin to the dict of
+            the counts of ``allocations``, ``hits`` (reusing free blocks),
+            ``misses`` (new allocations), ``splits`` and ``merges`` of the
+            blocks, and ``used_bytes`` and ``peak_bytes`` of the bin.
+        """
+        mp = <SingleDeviceMemoryPool>self._pools[device.get_device_id()]
+        return mp.get_statistics()
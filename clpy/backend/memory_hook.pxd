@@ -0,0 +1 @@
+cpdef get_memory_hooks()
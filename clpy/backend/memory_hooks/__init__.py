@@ -0,0 +1,6 @@
+from clpy.backend.memory_hooks import debug_print  # NOQA
+from clpy.backend.memory_hooks import line_profile  # NOQA
+
+# import class and function
+from clpy.backend.memory_hooks.debug_print import DebugPrintHook  # NOQA
+from clpy.backend.memory_hooks.line_profile import LineProfileHook  # NOQA
@@ -10,6 +10,11 @@ cdef cl_uint GetDeviceIDs(cl_platform_id platform,
                           size_t device_type,
                           size_t num_entries,
                           cl_device_id* devices) except *
+cdef cl_uint CreateSubDevices(
+    cl_device_id in_device,
+    cl_device_partition_property* properties,
+    size_t num_devices,
+    cl_device_id* out_devices) except *
 cdef cl_context CreateContext(
     cl_context_properties* properties,
     size_t num_devices,
@@ -30,6 +35,12 @@ cdef cl_program CreateProgramWithSource(
     cl_uint count,
     char** strings,
     size_t* lengths)
+cdef cl_program CreateProgramWithBinary(
+    cl_context context,
+    cl_uint num_devices,
+    cl_device_id* device_list,
+    size_t* lengths,
+    unsigned char** binaries) except *
 cdef void BuildProgram(
     cl_program program,
     cl_uint num_devices,
@@ -37,6 +48,25 @@ cdef void BuildProgram(
     char* options,
     void* pfn_notify,
     void* user_data) except *
+cdef void CompileProgram(
+    cl_program program,
+    cl_uint num_devices,
+    cl_device_id* device_list,
+    char* options,
+    cl_uint num_input_headers,
+    cl_program* input_headers,
+    char** header_include_names,
+    void* pfn_notify,
+    void* user_data) except *
+cdef cl_program LinkProgram(
+    cl_context context,
+    cl_uint num_devices,
+    cl_device_id* device_list,
+    char* options,
+    cl_uint num_input_programs,
+    cl_program* input_programs,
+    void* pfn_notify,
+    void* user_data) except *
 cdef cl_kernel CreateKernel(cl_program program, char* kernel_name)
 cdef void SetKernelArg(cl_kernel kernel,
                        arg_index,
@@ -88,6 +118,33 @@ cdef void EnqueueCopyBuffer(
     cl_uint num_events_in_wait_list,
     cl_event* event_wait_list,
     cl_event* event) except *
+cdef void EnqueueFillBuffer(
+    cl_command_queue command_queue,
+    cl_mem buffer,
+    void* pattern,
+    size_t pattern_size,
+    size_t offset,
+    size_t size,
+    cl_uint num_events_in_wait_list,
+    cl_event* event_wait_list,
+    cl_event* event) except *
+cdef void* EnqueueMapBuffer(
+    cl_command_queue command_queue,
+    cl_mem buffer,
+    blocking_map,
+    size_t map_flags,
+    size_t offset,
+    size_t size,
+    cl_uint num_events_in_wait_list,
+    cl_event* event_wait_list,
+    cl_event* event) except *
+cdef void EnqueueUnmapMemObject(
+    cl_command_queue command_queue,
+    cl_mem memobj,
+    void* mapped_ptr,
+    cl_uint num_events_in_wait_list,
+    cl_event* event_wait_list,
+    cl_event* event) except *
 cdef void Flush(cl_command_queue command_queue) except *
 cdef void Finish(cl_command_queue command_queue) except *
 cdef void ReleaseKernel(cl_kernel kernel) except *
@@ -95,4 +152,32 @@ cdef void ReleaseProgram(cl_program program) except *
 cdef void ReleaseMemObject(cl_mem memobj) except *
 cdef void ReleaseCommandQueue(cl_command_queue command_queue) except *
 cdef void ReleaseContext(cl_context context) except *
+cdef void ReleaseDevice(cl_device_id device) except *
 cdef void WaitForEvents(size_t num_events, cl_event* event_list) except *
+cdef void EnqueueMarkerWithWaitList(
+    cl_command_queue command_queue,
+    cl_uint num_events_in_wait_list,
+    cl_event* event_wait_list,
+    cl_event* event) except *
+cdef void EnqueueBarrierWithWaitList(
+    cl_command_queue command_queue,
+    cl_uint num_events_in_wait_list,
+    cl_event* event_wait_list,
+    cl_event* event) except *
+cdef void GetEventInfo(
+    cl_event event,
+    cl_event_info param_name,
+    size_t param_value_size,
+    void* param_value) except *
+cdef void GetEventProfilingInfo(
+    cl_event event,
+    cl_profiling_info param_name,
+    size_t param_value_size,
+    void* param_value) except *
+cdef void SetEventCallback(
+    cl_event event,
+    cl_int command_exec_callback_type,
+    void* pfn_notify,
+    void* user_data) except *
+cdef void RetainEvent(cl_event event) except *
+cdef void ReleaseEvent(cl_event event) except *
@@ -31,6 +31,22 @@ cdef cl_uint GetDeviceIDs(cl_platform_id platform,
     exceptions.check_status(status)
     return num_devices
 
+cdef cl_uint CreateSubDevices(
+        cl_device_id in_device,
+        cl_device_partition_property* properties,
+        size_t num_devices,
+        cl_device_id* out_devices) except *:
+    cdef cl_uint num_devices_ret
+    cdef cl_int status
+    status = clCreateSubDevices(
+        in_device,
+        <const cl_device_partition_property*>properties,
+        <cl_uint>num_devices,
+        out_devices,
+        &num_devices_ret)
+    exceptions.check_status(status)
+    return num_devices_ret
+
 cdef cl_context CreateContext(
         cl_context_properties* properties,
         size_t num_devices,
@@ -94,6 +110,25 @@ cdef cl_program CreateProgramWithSource(
     exceptions.check_status(status)
     return program
 
+cdef cl_program CreateProgramWithBinary(
+        cl_context context,
+        cl_uint num_devices,
+        cl_device_id* device_list,
+        size_t* lengths,
+        unsigned char** binaries) except *:
+
+    cdef cl_int status
+    cdef cl_program program = clCreateProgramWithBinary(
+        context,
+        <cl_uint>num_devices,
+        <const cl_device_id*>device_list,
+        <const size_t*>lengths,
+        <const unsigned char**>binaries,
+        <cl_int*>NULL,
+        &status)
+    exceptions.check_status(status)
+    return program
+
 cdef void BuildProgram(
         cl_program program,
         cl_uint num_devices,
@@ -102,15 +137,69 @@ cdef void BuildProgram(
         void* pfn_notify,
         void* user_data) except *:
 
-    cdef cl_int status = clBuildProgram(
-        program,
-        <cl_uint>num_devices,
-        <const cl_device_id*>device_list,
-        <const char*>options,
-        <void(*)(cl_program, void*)>pfn_notify,
-        <void*>user_data)
+    cdef cl_int status
+    # building may take long, so other threads can run meanwhile
+    with nogil:
+        status = clBuildProgram(
+            program,
+            <cl_uint>num_devices,
+            <const cl_device_id*>device_list,
+            <const char*>options,
+            <void(*)(cl_program, void*)>pfn_notify,
+            <void*>user_data)
+    exceptions.check_status(status)
+
+cdef void CompileProgram(
+        cl_program program,
+        cl_uint num_devices,
+        cl_device_id* device_list,
+        char* options,
+        cl_uint num_input_headers,
+        cl_program* input_headers,
+        char** header_include_names,
+        void* pfn_notify,
+        void* user_data) except *:
+
+    cdef cl_int status
+    with nogil:
+        status = clCompileProgram(
+            program,
+            <cl_uint>num_devices,
+            <const cl_device_id*>device_list,
+            <const char*>options,
+            <cl_uint>num_input_headers,
+            <const cl_program*>input_headers,
+            <const char**>header_include_names,
+            <void(*)(cl_program, void*)>pfn_notify,
+            <void*>user_data)
     exceptions.check_status(status)
 
+cdef cl_program LinkProgram(
+        cl_context context,
+        cl_uint num_devices,
+        cl_device_id* device_list,
+        char* options,
+        cl_uint num_input_programs,
+        cl_program* input_programs,
+        void* pfn_notify,
+        void* user_data) except *:
+
+    cdef cl_int status
+    cdef cl_program program
+    with nogil:
+        program = clLinkProgram(
+            context,
+            <cl_uint>num_devices,
+            <const cl_device_id*>device_list,
+            <const char*>options,
+            <cl_uint>num_input_programs,
+            <const cl_program*>input_programs,
+            <void(*)(cl_program, void*)>pfn_notify,
+            <void*>user_data,
+            &status)
+    exceptions.check_status(status)
+    return program
+
 cdef cl_kernel CreateKernel(cl_program program, char* kernel_name):
     cdef cl_int status
     cdef cl_kernel kernel = clCreateKernel(
@@ -175,16 +264,20 @@ cdef void EnqueueReadBuffer(
         cl_uint num_events_in_wait_list,
         cl_event* event_wait_list,
         cl_event* event) except *:
-    cdef cl_int status = clEnqueueReadBuffer(
-        command_queue,
-        buffer,
-        <cl_bool>blocking_read,
-        <size_t>offset,
-        <size_t>cb,
-        host_ptr,
-        <cl_uint>num_events_in_wait_list,
-        <const cl_event *>event_wait_list,
-        event)
+    cdef cl_int status
+    cdef cl_bool blocking = <cl_bool>blocking_read
+    # a blocking transfer waits for the preceding commands without GIL
+    with nogil:
+        status = clEnqueueReadBuffer(
+            command_queue,
+            buffer,
+            blocking,
+            <size_t>offset,
+            <size_t>cb,
+            host_ptr,
+            <cl_uint>num_events_in_wait_list,
+            <const cl_event *>event_wait_list,
+            event)
     exceptions.check_status(status)
 
 cdef void EnqueueWriteBuffer(
@@ -197,16 +290,20 @@ cdef void EnqueueWriteBuffer(
         cl_uint num_events_in_wait_list,
         cl_event* event_wait_list,
         cl_event* event) except *:
-    cdef cl_int status = clEnqueueWriteBuffer(
-        command_queue,
-        buffer,
-        <cl_bool>blocking_write,
-        <size_t>offset,
-        <size_t>cb,
-        host_ptr,
-        <cl_uint>num_events_in_wait_list,
-        <const cl_event *>event_wait_list,
-        event)
+    cdef cl_int status
+    cdef cl_bool blocking = <cl_bool>blocking_write
+    # a blocking transfer waits for the preceding commands without GIL
+    with nogil:
+        status = clEnqueueWriteBuffer(
+            command_queue,
+            buffer,
+            blocking,
+            <size_t>offset,
+            <size_t>cb,
+            host_ptr,
+            <cl_uint>num_events_in_wait_list,
+            <const cl_event *>event_wait_list,
+            event)
     exceptions.check_status(status)
 
 cdef void EnqueueCopyBuffer(
@@ -231,11 +328,80 @@ cdef void EnqueueCopyBuffer(
         event)
     exceptions.check_status(status)
 
+cdef void EnqueueFillBuffer(
+        cl_command_queue command_queue,
+        cl_mem buffer,
+        void* pattern,
+        size_t pattern_size,
+        size_t offset,
+        size_t size,
+        cl_uint num_events_in_wait_list,
+        cl_event* event_wait_list,
+        cl_event* event) except *:
+    cdef cl_int status = clEnqueueFillBuffer(
+        command_queue,
+        buffer,
+        <const void*>pattern,
+        pattern_size,
+        offset,
+        size,
+        num_events_in_wait_list,
+        <const cl_event *>event_wait_list,
+        event)
+    exceptions.check_status(status)
+
+cdef void* EnqueueMapBuffer(
+        cl_command_queue command_queue,
+        cl_mem buffer,
+        blocking_map,
+        size_t map_flags,
+        size_t offset,
+        size_t size,
+        cl_uint num_events_in_wait_list,
+        cl_event* event_wait_list,
+        cl_event* event) except *:
+    cdef cl_bool blocking = <cl_bool>blocking_map
+    cdef cl_int status
+    cdef void* mapped_ptr
+    with nogil:
+        mapped_ptr = clEnqueueMapBuffer(
+            command_queue,
+            buffer,
+            blocking,
+            <cl_map_flags>map_flags,
+            offset,
+            size,
+            num_events_in_wait_list,
+            <const cl_event *>event_wait_list,
+            event,
+            &status)
+    exceptions.check_status(status)
+    return mapped_ptr
+
+cdef void EnqueueUnmapMemObject(
+        cl_command_queue command_queue,
+        cl_mem memobj,
+        void* mapped_ptr,
+        cl_uint num_events_in_wait_list,
+        cl_event* event_wait_list,
+        cl_event* event) except *:
+    cdef cl_int status = clEnqueueUnmapMemObject(
+        command_queue,
+        memobj,
+        mapped_ptr,
+        num_events_in_wait_list,
+        <const cl_event *>event_wait_list,
+        event)
+    exceptions.check_status(status)
+
 cdef void Flush(cl_command_queue command_queue) except *:
     exceptions.check_status(clFlush(command_queue))
 
 cdef void Finish(cl_command_queue command_queue) except *:
-    exceptions.check_status(clFinish(command_queue))
+    cdef cl_int status
+    with nogil:
+        status = clFinish(command_queue)
+    exceptions.check_status(status)
 
 cdef void ReleaseKernel(cl_kernel kernel) except *:
     exceptions.check_status(clReleaseKernel(kernel))
@@ -252,8 +418,82 @@ cdef void ReleaseCommandQueue(cl_command_queue command_queue) except *:
 cdef void ReleaseContext(cl_context context) except *:
     exceptions.check_status(clReleaseContext(context))
 
+cdef void ReleaseDevice(cl_device_id device) except *:
+    exceptions.check_status(clReleaseDevice(device))
+
 cdef void WaitForEvents(size_t num_events, cl_event* event_list) except *:
-    exceptions.check_status(clWaitForEvents(<cl_uint>num_events, event_list))
+    cdef cl_int status
+    with nogil:
+        status = clWaitForEvents(<cl_uint>num_events, event_list)
+    exceptions.check_status(status)
+
+cdef void EnqueueMarkerWithWaitList(
+        cl_command_queue command_queue,
+        cl_uint num_events_in_wait_list,
+        cl_event* event_wait_list,
+        cl_event* event) except *:
+    cdef cl_int status = clEnqueueMarkerWithWaitList(
+        command_queue,
+        num_events_in_wait_list,
+        event_wait_list,
+        event)
+    exceptions.check_status(status)
+
+cdef void EnqueueBarrierWithWaitList(
+        cl_command_queue command_queue,
+        cl_uint num_events_in_wait_list,
+        cl_event* event_wait_list,
+        cl_event* event) except *:
+    cdef cl_int status = clEnqueueBarrierWithWaitList(
+        command_queue,
+        num_events_in_wait_list,
+        event_wait_list,
+        event)
+    exceptions.check_status(status)
+
+cdef void GetEventInfo(
+        cl_event event,
+        cl_event_info param_name,
+        size_t param_value_size,
+        void* param_value) except *:
+    cdef cl_int status = clGetEventInfo(
+        event,
+        param_name,
+        param_value_size,
+        param_value,
+        <size_t*>NULL)
+    exceptions.check_status(status)
+
+cdef void GetEventProfilingInfo(
+        cl_event event,
+        cl_profiling_info param_name,
+        size_t param_value_size,
+        void* param_value) except *:
+    cdef cl_int status = clGetEventProfilingInfo(
+        event,
+        param_name,
+        param_value_size,
+        param_value,
+        <size_t*>NULL)
+    exceptions.check_status(status)
+
+cdef void SetEventCallback(
+        cl_event event,
+        cl_int command_exec_callback_type,
+        void* pfn_notify,
+        void* user_data) except *:
+    cdef cl_int status = clSetEventCallback(
+        event,
+        command_exec_callback_type,
+        <void(*)(cl_event, cl_int, void*)>pfn_notify,
+        user_data)
+    exceptions.check_status(status)
+
+cdef void RetainEvent(cl_event event) except *:
+    exceptions.check_status(clRetainEvent(event))
+
+cdef void ReleaseEvent(cl_event event) except *:
+    exceptions.check_status(clReleaseEvent(event))
 
 TRUE = CL_TRUE
 FALSE = CL_FALSE
@@ -261,5 +501,19 @@ BLOCKING = CL_BLOCKING
 NON_BLOCKING = CL_NON_BLOCKING
 
 MEM_READ_WRITE = CL_MEM_READ_WRITE
+MEM_ALLOC_HOST_PTR = CL_MEM_ALLOC_HOST_PTR
+MEM_USE_HOST_PTR = CL_MEM_USE_HOST_PTR
+
+MAP_READ = CL_MAP_READ
+MAP_WRITE = CL_MAP_WRITE
 
 BUFFER_CREATE_TYPE_REGION = CL_BUFFER_CREATE_TYPE_REGION
+
+MEM_OBJECT_ALLOCATION_FAILURE = CL_MEM_OBJECT_ALLOCATION_FAILURE
+OUT_OF_RESOURCES = CL_OUT_OF_RESOURCES
+OUT_OF_HOST_MEMORY = CL_OUT_OF_HOST_MEMORY
+
+PROFILING_COMMAND_QUEUED = CL_PROFILING_COMMAND_QUEUED
+PROFILING_COMMAND_SUBMIT = CL_PROFILING_COMMAND_SUBMIT
+PROFILING_COMMAND_START = CL_PROFILING_COMMAND_START
+PROFILING_COMMAND_END = CL_PROFILING_COMMAND_END
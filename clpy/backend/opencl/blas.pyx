@@ -4,6 +4,8 @@ import sys
 
 import numpy
 
+from clpy.backend cimport device
+from clpy.backend cimport profiler
 import clpy.backend.opencl
 cimport clpy.backend.opencl.api
 cimport clpy.backend.opencl.utility
@@ -13,9 +15,28 @@ import clpy.backend.opencl.types
 cimport clpy.backend.opencl.types
 from clpy.backend.opencl.types cimport cl_event
 
-_local_work_size = 16  # TODO(tomoya.sakai): GetDeviceInfo
+_max_local_work_size = 16
 _work_per_thread = 2
 
+
+cdef Py_ssize_t _get_local_work_size() except -1:
+    """Returns the tile size of sgemm for the current device.
+
+    It is halved from ``_max_local_work_size`` until a work-group of
+    ``size * size / _work_per_thread`` work-items and two float tiles of
+    ``size * size`` in the local memory fit the device.
+    """
+    cdef device.DeviceInfo info = device.get_device_info()
+    cdef Py_ssize_t size = _max_local_work_size
+    while size > _work_per_thread and (
+            size * size // _work_per_thread > info.max_work_group_size or
+            size > info.max_work_item_sizes[0] or
+            size // _work_per_thread > info.max_work_item_sizes[1] or
+            2 * size * size * sizeof(float) > info.local_mem_size):
+        size //= 2
+    return size
+
+
 cdef void SetKernelArgWithScalarValue(
         clpy.backend.opencl.types.cl_kernel kernel,
         arg_index, _arg_value):
@@ -76,12 +97,11 @@ cpdef sgemm(transa, transb, m, n, k, alpha, A, lda, B, ldb, beta, C, ldc):
         raise ValueError("transb should be n(0) or t(1)")
 
     cdef size_t program_sizet \
-        = _sgemm_kernel[(name, alpha == 0.0, beta == 0.0)]
+        = _get_sgemm_kernel(name, alpha == 0.0, beta == 0.0)
     cdef clpy.backend.opencl.types.cl_program program \
         = <clpy.backend.opencl.types.cl_program>program_sizet
     cdef clpy.backend.opencl.types.cl_kernel kernel \
-        = clpy.backend.opencl.api.CreateKernel(program=program,
-                                               kernel_name=b'dot_kernel')
+        = clpy.backend.opencl.utility.GetCachedKernel(program, b'dot_kernel')
     SetKernelArgWithScalarValue(kernel, 0, m)
     SetKernelArgWithScalarValue(kernel, 1, n)
     SetKernelArgWithScalarValue(kernel, 2, k)
@@ -106,14 +126,16 @@ cpdef sgemm(transa, transb, m, n, k, alpha, A, lda, B, ldb, beta, C, ldc):
     SetKernelArgWithScalarValue(kernel, 13,
                                 C.data.cl_mem_offset() // C.itemsize)
 
+    cdef Py_ssize_t local_work_size = _get_local_work_size()
     cdef size_t lws[2]
-    lws[0] = _local_work_size
-    lws[1] = _local_work_size / _work_per_thread
+    lws[0] = local_work_size
+    lws[1] = local_work_size / _work_per_thread
 
     cdef size_t gws[2]
-    gws[0] = computeGlobalWorkItemSize(m, _local_work_size)
-    gws[1] = computeGlobalWorkItemSize(n, _local_work_size) / _work_per_thread
+    gws[0] = computeGlobalWorkItemSize(m, local_work_size)
+    gws[1] = computeGlobalWorkItemSize(n, local_work_size) / _work_per_thread
 
+    cdef cl_event event = NULL
     clpy.backend.opencl.utility.RunNDRangeKernel(
         command_queue=clpy.backend.opencl.env.get_command_queue(),
         kernel=kernel,
@@ -122,7 +144,9 @@ cpdef sgemm(transa, transb, m, n, k, alpha, A, lda, B, ldb, beta, C, ldc):
         global_work_size=&gws[0],
         local_work_size=&lws[0],
         num_events_in_wait_list=0,
-        event_wait_list=<cl_event*>NULL)
+        event_wait_list=<cl_event*>NULL,
+        event=profiler.event_ptr(&event))
+    profiler.record(event, 'sgemm', 'blas')
 
 cpdef size_t _generate_sgemm_kernel(transa, transb, alphaIsZero, betaIsZero):
     if transa == 'n' or transa == 0:
@@ -231,24 +255,31 @@ cpdef size_t _generate_sgemm_kernel(transa, transb, alphaIsZero, betaIsZero):
     ''').substitute(alpha_expr=alpha_expr,
                     beta_expr=beta_expr,
                     typeof_size=clpy.backend.opencl.types.device_typeof_size,
-                    local_work_size=str(_local_work_size),
+                    local_work_size=str(_get_local_work_size()),
                     work_per_thread=str(_work_per_thread)).encode('utf-8')
 
     cdef clpy.backend.opencl.types.cl_program program \
         = clpy.backend.opencl.utility.CreateProgram(
             sources=[dot_kernel_source],
             context=clpy.backend.opencl.env.get_context(),
-            num_devices=clpy.backend.opencl.env.num_devices,
+            num_devices=1,
             devices_ptrs=clpy.backend.opencl.env.get_devices_ptrs())
     return <size_t>program
 
-_sgemm_kernel = {
-    (name, alphaIsZero, betaIsZero):
-        _generate_sgemm_kernel(name[0], name[1], alphaIsZero, betaIsZero)
-    for name in ['nn', 'nt', 'tn', 'tt']
-    for betaIsZero in [False, True]
-    for alphaIsZero in [False, True]
-}
+# programs keyed by the device ID, the transpositions and whether alpha and
+# beta are zero, which are built on the first call for each device
+_sgemm_kernel = {}
+
+
+cdef size_t _get_sgemm_kernel(name, alphaIsZero, betaIsZero) except? 0:
+    key = (clpy.backend.opencl.env.get_current_device_id(),
+           name, alphaIsZero, betaIsZero)
+    program = _sgemm_kernel.get(key)
+    if program is None:
+        program = _generate_sgemm_kernel(
+            name[0], name[1], alphaIsZero, betaIsZero)
+        _sgemm_kernel[key] = program
+    return program
 
 
 def sgeam(transa, transb, m, n, alpha, A, lda, beta, B, ldb, C, ldc):
@@ -274,13 +305,11 @@ def sgeam(transa, transb, m, n, alpha, A, lda, beta, B, ldb, C, ldc):
         raise ValueError("transb should be n(0) or t(1)")
 
     cdef size_t program_sizet \
-        = _sgeam_kernel[(name, alpha == 0.0, beta == 0.0)]
+        = _get_sgeam_kernel(name, alpha == 0.0, beta == 0.0)
     cdef clpy.backend.opencl.types.cl_program program \
         = <clpy.backend.opencl.types.cl_program>program_sizet
     cdef clpy.backend.opencl.types.cl_kernel kernel \
-        = clpy.backend.opencl.api.CreateKernel(
-            program=program,
-            kernel_name=b'geam_kernel')
+        = clpy.backend.opencl.utility.GetCachedKernel(program, b'geam_kernel')
     SetKernelArgWithScalarValue(kernel, 0, m)
     SetKernelArgWithScalarValue(kernel, 1, n)
     SetKernelArgWithScalarValue(kernel, 2, alpha)
@@ -308,6 +337,7 @@ def sgeam(transa, transb, m, n, alpha, A, lda, beta, B, ldb, C, ldc):
     gws[0] = m
     gws[1] = n
 
+    cdef cl_event event = NULL
     clpy.backend.opencl.utility.RunNDRangeKernel(
         command_queue=clpy.backend.opencl.env.get_command_queue(),
         kernel=kernel,
@@ -316,7 +346,9 @@ def sgeam(transa, transb, m, n, alpha, A, lda, beta, B, ldb, C, ldc):
         global_work_size=&gws[0],
         local_work_size=<size_t*>NULL,
         num_events_in_wait_list=0,
-        event_wait_list=<cl_event*>NULL)
+        event_wait_list=<cl_event*>NULL,
+        event=profiler.event_ptr(&event))
+    profiler.record(event, 'sgeam', 'blas')
 
 cpdef size_t _generate_sgeam_kernel(transa, transb, alphaIsZero, betaIsZero):
     if transa == 'n' or transa == 0:
@@ -378,15 +410,22 @@ cpdef size_t _generate_sgeam_kernel(transa, transb, alphaIsZero, betaIsZero):
         = clpy.backend.opencl.utility.CreateProgram(
             sources=[geam_kernel_source],
             context=clpy.backend.opencl.env.get_context(),
-            num_devices=clpy.backend.opencl.env.num_devices,
+            num_devices=1,
             devices_ptrs=clpy.backend.opencl.env.get_devices_ptrs())
 
     return <size_t>program
 
-_sgeam_kernel = {
-    (name, alphaIsZero, betaIsZero):
-        _generate_sgeam_kernel(name[0], name[1], alphaIsZero, betaIsZero)
-    for name in ['nn', 'nt', 'tn', 'tt']
-    for betaIsZero in [False, True]
-    for alphaIsZero in [False, True]
-}
+# programs keyed by the device ID, the transpositions and whether alpha and
+# beta are zero, which are built on the first call for each device
+_sgeam_kernel = {}
+
+
+cdef size_t _get_sgeam_kernel(name, alphaIsZero, betaIsZero) except? 0:
+    key = (clpy.backend.opencl.env.get_current_device_id(),
+           name, alphaIsZero, betaIsZero)
+    program = _sgeam_kernel.get(key)
+    if program is None:
+        program = _generate_sgeam_kernel(
+            name[0], name[1], alphaIsZero, betaIsZero)
+        _sgeam_kernel[key] = program
+    return program
@@ -1,6 +1,22 @@
 include "common_decl.pxi"
 
-cdef cl_context get_context()
-cdef cl_command_queue get_command_queue()
-cdef cl_device_id* get_devices_ptrs()
-cdef cl_device_id get_primary_device()
+cdef cl_context get_context() except? NULL
+cdef cl_command_queue get_command_queue() except? NULL
+cdef cl_command_queue get_default_command_queue() except? NULL
+cdef cl_command_queue to_command_queue(size_t ptr) except? NULL
+cdef cl_device_id* get_devices_ptrs() except? NULL
+cdef cl_device_id get_primary_device() except? NULL
+cdef cl_device_id get_device(int device_id) except? NULL
+cdef cl_command_queue get_device_command_queue(int device_id) except? NULL
+cpdef int get_device_count() except *
+cpdef int get_current_device_id() except *
+cpdef set_current_device_id(int device_id)
+cpdef bint is_per_thread_default_queue_enabled()
+cpdef bint is_queue_profiling_enabled()
+cpdef list create_sub_devices(int device_id, int equally=*, counts=*)
+cpdef int get_parent_device_id(int device_id) except? -2
+cpdef size_t create_command_queue(bint profiling=*) except? 0
+cpdef release_command_queue(size_t command_queue)
+cpdef _add_release_hook(hook)
+cpdef size_t get_current_command_queue()
+cpdef set_current_command_queue(size_t command_queue)
@@ -1,89 +1,597 @@
 # -*- coding: utf-8 -*-
 import atexit
 import logging
+import os
+import threading
+
+from libc.stdlib cimport free
+from libc.stdlib cimport malloc
 
 from clpy.backend.opencl cimport api
+import clpy.backend.opencl.exceptions
+
+
+cdef class _DeviceEnv:
+
+    """OpenCL objects of a device.
+
+    Each device has its own context and default command queue, so that
+    devices of different platforms can be used at the same time. They are
+    created on the first use of the device.
+    """
+
+    cdef:
+        cl_platform_id platform
+        cl_device_id device[1]
+        cl_context context
+        cl_command_queue command_queue
+        # ID of the device partitioned into this device, or -1
+        int parent_id
+
+
+# serializes the enumeration of the devices and the creation of contexts
+_init_lock = threading.RLock()
+
+# If true, all command queues are created with profiling enabled. It is
+# decided before any queue is created, since a queue cannot be replaced while
+# other threads use it.
+cdef bint _queue_profiling = (
+    os.environ.get('CLPY_QUEUE_PROFILING') == '1' or
+    os.environ.get('CLPY_AUTOTUNE') == '1')
+
+
+cdef _DeviceEnv _new_device_env(cl_platform_id platform, cl_device_id device,
+                                int parent_id):
+    cdef _DeviceEnv device_env = _DeviceEnv()
+    device_env.platform = platform
+    device_env.device[0] = device
+    device_env.parent_id = parent_id
+    return device_env
+
+
+cdef _check_address_bits(cl_device_id device):
+    # Kernels are generated with the size_t of the host.
+    cdef cl_uint bits
+    clpy.backend.opencl.exceptions.check_status(api.clGetDeviceInfo(
+        device, CL_DEVICE_ADDRESS_BITS, sizeof(cl_uint), &bits, NULL))
+    if bits != sizeof(Py_ssize_t) * 8:
+        raise RuntimeError("Host's size_t is different from device's size_t.")
+
+
+cdef _init_device_env(_DeviceEnv device_env):
+    cdef cl_command_queue_properties properties = 0
+    cdef cl_context context
+    if _queue_profiling:
+        properties |= CL_QUEUE_PROFILING_ENABLE
+    with _init_lock:
+        if device_env.context != NULL:
+            return
+        _check_address_bits(device_env.device[0])
+        logging.info("Create context...", end='')
+        context = api.CreateContext(
+            properties=<cl_context_properties*>NULL,
+            num_devices=1,
+            devices=&device_env.device[0],
+            pfn_notify=<void*>NULL,
+            user_data=<void*>NULL)
+        logging.info("SUCCESS")
+        logging.info("Create command_queue...", end='')
+        device_env.command_queue = api.CreateCommandQueue(
+            context, device_env.device[0], properties)
+        logging.info("SUCCESS")
+        # set at last, since the context is checked without the lock
+        device_env.context = context
+
+
+_device_types = {
+    'default': CL_DEVICE_TYPE_DEFAULT,
+    'cpu': CL_DEVICE_TYPE_CPU,
+    'gpu': CL_DEVICE_TYPE_GPU,
+    'accelerator': CL_DEVICE_TYPE_ACCELERATOR,
+    'all': CL_DEVICE_TYPE_ALL,
+}
+
+
+cdef cl_device_type _get_device_type() except? 0:
+    value = os.environ.get('CLPY_DEVICE_TYPE', 'all')
+    cdef cl_device_type device_type = 0
+    for name in value.lower().split(','):
+        name = name.strip()
+        if name not in _device_types:
+            raise ValueError('Invalid CLPY_DEVICE_TYPE: %s' % value)
+        device_type |= _device_types[name]
+    return device_type
+
+
+cdef str _get_platform_info(cl_platform_id platform,
+                            cl_platform_info param_name):
+    cdef size_t length
+    clpy.backend.opencl.exceptions.check_status(api.clGetPlatformInfo(
+        platform, param_name, 0, NULL, &length))
+    cdef char* info = <char*>malloc(length)
+    if info == NULL:
+        raise MemoryError()
+    try:
+        clpy.backend.opencl.exceptions.check_status(api.clGetPlatformInfo(
+            platform, param_name, length, info, NULL))
+        return info[:length].rstrip(b'\0').decode('utf-8', 'replace')
+    finally:
+        free(info)
+
+
+cdef bint _match_platform(cl_uint index, cl_platform_id platform,
+                          str selector) except *:
+    if selector.isdigit():
+        return index == int(selector)
+    selector = selector.lower()
+    return (selector in _get_platform_info(
+        platform, CL_PLATFORM_NAME).lower() or
+        selector in _get_platform_info(platform, CL_PLATFORM_VENDOR).lower())
+
+
+cdef list _get_platform_devices(cl_platform_id platform,
+                                cl_device_type device_type):
+    cdef cl_uint n
+    try:
+        n = api.GetDeviceIDs(platform, device_type, 0, <cl_device_id*>NULL)
+    except clpy.backend.opencl.exceptions.OpenCLRuntimeError as e:
+        if e.status == CL_DEVICE_NOT_FOUND:
+            return []
+        raise
+    cdef cl_uint i
+    cdef list ret = []
+    cdef cl_device_id* devices = <cl_device_id*>malloc(
+        sizeof(cl_device_id) * n)
+    if devices == NULL:
+        raise MemoryError()
+    try:
+        api.GetDeviceIDs(platform, device_type, n, devices)
+        for i in range(n):
+            ret.append(<size_t>devices[i])
+        return ret
+    finally:
+        free(devices)
+
+
 ##########################################
 # Initialization
 ##########################################
 
-logging.info("Get num_platforms...", end='')
-cdef cl_uint num_platforms = api.GetPlatformIDs(0, <cl_platform_id*>NULL)
-logging.info("SUCCESS")
-logging.info("%d platform(s) found" % num_platforms)
-
-logging.info("Get the first platform...", end='')
-cdef cl_platform_id[1] __platforms_ptr
-num_platforms = api.GetPlatformIDs(1, &__platforms_ptr[0])
-cdef cl_platform_id primary_platform = __platforms_ptr[0]
-logging.info("SUCCESS")
-
-logging.info("Get num_devices...", end='')
-cdef cl_uint __num_devices = api.GetDeviceIDs(
-    primary_platform,
-    CL_DEVICE_TYPE_DEFAULT,
-    0,
-    <cl_device_id*>NULL)
-logging.info("SUCCESS")
-logging.info("%d device(s) found" % __num_devices)
-
-# clpy now supports only one device.
-__num_devices = 1
-
-logging.info("Get the first device...", end='')
-cdef cl_device_id[1] __devices_ptr
-api.GetDeviceIDs(
-    primary_platform,
-    1,
-    __num_devices,
-    &__devices_ptr[0])
-num_devices = __num_devices     # provide as pure python interface
-cdef cl_device_id __primary_device = __devices_ptr[0]
-logging.info("SUCCESS")
-
-logging.info("Create context...", end='')
-cdef cl_context __context = api.CreateContext(
-    properties=<cl_context_properties*>NULL,
-    num_devices=__num_devices,
-    devices=&__devices_ptr[0],
-    pfn_notify=<void*>NULL,
-    user_data=<void*>NULL)
-logging.info("SUCCESS")
-
-logging.info("Create command_queue...", end='')
-cdef cl_command_queue __command_queue \
-    = api.CreateCommandQueue(__context, __devices_ptr[0], 0)
-logging.info("SUCCESS")
-
-cdef cl_context get_context():
-    return __context
-
-cdef cl_command_queue get_command_queue():
-    return __command_queue
-
-cdef cl_device_id* get_devices_ptrs():
-    return &__devices_ptr[0]
-
-cdef cl_device_id get_primary_device():
-    return __primary_device
+# _DeviceEnv of all devices, whose indices are the device IDs. The devices
+# are enumerated on the first use, so that importing clpy does not touch
+# OpenCL.
+cdef list _devices = None
+
+
+cdef _init_devices():
+    """Enumerates the devices.
+
+    The platforms are selected by ``CLPY_PLATFORM``, which is an index of the
+    platform or a case-insensitive substring of its name or vendor, and the
+    devices are selected by ``CLPY_DEVICE_TYPE``, which is a comma-separated
+    list of ``default``, ``cpu``, ``gpu``, ``accelerator`` and ``all``. All
+    devices of all platforms are used by default.
+    """
+    global _devices
+    platform_selector = os.environ.get('CLPY_PLATFORM')
+    cdef cl_device_type device_type = _get_device_type()
+
+    logging.info("Get num_platforms...", end='')
+    cdef cl_uint num_platforms = api.GetPlatformIDs(
+        0, <cl_platform_id*>NULL)
+    logging.info("SUCCESS")
+    logging.info("%d platform(s) found" % num_platforms)
+
+    cdef cl_uint i
+    cdef list devices = []
+    cdef cl_platform_id* platforms = <cl_platform_id*>malloc(
+        sizeof(cl_platform_id) * num_platforms)
+    if platforms == NULL:
+        raise MemoryError()
+    try:
+        api.GetPlatformIDs(num_platforms, platforms)
+        for i in range(num_platforms):
+            if platform_selector and not _match_platform(
+                    i, platforms[i], platform_selector):
+                continue
+            for device in _get_platform_devices(platforms[i], device_type):
+                devices.append(_new_device_env(
+                    platforms[i], <cl_device_id><size_t>device, -1))
+    finally:
+        free(platforms)
+    if not devices:
+        raise RuntimeError(
+            'No OpenCL device is found (CLPY_PLATFORM=%s, '
+            'CLPY_DEVICE_TYPE=%s)' % (
+                platform_selector, os.environ.get('CLPY_DEVICE_TYPE')))
+    logging.info("%d device(s) found" % len(devices))
+    _devices = devices
+
+
+cdef inline list _get_devices():
+    if _devices is None:
+        with _init_lock:
+            if _devices is None:
+                _init_devices()
+    return _devices
+
+
+cdef object _thread_local = threading.local()
+# command queues created by create_command_queue, which are not released yet,
+# and their device IDs
+cdef dict _command_queues = {}
+# functions called with the pointer and the device ID of a command queue
+# created by create_command_queue when it is released
+cdef list _release_hooks = []
+
+# If true, each thread has its own default command queues, so that commands
+# of threads do not serialize on one in-order queue.
+cdef bint _per_thread_default_queue = (
+    os.environ.get('CLPY_PER_THREAD_DEFAULT_QUEUE') == '1')
+
+
+cdef class _ThreadDefaultQueues:
+
+    """Default command queues of a thread keyed by the device IDs.
+
+    The queues are created lazily and released when the thread terminates.
+    """
+
+    cdef dict queues
+
+    def __init__(self):
+        self.queues = {}
+
+    def __dealloc__(self):
+        if _command_queues is None:
+            # the module is already finalized
+            return
+        for command_queue in self.queues.values():
+            release_command_queue(command_queue)
+
+
+cdef cl_command_queue _get_default_queue(int device_id) except? NULL:
+    if not _per_thread_default_queue:
+        return _get_device_env(device_id).command_queue
+    cdef _ThreadDefaultQueues thread_queues
+    try:
+        thread_queues = _thread_local.default_queues
+    except AttributeError:
+        thread_queues = _ThreadDefaultQueues()
+        _thread_local.default_queues = thread_queues
+    command_queue = thread_queues.queues.get(device_id)
+    if command_queue is None:
+        command_queue = _create_command_queue(device_id, _queue_profiling)
+        thread_queues.queues[device_id] = command_queue
+    return <cl_command_queue><size_t>command_queue
+
+
+cpdef bint is_per_thread_default_queue_enabled():
+    """Returns ``True`` if each thread has its own default command queue.
+
+    It is enabled by setting ``CLPY_PER_THREAD_DEFAULT_QUEUE=1``. Then the
+    null stream of each thread is backed by a command queue created on the
+    first use in the thread, which shares the context and the memory pool
+    with the other threads. Commands of different threads may run
+    concurrently, so an array passed to another thread must be synchronized
+    by, e.g., :meth:`clpy.backend.Stream.synchronize` of the null stream.
+    """
+    return _per_thread_default_queue
+
+
+cpdef bint is_queue_profiling_enabled():
+    """Returns ``True`` if command queues are created with profiling enabled.
+
+    It is enabled by setting ``CLPY_QUEUE_PROFILING=1`` or
+    ``CLPY_AUTOTUNE=1``. Then the default command queues and the queues of
+    streams record the execution times of commands, which
+    :mod:`clpy.backend.profiler`, :mod:`clpy.backend.autotune` and
+    :func:`clpy.backend.get_elapsed_time` need. The profiling may slow down
+    the commands, so it is disabled by default.
+    """
+    return _queue_profiling
+
+
+cpdef int get_device_count() except *:
+    """Returns the number of the available devices.
+
+    The devices are enumerated on the first call, but their contexts are not
+    created.
+    """
+    return len(_get_devices())
+
+
+cpdef int get_current_device_id() except *:
+    """Returns the ID of the current device of the thread.
+
+    The first device of the first platform, whose ID is 0, is current by
+    default.
+    """
+    return getattr(_thread_local, 'device_id', 0)
+
+
+cpdef set_current_device_id(int device_id):
+    """Makes a device current in the thread.
+
+    Kernels, memory allocations and copies are issued to the context and the
+    command queue of the current device.
+
+    Args:
+        device_id (int): ID of the device, which is the index of the device
+            in all devices of all platforms.
+
+    """
+    _check_device_id(device_id)
+    _thread_local.device_id = device_id
+
+
+cdef _check_device_id(int device_id):
+    cdef list devices = _get_devices()
+    if not 0 <= device_id < len(devices):
+        raise ValueError('Invalid device ID: %d (%d device(s) found)'
+                         % (device_id, len(devices)))
+
+
+cdef inline _DeviceEnv _get_device_env(int device_id):
+    # the context and the default command queue are created on the first use
+    cdef _DeviceEnv device_env = <_DeviceEnv>_get_devices()[device_id]
+    if device_env.context == NULL:
+        _init_device_env(device_env)
+    return device_env
+
+
+cdef inline _DeviceEnv _get_current_device_env():
+    return _get_device_env(getattr(_thread_local, 'device_id', 0))
+
+
+cdef cl_context get_context() except? NULL:
+    return _get_current_device_env().context
+
+cdef cl_command_queue get_command_queue() except? NULL:
+    """Returns the command queue of the current stream of the thread."""
+    try:
+        return <cl_command_queue><size_t>_thread_local.command_queue
+    except AttributeError:
+        return _get_default_queue(get_current_device_id())
+
+cdef cl_command_queue get_default_command_queue() except? NULL:
+    return _get_default_queue(get_current_device_id())
+
+cdef cl_command_queue to_command_queue(size_t ptr) except? NULL:
+    # 0 stands for the default command queue like the null stream
+    if ptr == 0:
+        return _get_default_queue(get_current_device_id())
+    return <cl_command_queue>ptr
+
+cdef cl_device_id* get_devices_ptrs() except? NULL:
+    return &_get_current_device_env().device[0]
+
+cdef cl_device_id get_primary_device() except? NULL:
+    """Returns the current device of the thread."""
+    return _get_current_device_env().device[0]
+
+cdef cl_device_id get_device(int device_id) except? NULL:
+    # it does not create the context of the device
+    return (<_DeviceEnv>_get_devices()[device_id]).device[0]
+
+cdef cl_command_queue get_device_command_queue(int device_id) except? NULL:
+    """Returns the default command queue of the device for the thread."""
+    return _get_default_queue(device_id)
+
+
+cpdef list create_sub_devices(int device_id, int equally=0, counts=None):
+    """Partitions a device into sub-devices by ``clCreateSubDevices``.
+
+    Each sub-device gets its own context and default command queue like the
+    other devices on its first use, and its ID follows the IDs of the
+    existing devices.
+
+    Args:
+        device_id (int): ID of the device to be partitioned.
+        equally (int): Number of compute units of each sub-device. The
+            device is partitioned into as many sub-devices as possible.
+        counts (sequence of ints): Numbers of compute units of the
+            sub-devices. Either ``equally`` or ``counts`` must be given.
+
+    Returns:
+        list of int: IDs of the sub-devices.
+
+    """
+    _check_device_id(device_id)
+    cdef list devices_list = _get_devices()
+    cdef _DeviceEnv parent = <_DeviceEnv>devices_list[device_id]
+    cdef list properties
+    if (equally > 0) == (counts is not None):
+        raise ValueError('Either equally or counts must be specified')
+    if counts is None:
+        properties = [CL_DEVICE_PARTITION_EQUALLY, equally, 0]
+    else:
+        counts = list(counts)
+        if not counts or any(c <= 0 for c in counts):
+            raise ValueError('counts must be positive integers: %s'
+                             % (counts,))
+        properties = ([CL_DEVICE_PARTITION_BY_COUNTS] + counts +
+                      [CL_DEVICE_PARTITION_BY_COUNTS_LIST_END, 0])
+
+    cdef size_t n_properties = len(properties)
+    cdef cl_device_partition_property* properties_ptr = \
+        <cl_device_partition_property*>malloc(
+            sizeof(cl_device_partition_property) * n_properties)
+    if properties_ptr == NULL:
+        raise MemoryError()
+    cdef cl_uint i, n
+    cdef cl_device_id* devices = NULL
+    cdef list ret = []
+    try:
+        for i in range(n_properties):
+            properties_ptr[i] = <cl_device_partition_property>properties[i]
+        n = api.CreateSubDevices(
+            parent.device[0], properties_ptr, 0, <cl_device_id*>NULL)
+        devices = <cl_device_id*>malloc(sizeof(cl_device_id) * n)
+        if devices == NULL:
+            raise MemoryError()
+        api.CreateSubDevices(parent.device[0], properties_ptr, n, devices)
+        with _init_lock:
+            for i in range(n):
+                ret.append(len(devices_list))
+                devices_list.append(_new_device_env(
+                    parent.platform, devices[i], device_id))
+    finally:
+        free(properties_ptr)
+        free(devices)
+    return ret
+
+
+cpdef int get_parent_device_id(int device_id) except? -2:
+    """Returns the ID of the device partitioned into a sub-device.
+
+    It is -1 if the device is not a sub-device.
+    """
+    _check_device_id(device_id)
+    return (<_DeviceEnv>_get_devices()[device_id]).parent_id
+
+
+cpdef size_t create_command_queue(bint profiling=False) except? 0:
+    """Creates an in-order command queue on the current device.
+
+    Args:
+        profiling (bool): If ``True``, the profiling of commands is enabled.
+
+    Returns:
+        int: Pointer to the command queue.
+
+    """
+    return _create_command_queue(get_current_device_id(), profiling)
+
+
+cdef size_t _create_command_queue(int device_id, bint profiling) except? 0:
+    cdef cl_command_queue_properties properties = 0
+    if profiling:
+        properties |= CL_QUEUE_PROFILING_ENABLE
+    cdef _DeviceEnv device_env = _get_device_env(device_id)
+    cdef cl_command_queue command_queue = api.CreateCommandQueue(
+        device_env.context, device_env.device[0], properties)
+    _command_queues[<size_t>command_queue] = device_id
+    return <size_t>command_queue
+
+
+cpdef release_command_queue(size_t command_queue):
+    """Releases a command queue created by :func:`create_command_queue`.
+
+    It blocks until all commands of the queue are completed, so that the
+    memory used by them can be reused on the other queues. It does nothing
+    if the queue is already released.
+    """
+    device_id = _command_queues.pop(command_queue, None)
+    if device_id is not None:
+        api.Finish(<cl_command_queue>command_queue)
+        for hook in _release_hooks:
+            hook(command_queue, device_id)
+        api.ReleaseCommandQueue(<cl_command_queue>command_queue)
+
+
+cpdef _add_release_hook(hook):
+    """Registers a function called when a command queue is released.
+
+    The function takes the pointer and the device ID of the queue, whose
+    commands are all completed.
+    """
+    _release_hooks.append(hook)
+
+
+cdef list _initialized_device_envs():
+    cdef _DeviceEnv device_env
+    if _devices is None:
+        return []
+    return [device_env for device_env in _devices
+            if device_env.context != NULL]
+
+
+cpdef size_t get_current_command_queue():
+    """Returns the pointer of the current command queue of the thread.
+
+    It is 0 if the default command queue is current.
+    """
+    return getattr(_thread_local, 'command_queue', 0)
+
+
+cpdef set_current_command_queue(size_t command_queue):
+    """Makes a command queue current in the thread.
+
+    Kernels and memory copies are enqueued to the current command queue.
+
+    Args:
+        command_queue (int): Pointer to the command queue. The default command
+            queue is used if it is 0.
+
+    """
+    if command_queue == 0:
+        try:
+            del _thread_local.command_queue
+        except AttributeError:
+            pass
+    else:
+        _thread_local.command_queue = command_queue
+
+
+def flush(size_t command_queue=0):
+    """Issues all queued commands of the command queue to the device."""
+    api.Flush(to_command_queue(command_queue))
+
+
+def finish(size_t command_queue=0):
+    """Blocks until all commands in the command queue are completed."""
+    api.Finish(to_command_queue(command_queue))
+
+
+def finish_all(device_id=None):
+    """Blocks until all commands in all command queues are completed.
+
+    Args:
+        device_id (int): ID of the device whose command queues are waited
+            for. All devices are waited for by default.
+
+    """
+    cdef _DeviceEnv device_env
+    for i, device_env in enumerate(_devices or []):
+        if (device_id is None or i == device_id) and \
+                device_env.context != NULL:
+            api.Finish(device_env.command_queue)
+    for command_queue, queue_device_id in list(_command_queues.items()):
+        if device_id is None or queue_device_id == device_id:
+            api.Finish(<cl_command_queue><size_t>command_queue)
 
 
 def release():
     """Release command_queue and context automatically."""
+    cdef _DeviceEnv device_env
+    if _devices is None:
+        # OpenCL is not used
+        return
+    cdef list device_envs = _initialized_device_envs()
     logging.info("Flush...", end='')
-    api.Flush(__command_queue)
+    for device_env in device_envs:
+        api.Flush(device_env.command_queue)
     logging.info("SUCCESS")
 
     logging.info("Finish...", end='')
-    api.Finish(__command_queue)
+    for device_env in device_envs:
+        api.Finish(device_env.command_queue)
     logging.info("SUCCESS")
 
     logging.info("Release command queue...", end='')
-    api.ReleaseCommandQueue(__command_queue)
+    for command_queue in list(_command_queues):
+        release_command_queue(command_queue)
+    for device_env in device_envs:
+        api.ReleaseCommandQueue(device_env.command_queue)
     logging.info("SUCCESS")
 
     logging.info("Release context...", end='')
-    api.ReleaseContext(__context)
+    for device_env in _devices:
+        if device_env.context != NULL:
+            api.ReleaseContext(device_env.context)
+        if device_env.parent_id >= 0:
+            api.ReleaseDevice(device_env.device[0])
     logging.info("SUCCESS")
 
     # Release kernels, programs here if needed.
@@ -1,19 +1,14 @@
 # -*- coding: utf-8 -*-
 import cython
-cimport clpy.backend.opencl.utility
-import clpy.backend.opencl.env
-cimport clpy.backend.opencl.env
 
 cdef __device_typeof_size():
+    # Kernels are generated with the size_t of the host, and the address
+    # bits of each device are checked when its context is created, so that
+    # importing clpy does not initialize OpenCL.
     host_size_t_bits = cython.sizeof(Py_ssize_t)*8
-    device_address_bits = clpy.backend.opencl.utility.GetDeviceAddressBits(
-        clpy.backend.opencl.env.get_primary_device())
-    if host_size_t_bits != device_address_bits:
-        raise "Host's size_t is different from device's size_t."
-
-    if device_address_bits == 32:
+    if host_size_t_bits == 32:
         return 'uint'
-    elif device_address_bits == 64:
+    elif host_size_t_bits == 64:
         return 'ulong'
     else:
         raise "There is no type of size_t."
@@ -4,14 +4,62 @@ include "common_decl.pxi"
 # helpers
 cdef cl_uint GetDeviceMemBaseAddrAlign(cl_device_id device)
 cdef GetDeviceAddressBits(cl_device_id device)
+cdef cl_ulong GetDeviceGlobalMemSize(cl_device_id device) except *
+cdef bint GetDeviceHostUnifiedMemory(cl_device_id device) except *
+cdef cl_uint GetDeviceInfoUint(cl_device_id device,
+                               cl_device_info param_name) except? 0
+cdef cl_ulong GetDeviceInfoUlong(cl_device_id device,
+                                 cl_device_info param_name) except? 0
+cdef size_t GetDeviceInfoSizeT(cl_device_id device,
+                               cl_device_info param_name) except? 0
+cdef tuple GetDeviceMaxWorkItemSizes(cl_device_id device)
+cdef size_t GetKernelPreferredWorkGroupSizeMultiple(
+    cl_kernel kernel, cl_device_id device) except? 0
+cdef size_t GetKernelWorkGroupSize(
+    cl_kernel kernel, cl_device_id device) except? 0
+cdef dict GetDeviceCapabilities(cl_device_id device)
+cdef size_t GetPreferredWorkGroupSizeMultiple(
+    cl_context context, cl_device_id device) except? 0
+cdef str GetDeviceInfoString(cl_device_id device, cl_device_info param_name)
+cdef str GetPlatformInfoString(cl_platform_id platform,
+                               cl_platform_info param_name)
+cdef tuple GetDeviceIdentity(cl_device_id device)
 
 ###############################################################################
 # utility
 cdef void SetKernelArgLocalMemory(cl_kernel kernel, arg_index, size_t size)
+
+cdef class CachedKernel:
+    cdef:
+        cl_kernel kernel
+        object arg_plan
+        size_t work_group_size
+
+cdef CachedKernel GetCachedKernelEntry(cl_program program, bytes name)
+cdef cl_kernel GetCachedKernel(cl_program program, bytes name) except *
+cpdef ReleaseCachedKernels()
+cdef ReleaseCachedKernelsOfProgram(cl_program program)
 cdef is_valid_kernel_name(name)
 cdef cl_program CreateProgram(sources, cl_context context, num_devices,
                               cl_device_id* devices_ptrs,
-                              options=*) except *
+                              options=*, cl_program library=*) except *
+cdef cl_program CreateProgramFromSource(
+    sources, cl_context context, num_devices,
+    cl_device_id* devices_ptrs, options) except *
+cdef cl_program CompileProgramFromSource(
+    sources, cl_context context, num_devices,
+    cl_device_id* devices_ptrs, options) except *
+cdef cl_program LinkProgramWithLibrary(
+    sources, cl_context context, num_devices,
+    cl_device_id* devices_ptrs, options, cl_program library) except *
+cdef cl_program CreateLibrary(sources, cl_context context,
+                              cl_device_id device, options) except *
+cdef cl_program CreateLibraryFromBinary(
+    bytes binary, cl_context context, cl_device_id device) except *
+cdef cl_program CreateProgramFromBinary(
+    bytes binary, cl_context context, cl_device_id device,
+    options) except *
+cdef bytes GetProgramBinary(cl_program program)
 cdef GetProgramBuildLog(cl_program program)
 cdef RunNDRangeKernel(
     cl_command_queue command_queue,
@@ -21,4 +69,16 @@ cdef RunNDRangeKernel(
     size_t* global_work_size,
     size_t* local_work_size,
     cl_uint num_events_in_wait_list,
-    cl_event* event_wait_list)
+    cl_event* event_wait_list,
+    cl_event* event=*)
+
+###############################################################################
+# events
+cpdef size_t EnqueueMarker(size_t command_queue) except? 0
+cpdef EnqueueWaitForEvents(size_t command_queue, events)
+cpdef WaitForEvent(size_t event)
+cpdef ReleaseEvent(size_t event)
+cpdef bint IsEventComplete(size_t event) except *
+cpdef cl_ulong GetEventProfilingInfo(size_t event,
+                                     cl_profiling_info param_name) except? 0
+cpdef SetEventCallback(size_t event, callback)
@@ -1,12 +1,18 @@
+import atexit
 import os
 import re
 import tempfile
+import threading
 import time
+import weakref
 
 cimport api
 cimport env
 from cpython cimport array
+from cpython.ref cimport Py_DECREF
+from cpython.ref cimport Py_INCREF
 from exceptions cimport check_status
+from libc.stdlib cimport free
 from libc.stdlib cimport malloc
 from libc.string cimport memcpy
 
@@ -27,6 +33,32 @@ cdef cl_uint GetDeviceMemBaseAddrAlign(cl_device_id device):
     ret = valptrs[0]
     return ret
 
+cdef cl_ulong GetDeviceGlobalMemSize(cl_device_id device) except *:
+    cdef cl_ulong[1] valptrs
+    cdef size_t[1] retptrs
+    cdef cl_int status = api.clGetDeviceInfo(
+        device,
+        <cl_device_info>CL_DEVICE_GLOBAL_MEM_SIZE,
+        <size_t>sizeof(cl_ulong),
+        <void *>&valptrs[0],
+        <size_t *>&retptrs[0])
+    check_status(status)
+
+    return valptrs[0]
+
+cdef bint GetDeviceHostUnifiedMemory(cl_device_id device) except *:
+    cdef cl_bool[1] valptrs
+    cdef size_t[1] retptrs
+    cdef cl_int status = api.clGetDeviceInfo(
+        device,
+        <cl_device_info>CL_DEVICE_HOST_UNIFIED_MEMORY,
+        <size_t>sizeof(cl_bool),
+        <void *>&valptrs[0],
+        <size_t *>&retptrs[0])
+    check_status(status)
+
+    return valptrs[0] == CL_TRUE
+
 cdef GetDeviceAddressBits(cl_device_id device):
     cdef cl_uint[1] valptrs
     cdef size_t[1] retptrs
@@ -41,6 +73,214 @@ cdef GetDeviceAddressBits(cl_device_id device):
     ret = valptrs[0]
     return ret
 
+cdef cl_uint GetDeviceInfoUint(cl_device_id device,
+                               cl_device_info param_name) except? 0:
+    cdef cl_uint[1] valptrs
+    cdef cl_int status = api.clGetDeviceInfo(
+        device,
+        param_name,
+        <size_t>sizeof(cl_uint),
+        <void *>&valptrs[0],
+        NULL)
+    check_status(status)
+
+    return valptrs[0]
+
+cdef cl_ulong GetDeviceInfoUlong(cl_device_id device,
+                                 cl_device_info param_name) except? 0:
+    cdef cl_ulong[1] valptrs
+    cdef cl_int status = api.clGetDeviceInfo(
+        device,
+        param_name,
+        <size_t>sizeof(cl_ulong),
+        <void *>&valptrs[0],
+        NULL)
+    check_status(status)
+
+    return valptrs[0]
+
+cdef size_t GetDeviceInfoSizeT(cl_device_id device,
+                               cl_device_info param_name) except? 0:
+    cdef size_t[1] valptrs
+    cdef cl_int status = api.clGetDeviceInfo(
+        device,
+        param_name,
+        <size_t>sizeof(size_t),
+        <void *>&valptrs[0],
+        NULL)
+    check_status(status)
+
+    return valptrs[0]
+
+cdef tuple GetDeviceMaxWorkItemSizes(cl_device_id device):
+    cdef cl_uint ndim = GetDeviceInfoUint(
+        device, CL_DEVICE_MAX_WORK_ITEM_DIMENSIONS)
+    cdef array.array sizes = array.array('b')
+    array.resize(sizes, sizeof(size_t) * ndim)
+    cdef cl_int status = api.clGetDeviceInfo(
+        device,
+        <cl_device_info>CL_DEVICE_MAX_WORK_ITEM_SIZES,
+        sizeof(size_t) * ndim,
+        sizes.data.as_voidptr,
+        NULL)
+    check_status(status)
+
+    cdef size_t* sizes_ptr = <size_t*>sizes.data.as_voidptr
+    cdef cl_uint i
+    ret = []
+    for i in range(ndim):
+        ret.append(sizes_ptr[i])
+    return tuple(ret)
+
+cdef size_t GetKernelPreferredWorkGroupSizeMultiple(
+        cl_kernel kernel, cl_device_id device) except? 0:
+    cdef size_t[1] valptrs
+    cdef cl_int status = api.clGetKernelWorkGroupInfo(
+        kernel,
+        device,
+        CL_KERNEL_PREFERRED_WORK_GROUP_SIZE_MULTIPLE,
+        <size_t>sizeof(size_t),
+        <void *>&valptrs[0],
+        NULL)
+    check_status(status)
+
+    return valptrs[0]
+
+cdef str GetDeviceInfoString(cl_device_id device, cl_device_info param_name):
+    cdef size_t length
+    cdef cl_int status = api.clGetDeviceInfo(
+        device,
+        param_name,
+        0,
+        NULL,
+        &length)
+    check_status(status)
+
+    cdef array.array info = array.array('b')
+    array.resize(info, length)
+    status = api.clGetDeviceInfo(
+        device,
+        param_name,
+        length,
+        info.data.as_voidptr,
+        NULL)
+    check_status(status)
+    return info.tobytes().rstrip(b'\0').decode('utf8')
+
+cdef str GetPlatformInfoString(cl_platform_id platform,
+                               cl_platform_info param_name):
+    cdef size_t length
+    cdef cl_int status = api.clGetPlatformInfo(
+        platform,
+        param_name,
+        0,
+        NULL,
+        &length)
+    check_status(status)
+
+    cdef array.array info = array.array('b')
+    array.resize(info, length)
+    status = api.clGetPlatformInfo(
+        platform,
+        param_name,
+        length,
+        info.data.as_voidptr,
+        NULL)
+    check_status(status)
+    return info.tobytes().rstrip(b'\0').decode('utf8')
+
+cdef size_t GetKernelWorkGroupSize(
+        cl_kernel kernel, cl_device_id device) except? 0:
+    cdef size_t[1] valptrs
+    cdef cl_int status = api.clGetKernelWorkGroupInfo(
+        kernel,
+        device,
+        CL_KERNEL_WORK_GROUP_SIZE,
+        <size_t>sizeof(size_t),
+        <void *>&valptrs[0],
+        NULL)
+    check_status(status)
+
+    return valptrs[0]
+
+cdef dict GetDeviceCapabilities(cl_device_id device):
+    """Returns the capabilities of the device for DeviceInfo."""
+    extensions = GetDeviceInfoString(device, CL_DEVICE_EXTENSIONS).split()
+    return {
+        'name': GetDeviceInfoString(device, CL_DEVICE_NAME),
+        'max_work_group_size': GetDeviceInfoSizeT(
+            device, CL_DEVICE_MAX_WORK_GROUP_SIZE),
+        'max_work_item_sizes': GetDeviceMaxWorkItemSizes(device),
+        'local_mem_size': GetDeviceInfoUlong(
+            device, CL_DEVICE_LOCAL_MEM_SIZE),
+        'max_compute_units': GetDeviceInfoUint(
+            device, CL_DEVICE_MAX_COMPUTE_UNITS),
+        'native_vector_widths': {
+            'char': GetDeviceInfoUint(
+                device, CL_DEVICE_NATIVE_VECTOR_WIDTH_CHAR),
+            'short': GetDeviceInfoUint(
+                device, CL_DEVICE_NATIVE_VECTOR_WIDTH_SHORT),
+            'int': GetDeviceInfoUint(
+                device, CL_DEVICE_NATIVE_VECTOR_WIDTH_INT),
+            'long': GetDeviceInfoUint(
+                device, CL_DEVICE_NATIVE_VECTOR_WIDTH_LONG),
+            'float': GetDeviceInfoUint(
+                device, CL_DEVICE_NATIVE_VECTOR_WIDTH_FLOAT),
+            'double': GetDeviceInfoUint(
+                device, CL_DEVICE_NATIVE_VECTOR_WIDTH_DOUBLE),
+            'half': GetDeviceInfoUint(
+                device, CL_DEVICE_NATIVE_VECTOR_WIDTH_HALF),
+        },
+        'fp64': GetDeviceInfoUlong(device, CL_DEVICE_DOUBLE_FP_CONFIG) != 0,
+        'fp16': 'cl_khr_fp16' in extensions,
+        'host_unified_memory': GetDeviceHostUnifiedMemory(device),
+        'mem_base_addr_align': GetDeviceMemBaseAddrAlign(device) // 8,
+        'global_mem_size': GetDeviceGlobalMemSize(device),
+    }
+
+cdef size_t GetPreferredWorkGroupSizeMultiple(
+        cl_context context, cl_device_id device) except? 0:
+    """Returns the preferred multiple of work-group sizes of the device.
+
+    It is queried for a trivial kernel, which gives e.g. the warp size of
+    NVIDIA GPUs and the wavefront size of AMD GPUs.
+    """
+    cdef cl_program program = CreateProgram(
+        [b'__kernel void clpy_probe(__global int* x)'
+         b'{ x[get_global_id(0)] = 0; }'],
+        context, 1, &device)
+    cdef cl_kernel kernel
+    try:
+        kernel = api.CreateKernel(program, b'clpy_probe')
+        try:
+            return GetKernelPreferredWorkGroupSizeMultiple(kernel, device)
+        finally:
+            api.ReleaseKernel(kernel)
+    finally:
+        api.ReleaseProgram(program)
+
+cdef dict _device_identities = {}
+
+cdef tuple GetDeviceIdentity(cl_device_id device):
+    """Returns names and versions which identify the device and its driver."""
+    cdef size_t key = <size_t>device
+    cdef cl_platform_id platform
+    ret = _device_identities.get(key)
+    if ret is None:
+        check_status(api.clGetDeviceInfo(
+            device,
+            <cl_device_info>CL_DEVICE_PLATFORM,
+            sizeof(cl_platform_id),
+            <void*>&platform,
+            NULL))
+        ret = (GetPlatformInfoString(platform, CL_PLATFORM_NAME),
+               GetPlatformInfoString(platform, CL_PLATFORM_VERSION),
+               GetDeviceInfoString(device, CL_DEVICE_NAME),
+               GetDeviceInfoString(device, CL_DEVICE_VERSION),
+               GetDeviceInfoString(device, CL_DRIVER_VERSION))
+        _device_identities[key] = ret
+    return ret
+
 
 ###############################################################################
 # utility
@@ -48,12 +288,169 @@ cdef GetDeviceAddressBits(cl_device_id device):
 cdef void SetKernelArgLocalMemory(cl_kernel kernel, arg_index, size_t size):
     api.SetKernelArg(kernel, arg_index, size, <void*>NULL)
 
+cdef class CachedKernel:
+
+    """cl_kernel object in the kernel cache of a thread.
+
+    ``arg_plan`` is the argument marshalling plan of
+    :class:`clpy.backend.function.Function` launching the kernel, which
+    remembers the arguments last set to it. It is reset to ``None`` when the
+    kernel is returned by :func:`GetCachedKernel`, whose caller sets the
+    arguments by itself. ``work_group_size`` is the maximum work-group size
+    of the kernel on the device, which is 0 until it is queried.
+    """
+
+    pass
+
+
+cdef class _KernelCache:
+
+    """cl_kernel objects of a thread keyed by their program and name.
+
+    A kernel object cannot be shared between threads because its arguments
+    are set by clSetKernelArg before each launch, so each thread owns a cache.
+    The kernels are released when their module is released, when the thread
+    terminates or at exit.
+    """
+
+    cdef readonly dict kernels
+    cdef object __weakref__
+
+    def __init__(self):
+        self.kernels = {}
+
+    cdef CachedKernel get(self, cl_program program, bytes name):
+        key = (<size_t>program, name)
+        cdef CachedKernel entry = self.kernels.get(key, None)
+        if entry is None:
+            entry = CachedKernel()
+            entry.kernel = api.CreateKernel(program, name)
+            self.kernels[key] = entry
+        return entry
+
+    cdef release_program(self, size_t program):
+        cdef CachedKernel entry
+        for key in list(self.kernels):
+            if key[0] != program:
+                continue
+            entry = self.kernels.pop(key, None)
+            if entry is not None:
+                entry.arg_plan = None
+                api.ReleaseKernel(entry.kernel)
+
+    cdef clear(self):
+        cdef CachedKernel entry
+        kernels = self.kernels
+        self.kernels = {}
+        for entry in kernels.values():
+            entry.arg_plan = None
+            api.ReleaseKernel(entry.kernel)
+
+    def __dealloc__(self):
+        if self.kernels:
+            self.clear()
+
+
+_thread_local = threading.local()
+_kernel_caches = weakref.WeakSet()
+
+
+cdef CachedKernel GetCachedKernelEntry(cl_program program, bytes name):
+    """Returns the cache entry of the kernel for the current thread.
+
+    The kernel is created by clCreateKernel only for the first call in each
+    thread.
+    """
+    cdef _KernelCache cache
+    try:
+        cache = _thread_local.kernel_cache
+    except AttributeError:
+        cache = _KernelCache()
+        _thread_local.kernel_cache = cache
+        _kernel_caches.add(cache)
+    return cache.get(program, name)
+
+
+cdef cl_kernel GetCachedKernel(cl_program program, bytes name) except *:
+    """Returns the kernel of the program for the current thread.
+
+    The caller sets all arguments of the kernel by itself, so the argument
+    plan of the cache entry is invalidated.
+    """
+    cdef CachedKernel entry = GetCachedKernelEntry(program, name)
+    entry.arg_plan = None
+    return entry.kernel
+
+
+cpdef ReleaseCachedKernels():
+    """Releases the cached kernels of all threads."""
+    cdef _KernelCache cache
+    for cache in list(_kernel_caches):
+        cache.clear()
+
+
+cdef ReleaseCachedKernelsOfProgram(cl_program program):
+    """Releases the cached kernels of the program in all threads.
+
+    It must be called when no kernel of the program is being launched, e.g.
+    when the module of the program is released.
+    """
+    cdef _KernelCache cache
+    if _kernel_caches is None:
+        # the module is already finalized
+        return
+    for cache in list(_kernel_caches):
+        cache.release_program(<size_t>program)
+
+
+# registered after env, so that kernels are released before the context
+atexit.register(ReleaseCachedKernels)
+
+
 cdef is_valid_kernel_name(name):
     return re.match('^[a-zA-Z_][a-zA-Z_0-9]*$', name) is not None
 
+cdef dict _library_keys = {}
+
 cdef cl_program CreateProgram(sources, cl_context context, num_devices,
                               cl_device_id* devices_ptrs,
-                              options=b"") except *:
+                              options=b"", cl_program library=NULL) except *:
+    cdef bytes py_string
+    if os.getenv("CLPY_SAVE_CL_KERNEL_SOURCE") == "1":
+        for i in range(len(sources)):
+            with open(tempfile.gettempdir() + "/" +
+                      str(time.monotonic()) + ".cl", 'w') as f:
+                py_string = sources[i]
+                f.write(py_string.decode('utf-8'))
+
+    from clpy.backend import compiler
+    # Program binaries are cached only for single device programs, whose
+    # binary can be identified by the device and the driver.
+    cdef bint use_cache = num_devices == 1 and compiler.is_cache_enabled()
+    cdef cl_program program
+    if use_cache:
+        name = '%s.bin' % compiler.get_cache_key(
+            sources, options, GetDeviceIdentity(devices_ptrs[0]),
+            _library_keys.get(<size_t>library))
+        binary = compiler.load_from_cache(name)
+        if binary is not None:
+            program = CreateProgramFromBinary(
+                binary, context, devices_ptrs[0], options)
+            if program != NULL:
+                return program
+
+    if library == NULL:
+        program = CreateProgramFromSource(
+            sources, context, num_devices, devices_ptrs, options)
+    else:
+        program = LinkProgramWithLibrary(
+            sources, context, num_devices, devices_ptrs, options, library)
+    if use_cache:
+        compiler.save_to_cache(name, GetProgramBinary(program))
+    return program
+
+cdef cl_program _CreateProgramWithSource(
+        sources, cl_context context) except *:
     cdef size_t length = len(sources)
     cdef char** src
     cdef size_t* src_size
@@ -64,32 +461,176 @@ cdef cl_program CreateProgram(sources, cl_context context, num_devices,
         src[i] = <char*>malloc(sizeof(char)*src_size[i])
         memcpy(src[i], <char*>s, src_size[i])
 
-    cdef bytes py_string
-    if os.getenv("CLPY_SAVE_CL_KERNEL_SOURCE") == "1":
+    try:
+        return api.CreateProgramWithSource(context=context, count=length,
+                                           strings=src, lengths=src_size)
+    finally:
         for i in range(length):
-            with open(tempfile.gettempdir() + "/" +
-                      str(time.monotonic()) + ".cl", 'w') as f:
-                py_string = sources[i]
-                f.write(py_string.decode('utf-8'))
+            free(src[i])
+        free(src)
+        free(src_size)
 
-    program = api.CreateProgramWithSource(context=context, count=length,
-                                          strings=src, lengths=src_size)
+cdef _raise_build_error(cl_program program, err):
+    from exceptions import OpenCLProgramBuildError
+    if err.status in (CL_BUILD_PROGRAM_FAILURE, CL_COMPILE_PROGRAM_FAILURE):
+        log = GetProgramBuildLog(program)
+        err = OpenCLProgramBuildError(err, log)
+    raise err
+
+cdef cl_program CreateProgramFromSource(
+        sources, cl_context context, num_devices,
+        cl_device_id* devices_ptrs, options) except *:
+    cdef cl_program program = _CreateProgramWithSource(sources, context)
     options = options + b'\0'
     cdef char* options_cstr = options
 
-    from exceptions import OpenCLProgramBuildError
     from exceptions import OpenCLRuntimeError
     try:
         api.BuildProgram(program, num_devices, devices_ptrs, options_cstr,
                          <void*>NULL, <void*>NULL)
     except OpenCLRuntimeError as err:
-        if err.status == CL_BUILD_PROGRAM_FAILURE:
-            log = GetProgramBuildLog(program)
-            err = OpenCLProgramBuildError(err, log)
-        raise err
+        _raise_build_error(program, err)
 
     return program
 
+cdef cl_program CompileProgramFromSource(
+        sources, cl_context context, num_devices,
+        cl_device_id* devices_ptrs, options) except *:
+    """Compiles sources into a program object to be linked."""
+    cdef cl_program program = _CreateProgramWithSource(sources, context)
+    options = options + b'\0'
+    cdef char* options_cstr = options
+
+    from exceptions import OpenCLRuntimeError
+    try:
+        api.CompileProgram(program, num_devices, devices_ptrs, options_cstr,
+                           0, <cl_program*>NULL, <char**>NULL,
+                           <void*>NULL, <void*>NULL)
+    except OpenCLRuntimeError as err:
+        _raise_build_error(program, err)
+
+    return program
+
+cdef cl_program LinkProgramWithLibrary(
+        sources, cl_context context, num_devices,
+        cl_device_id* devices_ptrs, options, cl_program library) except *:
+    """Compiles sources and links them against a library program."""
+    cdef cl_program[2] programs
+    programs[0] = CompileProgramFromSource(
+        sources, context, num_devices, devices_ptrs, options)
+    programs[1] = library
+    try:
+        return api.LinkProgram(context, num_devices, devices_ptrs, b'',
+                               2, &programs[0], <void*>NULL, <void*>NULL)
+    finally:
+        api.ReleaseProgram(programs[0])
+
+cdef cl_program CreateLibrary(sources, cl_context context,
+                              cl_device_id device, options) except *:
+    """Creates a library program to be linked with other programs.
+
+    The library is cached persistently in the same way as
+    :func:`CreateProgram`.
+    """
+    from clpy.backend import compiler
+    cdef bint use_cache = compiler.is_cache_enabled()
+    cdef cl_program library = NULL
+    cdef cl_program compiled
+    key = compiler.get_cache_key(sources, options, GetDeviceIdentity(device))
+    if use_cache:
+        binary = compiler.load_from_cache('%s.lib' % key)
+        if binary is not None:
+            library = CreateLibraryFromBinary(binary, context, device)
+
+    if library == NULL:
+        compiled = CompileProgramFromSource(
+            sources, context, 1, &device, options)
+        try:
+            library = api.LinkProgram(
+                context, 1, &device, b'-create-library', 1, &compiled,
+                <void*>NULL, <void*>NULL)
+        finally:
+            api.ReleaseProgram(compiled)
+        if use_cache:
+            compiler.save_to_cache('%s.lib' % key, GetProgramBinary(library))
+
+    _library_keys[<size_t>library] = key
+    return library
+
+cdef cl_program CreateLibraryFromBinary(
+        bytes binary, cl_context context, cl_device_id device) except *:
+    """Creates a library program from a cached binary.
+
+    Returns NULL if the binary cannot be loaded as a library.
+    """
+    cdef size_t length = len(binary)
+    cdef unsigned char* binary_ptr = <unsigned char*>(<char*>binary)
+    cdef cl_program program = NULL
+    cdef cl_program_binary_type binary_type
+
+    from exceptions import OpenCLRuntimeError
+    try:
+        program = api.CreateProgramWithBinary(
+            context, 1, &device, &length, &binary_ptr)
+        check_status(api.clGetProgramBuildInfo(
+            program, device, CL_PROGRAM_BINARY_TYPE,
+            sizeof(cl_program_binary_type), &binary_type, NULL))
+    except OpenCLRuntimeError:
+        binary_type = CL_PROGRAM_BINARY_TYPE_NONE
+    if binary_type != CL_PROGRAM_BINARY_TYPE_LIBRARY:
+        if program != NULL:
+            api.ReleaseProgram(program)
+        return NULL
+    return program
+
+cdef cl_program CreateProgramFromBinary(
+        bytes binary, cl_context context, cl_device_id device,
+        options) except *:
+    """Creates and builds a program from a cached binary.
+
+    Returns NULL if the binary cannot be loaded, e.g. it is stale for the
+    driver, so that the caller can fall back to the source build.
+    """
+    cdef size_t length = len(binary)
+    cdef unsigned char* binary_ptr = <unsigned char*>(<char*>binary)
+    cdef cl_program program = NULL
+    options = options + b'\0'
+    cdef char* options_cstr = options
+
+    from exceptions import OpenCLRuntimeError
+    try:
+        program = api.CreateProgramWithBinary(
+            context, 1, &device, &length, &binary_ptr)
+        api.BuildProgram(program, 1, &device, options_cstr,
+                         <void*>NULL, <void*>NULL)
+    except OpenCLRuntimeError:
+        if program != NULL:
+            api.ReleaseProgram(program)
+        return NULL
+    return program
+
+cdef bytes GetProgramBinary(cl_program program):
+    cdef size_t length
+    cdef cl_int status = api.clGetProgramInfo(
+        program,
+        CL_PROGRAM_BINARY_SIZES,
+        sizeof(size_t),
+        &length,
+        NULL)
+    check_status(status)
+
+    cdef array.array binary = array.array('B')
+    array.resize(binary, length)
+    cdef unsigned char* binary_ptr = binary.data.as_uchars
+    status = api.clGetProgramInfo(
+        program,
+        CL_PROGRAM_BINARIES,
+        sizeof(unsigned char*),
+        &binary_ptr,
+        NULL)
+    check_status(status)
+    return binary.tobytes()
+
 cdef GetProgramBuildLog(cl_program program):
     cdef size_t length
     cdef cl_int status = api.clGetProgramBuildInfo(
@@ -114,7 +655,104 @@ cdef GetProgramBuildLog(cl_program program):
     return info.tobytes().decode('utf8')
 
 
-# Synchronize Running Kernel
+###############################################################################
+# events
+
+cpdef size_t EnqueueMarker(size_t command_queue) except? 0:
+    """Enqueues a marker to the command queue and returns its event.
+
+    The event completes when all the preceding commands are completed. The
+    command queue is given as a pointer, which is 0 for the default queue.
+    """
+    cdef cl_event event
+    api.EnqueueMarkerWithWaitList(
+        env.to_command_queue(command_queue), 0, <cl_event*>NULL, &event)
+    return <size_t>event
+
+
+cpdef EnqueueWaitForEvents(size_t command_queue, events):
+    """Makes the following commands of the command queue wait for events."""
+    cdef size_t i, n = len(events)
+    if n == 0:
+        return
+    cdef cl_event* wait_list = <cl_event*>malloc(sizeof(cl_event) * n)
+    if wait_list == NULL:
+        raise MemoryError()
+    try:
+        for i in range(n):
+            wait_list[i] = <cl_event><size_t>events[i]
+        api.EnqueueBarrierWithWaitList(
+            env.to_command_queue(command_queue), <cl_uint>n, wait_list,
+            <cl_event*>NULL)
+    finally:
+        free(wait_list)
+
+
+cpdef WaitForEvent(size_t event):
+    """Blocks until the event completes without holding GIL."""
+    cdef cl_event e = <cl_event>event
+    api.WaitForEvents(1, &e)
+
+
+cpdef ReleaseEvent(size_t event):
+    api.ReleaseEvent(<cl_event>event)
+
+
+cpdef bint IsEventComplete(size_t event) except *:
+    cdef cl_int status
+    api.GetEventInfo(<cl_event>event, CL_EVENT_COMMAND_EXECUTION_STATUS,
+                     sizeof(cl_int), &status)
+    if status < 0:
+        # the command is abnormally terminated
+        check_status(status)
+    return status == CL_COMPLETE
+
+
+cpdef cl_ulong GetEventProfilingInfo(size_t event,
+                                     cl_profiling_info param_name) except? 0:
+    """Returns a device time counter of the event in nanoseconds.
+
+    The command queue of the event must be created with
+    ``CL_QUEUE_PROFILING_ENABLE``.
+    """
+    cdef cl_ulong value
+    api.GetEventProfilingInfo(<cl_event>event, param_name,
+                              sizeof(cl_ulong), &value)
+    return value
+
+
+cdef void _event_callback(cl_event event, cl_int status,
+                          void* user_data) with gil:
+    callback = <object>user_data
+    try:
+        callback(status)
+    finally:
+        Py_DECREF(callback)
+
+
+cpdef SetEventCallback(size_t event, callback):
+    """Calls ``callback(status)`` when the event completes.
+
+    The callback is called in a thread of the OpenCL runtime. ``status`` is
+    ``CL_COMPLETE``, i.e. 0, or a negative error code if the command is
+    abnormally terminated.
+    """
+    Py_INCREF(callback)
+    try:
+        api.SetEventCallback(<cl_event>event, CL_COMPLETE,
+                             <void*>_event_callback, <void*>callback)
+    except Exception:
+        Py_DECREF(callback)
+        raise
+
+
+# Kernels are launched asynchronously and the command queue executes them in
+# order, so blocking reads wait for all the preceding kernels.
+# CLPY_LAUNCH_BLOCKING=1 makes each launch wait for the kernel, e.g. to find
+# out which kernel fails.
+cdef bint _launch_blocking = os.environ.get('CLPY_LAUNCH_BLOCKING') == '1'
+
+
 cdef RunNDRangeKernel(
         cl_command_queue command_queue,
         cl_kernel kernel,
@@ -123,9 +761,9 @@ cdef RunNDRangeKernel(
         size_t* global_work_size,
         size_t* local_work_size,
         cl_uint num_events_in_wait_list,
-        cl_event* event_wait_list):
+        cl_event* event_wait_list,
+        cl_event* event=NULL):
 
-    cdef cl_event[1] event
     api.EnqueueNDRangeKernel(
         command_queue=command_queue,
         kernel=kernel,
@@ -135,6 +773,7 @@ cdef RunNDRangeKernel(
         local_work_size=local_work_size,
         num_events_in_wait_list=num_events_in_wait_list,
         event_wait_list=event_wait_list,
-        event=&event[0]
+        event=event
     )
-    api.WaitForEvents(1, &event[0])
+    if _launch_blocking:
+        api.Finish(command_queue)
@@ -19,6 +19,9 @@ cpdef PinnedMemoryPointer alloc_pinned_memory(Py_ssize_t size)
 cpdef set_pinned_memory_allocator(allocator=*)
 
 
+cpdef bint _is_allocator_pooled()
+
+
 cdef class PinnedMemoryPool:
 
     cdef:
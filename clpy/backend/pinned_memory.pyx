@@ -5,11 +5,13 @@ import weakref
 
 from fastrlock cimport rlock
 
-# TODO(LWisteria): Use clEnqueueMapBuffer
-from libc.stdlib cimport free
-from libc.stdlib cimport malloc
 # from clpy.backend import runtime
 # from clpy.backend cimport runtime
+import clpy.backend.opencl.api
+cimport clpy.backend.opencl.api
+cimport clpy.backend.opencl.env
+from clpy.backend.opencl.types cimport cl_event
+from clpy.backend.opencl.types cimport cl_mem
 
 
 class PinnedMemory(object):
@@ -18,24 +20,66 @@ class PinnedMemory(object):
 
     This class provides a RAII interface of the pinned memory allocation.
 
+    The memory is a buffer created with ``CL_MEM_ALLOC_HOST_PTR``, which is
+    mapped to the host address space while the allocation is alive. Since
+    the driver pins such a buffer, copies between it and device buffers are
+    done by DMA without an extra staging copy.
+
     Args:
         size (int): Size of the memory allocation in bytes.
+        flags (int): Ignored. It is kept for the compatibility with CuPy.
+
+    Attributes:
+        ptr (int): Pointer to the mapped host memory.
+        buf (int): Raw ``cl_mem`` handle of the buffer.
+        device_id (int): ID of the device whose context owns the buffer.
 
     """
 
     def __init__(self, Py_ssize_t size, unsigned int flags=0):
+        cdef cl_mem buf
         self.size = size
         self.ptr = 0
+        self.buf = 0
+        self.device_id = clpy.backend.opencl.env.get_current_device_id()
         if size > 0:
-            self.ptr = <size_t>malloc(size)
-            # # TODO(LWisteria): Use clEnqueueMapBuffer
-            # self.ptr = runtime.hostAlloc(size, flags)
+            buf = clpy.backend.opencl.api.CreateBuffer(
+                clpy.backend.opencl.env.get_context(),
+                clpy.backend.opencl.api.MEM_READ_WRITE |
+                clpy.backend.opencl.api.MEM_ALLOC_HOST_PTR,
+                size,
+                <void*>NULL)
+            self.buf = <size_t>buf
+            self.ptr = <size_t>clpy.backend.opencl.api.EnqueueMapBuffer(
+                command_queue=(
+                    clpy.backend.opencl.env.get_default_command_queue()),
+                buffer=buf,
+                blocking_map=clpy.backend.opencl.api.BLOCKING,
+                map_flags=(clpy.backend.opencl.api.MAP_READ |
+                           clpy.backend.opencl.api.MAP_WRITE),
+                offset=0,
+                size=size,
+                num_events_in_wait_list=0,
+                event_wait_list=<cl_event*>NULL,
+                event=<cl_event*>NULL)
 
     def __del__(self):
-        if self.ptr:
-            free(<void*>self.ptr)
-            # # TODO(LWisteria): Use clEnqueueMapBuffer
-            # runtime.freeHost(self.ptr)
+        cdef size_t ptr = self.ptr
+        cdef size_t buf = self.buf
+        if ptr:
+            clpy.backend.opencl.api.EnqueueUnmapMemObject(
+                command_queue=(
+                    clpy.backend.opencl.env.get_device_command_queue(
+                        self.device_id)),
+                memobj=<cl_mem>buf,
+                mapped_ptr=<void*>ptr,
+                num_events_in_wait_list=0,
+                event_wait_list=<cl_event*>NULL,
+                event=<cl_event*>NULL)
+            self.ptr = 0
+        if buf:
+            clpy.backend.opencl.api.ReleaseMemObject(<cl_mem>buf)
+            self.buf = 0
 
     def __int__(self):
         """Returns the pointer value to the head of the allocation."""
@@ -181,12 +225,13 @@ cdef class _EventWatcher:
 
 cpdef PinnedMemoryPointer _malloc(Py_ssize_t size):
     mem = PinnedMemory(size)
-    # # TODO(LWisteria): Use clEnqueueMapBuffer
-    # mem = PinnedMemory(size, runtime.hostAllocPortable)
     return PinnedMemoryPointer(mem, 0)
 
 
 cdef object _current_allocator = _malloc
+# True if the current allocator is the malloc of a PinnedMemoryPool, which
+# reuses the mapped buffers instead of mapping a new one on each call.
+cdef bint _pooled = False
 cdef _EventWatcher _watcher = _EventWatcher()
 
 
@@ -229,8 +274,21 @@ cpdef set_pinned_memory_allocator(allocator=_malloc):
             the device buffer of that size.
 
     """
-    global _current_allocator
+    global _current_allocator, _pooled
     _current_allocator = allocator
+    _pooled = isinstance(getattr(allocator, '__self__', None),
+                         PinnedMemoryPool)
+
+
+cpdef bint _is_allocator_pooled():
+    """Returns ``True`` if the current allocator is a pool.
+
+    A new buffer is mapped by a blocking command on the default command
+    queue, which waits for all queued work, so the host-to-device copies
+    are only staged through pinned memory if it is reused by a pool.
+
+    """
+    return _pooled
 
 
 class PooledPinnedMemory(PinnedMemory):
@@ -244,6 +302,7 @@ class PooledPinnedMemory(PinnedMemory):
 
     def __init__(self, mem, pool):
         self.ptr = mem.ptr
+        self.buf = mem.buf
         self.size = mem.size
         self.pool = pool
 
@@ -258,6 +317,7 @@ class PooledPinnedMemory(PinnedMemory):
         if pool and self.ptr != 0:
             pool.free(self.ptr, self.size)
         self.ptr = 0
+        self.buf = 0
         self.size = 0
 
     __del__ = free
@@ -302,7 +362,6 @@ cdef class PinnedMemoryPool:
             if free:
                 mem = free.pop()
             else:
-                # TODO(LWisteria): Use clEnqueueMapBuffer
                 mem = self._alloc(size).mem
 #                try:
 #                    mem = self._alloc(size).mem
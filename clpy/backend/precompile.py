@@ -0,0 +1,174 @@
+"""Bulk compilation of kernels into the persistent kernel cache.
+
+This module compiles specializations of ufuncs, reduction functions and
+user-defined kernels ahead of time, e.g. to bake the kernel cache into a
+container image. Run ``python -m clpy.precompile --help`` for the command line
+interface.
+
+A kernel supports the bulk compilation by two methods:
+
+- ``_get_precompile_specs(dtypes, ndims)`` lists picklable specializations
+  for ``dtypes`` and ``ndims`` given to :func:`warmup`. ufuncs and
+  reduction functions select their type signatures by the input dtypes, and
+  all signatures if ``dtypes`` is ``None``. User-defined kernels take a dtype
+  for all inputs or a tuple of dtypes for each input. Reductions take pairs
+  of the input and output dimensions in ``ndims``, or an input dimension
+  standing for all possible output dimensions.
+- ``_precompile(spec)`` compiles a specialization for arrays without
+  invoking the kernel, and returns the :class:`clpy.backend.Function`.
+"""
+import argparse
+import importlib
+import multiprocessing
+import sys
+import warnings
+
+import numpy
+import six
+
+from clpy.backend import compiler
+
+
+def _resolve(path):
+    """Resolves ``'module:attr'`` or ``'module.attr'`` into an object."""
+    if ':' in path:
+        module_name, attr = path.split(':', 1)
+    else:
+        module_name, _, attr = path.rpartition('.')
+    obj = importlib.import_module(module_name)
+    for name in attr.split('.'):
+        obj = getattr(obj, name)
+    return obj
+
+
+def _precompile_task(task):
+    path, spec = task
+    _resolve(path)._precompile(spec)
+
+
+def get_default_kernels():
+    """Returns import paths of all ufuncs and reduction functions of clpy."""
+    import clpy
+    from clpy.core import core
+
+    kernel_types = (core.ufunc, core.simple_reduction_function)
+    paths = []
+    found = set()
+    for module in (clpy, core):
+        for name in sorted(dir(module)):
+            kernel = getattr(module, name)
+            if isinstance(kernel, kernel_types) and id(kernel) not in found:
+                found.add(id(kernel))
+                paths.append('%s.%s' % (module.__name__, name))
+    return paths
+
+
+def warmup(kernels=None, dtypes=None, ndims=(1,), processes=None):
+    """Compiles kernels ahead of time into the persistent kernel cache.
+
+    Kernels given as import paths are compiled in parallel by a pool of
+    worker processes, each of which initializes its own OpenCL context and
+    stores the translated sources and program binaries into the kernel cache
+    directory. Kernel objects cannot be sent to workers and are compiled in
+    the current process.
+
+    Args:
+        kernels: Sequence of kernels to be compiled. Each element is a
+            :class:`clpy.ufunc`, a reduction function created by
+            ``create_reduction_func``, :class:`clpy.ElementwiseKernel`,
+            :class:`clpy.ReductionKernel` or an import path of them like
+            ``'clpy.add'`` or ``'mypackage.kernels:my_kernel'``. All ufuncs
+            and reduction functions of clpy are compiled by default.
+        dtypes: Sequence of dtypes. For ufuncs and reduction functions, the
+            type signatures whose first input type is in ``dtypes`` are
+            compiled, and all signatures are compiled if ``None``. For
+            user-defined kernels, each element is a dtype of all inputs or a
+            tuple of dtypes for each input, and it must be specified.
+        ndims: Sequence of the numbers of dimensions of the arrays after
+            contiguous axes are merged. For reductions, each element may be
+            a tuple of the input and output dimensions; an integer stands for
+            all output dimensions smaller than it.
+        processes (int): Number of worker processes. The number of CPUs is
+            used by default. If it is ``1``, all kernels are compiled in the
+            current process.
+
+    Returns:
+        int: Number of compiled specializations.
+
+    """
+    if kernels is None:
+        kernels = get_default_kernels()
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if processes > 1 and not compiler.is_cache_enabled():
+        warnings.warn('Kernel cache is disabled. '
+                      'Kernels are compiled in the current process.')
+        processes = 1
+
+    local_tasks = []
+    remote_tasks = []
+    for kernel in kernels:
+        if isinstance(kernel, six.string_types):
+            path = kernel
+            kernel = _resolve(path)
+        else:
+            path = None
+        if not hasattr(kernel, '_precompile'):
+            raise TypeError('Unsupported kernel: %r' % (kernel,))
+        kernel_dtypes = dtypes
+        if kernel_dtypes is None and not hasattr(kernel, '_ops'):
+            raise ValueError(
+                'dtypes must be specified for user-defined kernel %s'
+                % kernel.name)
+        for spec in kernel._get_precompile_specs(kernel_dtypes, ndims):
+            if path is None or processes == 1:
+                local_tasks.append((kernel, spec))
+            else:
+                remote_tasks.append((path, spec))
+
+    if remote_tasks:
+        # Workers are spawned instead of forked because an OpenCL context
+        # cannot be shared with a forked process.
+        ctx = multiprocessing.get_context('spawn')
+        pool = ctx.Pool(processes)
+        try:
+            pool.map(_precompile_task, remote_tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    with compiler.compile_batch():
+        for kernel, spec in local_tasks:
+            kernel._precompile(spec)
+    return len(local_tasks) + len(remote_tasks)
+
+
+def _parse_list(value):
+    return [v for v in value.split(',') if v]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m clpy.precompile',
+        description='Compile kernels into the persistent kernel cache.')
+    parser.add_argument(
+        'kernels', nargs='*',
+        help='import paths of kernels (default: all ufuncs and reduction '
+             'functions of clpy)')
+    parser.add_argument(
+        '--dtypes', type=_parse_list, default=None,
+        help='comma-separated dtypes, e.g. "float32,int64"')
+    parser.add_argument(
+        '--ndims', type=_parse_list, default=['1'],
+        help='comma-separated numbers of dimensions (default: 1)')
+    parser.add_argument(
+        '--processes', '-j', type=int, default=None,
+        help='number of worker processes (default: number of CPUs)')
+    args = parser.parse_args(argv)
+
+    dtypes = None
+    if args.dtypes is not None:
+        dtypes = [numpy.dtype(t) for t in args.dtypes]
+    ndims = [int(n) for n in args.ndims]
+    n = warmup(args.kernels or None, dtypes, ndims, args.processes)
+    sys.stdout.write('Compiled %d kernels into %s\n'
+                     % (n, compiler.get_cache_dir()))
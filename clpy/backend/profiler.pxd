@@ -0,0 +1,11 @@
+from clpy.backend.opencl.types cimport cl_event
+
+
+cpdef bint is_enabled()
+cpdef start()
+cpdef stop()
+cdef cl_event* event_ptr(cl_event* event)
+cdef record(cl_event event, name, str category, command_queue=*)
+cpdef tuple get_ranges()
+cpdef push_range(message)
+cpdef pop_range()
@@ -0,0 +1,263 @@
+"""Event-based profiler of kernels and memory transfers.
+
+While the profiler is enabled, kernels launched by
+:class:`clpy.backend.Function`, BLAS routines and buffer copies of
+:class:`clpy.backend.MemoryPointer` are enqueued with ``cl_event``, whose
+``CL_PROFILING_COMMAND_{QUEUED,SUBMIT,START,END}`` counters are collected as
+:class:`ProfileRecord`. Each record is tagged with the names of the ranges
+given by :func:`clpy.prof.time_range` at the launch.
+"""
+import collections
+import json
+import threading
+import time
+
+import six
+
+cimport clpy.backend.opencl.env
+cimport clpy.backend.opencl.utility
+import clpy.backend.opencl.api
+from clpy.backend.opencl.types cimport cl_event
+
+
+ProfileRecord = collections.namedtuple(
+    'ProfileRecord',
+    ['name', 'category', 'ranges', 'command_queue',
+     'queued', 'submit', 'start', 'end'])
+ProfileRecord.__doc__ = """Profile of a command executed on a device.
+
+Attributes:
+    name (str): Name of the kernel or the memory transfer.
+    category (str): ``'kernel'``, ``'blas'`` or ``'memcpy'``.
+    ranges (tuple of str): Names of the nested ranges given by
+        :func:`clpy.prof.time_range` at the launch.
+    command_queue (int): Pointer to the command queue, which is 0 for the
+        default command queue.
+    queued (int): Device time in nanoseconds when the command is enqueued.
+    submit (int): Device time in nanoseconds when the command is submitted.
+    start (int): Device time in nanoseconds when the command starts.
+    end (int): Device time in nanoseconds when the command ends.
+
+"""
+
+HostRangeRecord = collections.namedtuple(
+    'HostRangeRecord', ['name', 'ranges', 'thread', 'start', 'end'])
+
+
+cdef bint _enabled = False
+# records whose events may not be completed yet
+cdef list _pending = []
+cdef list _records = []
+cdef list _host_records = []
+cdef size_t _max_pending = 1024
+_lock = threading.Lock()
+_thread_local = threading.local()
+
+
+cpdef bint is_enabled():
+    """Returns ``True`` if the profiler is enabled."""
+    return _enabled
+
+
+cpdef start():
+    """Enables the profiler.
+
+    The command queues must be created with profiling enabled by
+    ``CLPY_QUEUE_PROFILING=1`` (see
+    :func:`clpy.backend.opencl.env.is_queue_profiling_enabled`).
+    """
+    global _enabled
+    if not clpy.backend.opencl.env.is_queue_profiling_enabled():
+        raise RuntimeError(
+            'The profiler requires CLPY_QUEUE_PROFILING=1')
+    _enabled = True
+
+
+cpdef stop():
+    """Disables the profiler.
+
+    The records collected so far are kept until :func:`clear` is called.
+    """
+    global _enabled
+    _enabled = False
+
+
+cdef cl_event* event_ptr(cl_event* event):
+    if _enabled:
+        return event
+    return NULL
+
+
+cdef record(cl_event event, name, str category, command_queue=None):
+    if event == NULL:
+        return
+    if command_queue is None:
+        command_queue = clpy.backend.opencl.env.get_current_command_queue()
+    rec = (<size_t>event, name, category, get_ranges(), command_queue)
+    with _lock:
+        _pending.append(rec)
+        if len(_pending) >= _max_pending:
+            _resolve(False)
+
+
+cdef _resolve(bint wait):
+    # must be called with _lock
+    global _pending
+    cdef size_t event
+    cdef list pending = []
+    for rec in _pending:
+        event = rec[0]
+        if wait:
+            clpy.backend.opencl.utility.WaitForEvent(event)
+        elif not clpy.backend.opencl.utility.IsEventComplete(event):
+            pending.append(rec)
+            continue
+        times = [clpy.backend.opencl.utility.GetEventProfilingInfo(event, p)
+                 for p in (clpy.backend.opencl.api.PROFILING_COMMAND_QUEUED,
+                           clpy.backend.opencl.api.PROFILING_COMMAND_SUBMIT,
+                           clpy.backend.opencl.api.PROFILING_COMMAND_START,
+                           clpy.backend.opencl.api.PROFILING_COMMAND_END)]
+        clpy.backend.opencl.utility.ReleaseEvent(event)
+        name = rec[1]
+        if isinstance(name, bytes):
+            name = name.decode('utf-8')
+        _records.append(ProfileRecord(name, rec[2], rec[3], rec[4], *times))
+    _pending = pending
+
+
+cpdef tuple get_ranges():
+    """Returns the names of the nested ranges of the current thread."""
+    return getattr(_thread_local, 'ranges', ())
+
+
+cpdef push_range(message):
+    """Starts a nested range of the current thread."""
+    _thread_local.ranges = get_ranges() + (message,)
+    try:
+        starts = _thread_local.starts
+    except AttributeError:
+        starts = _thread_local.starts = []
+    starts.append(time.time())
+
+
+cpdef pop_range():
+    """Ends the innermost range of the current thread."""
+    ranges = get_ranges()
+    if not ranges:
+        raise RuntimeError('No range is started')
+    _thread_local.ranges = ranges[:-1]
+    start = _thread_local.starts.pop()
+    if _enabled:
+        rec = HostRangeRecord(ranges[-1], ranges[:-1],
+                              threading.current_thread().ident,
+                              int(start * 1e9), int(time.time() * 1e9))
+        with _lock:
+            _host_records.append(rec)
+
+
+def get_records():
+    """Returns the profile records of the commands.
+
+    It waits for the commands whose records are not collected yet.
+
+    Returns:
+        list of ProfileRecord: Records in the order of their launches for
+        each command queue.
+
+    """
+    with _lock:
+        _resolve(True)
+        return list(_records)
+
+
+def get_host_records():
+    """Returns the records of the ranges measured by the host clock."""
+    with _lock:
+        return list(_host_records)
+
+
+def clear():
+    """Discards all records."""
+    global _records, _host_records
+    with _lock:
+        _resolve(True)
+        _records = []
+        _host_records = []
+
+
+def _queue_name(command_queue):
+    if command_queue == 0:
+        return 'default command queue'
+    return 'command queue 0x%x' % command_queue
+
+
+def get_chrome_trace():
+    """Returns the records in Chrome trace event format.
+
+    The trace can be viewed by ``chrome://tracing`` or Perfetto. Commands on
+    devices are shown in the ``device`` process with a thread for each
+    command queue, and ranges of :func:`clpy.prof.time_range` are shown in
+    the ``host`` process. Since device and host clocks are not synchronized,
+    the timestamps of each process start from zero.
+
+    Returns:
+        dict: JSON-serializable trace.
+
+    """
+    records = get_records()
+    host_records = get_host_records()
+    events = [
+        {'ph': 'M', 'name': 'process_name', 'pid': 0,
+         'args': {'name': 'host'}},
+        {'ph': 'M', 'name': 'process_name', 'pid': 1,
+         'args': {'name': 'device'}},
+    ]
+    for command_queue in sorted(set(r.command_queue for r in records)):
+        events.append({'ph': 'M', 'name': 'thread_name', 'pid': 1,
+                       'tid': command_queue,
+                       'args': {'name': _queue_name(command_queue)}})
+
+    if records:
+        origin = min(r.queued for r in records)
+        for r in records:
+            events.append({
+                'ph': 'X', 'name': r.name, 'cat': r.category, 'pid': 1,
+                'tid': r.command_queue,
+                'ts': (r.start - origin) / 1e3,
+                'dur': (r.end - r.start) / 1e3,
+                'args': {'ranges': list(r.ranges),
+                         'queued': (r.queued - origin) / 1e3,
+                         'submit': (r.submit - origin) / 1e3}})
+    if host_records:
+        origin = min(r.start for r in host_records)
+        for r in host_records:
+            events.append({
+                'ph': 'X', 'name': r.name, 'cat': 'time_range', 'pid': 0,
+                'tid': r.thread,
+                'ts': (r.start - origin) / 1e3,
+                'dur': (r.end - r.start) / 1e3,
+                'args': {'ranges': list(r.ranges)}})
+    return {'traceEvents': events, 'displayTimeUnit': 'ns'}
+
+
+def export_chrome_trace(file):
+    """Writes the records as a Chrome trace / Perfetto JSON file.
+
+    >>> with clpy.backend.profile():
+    ...     with clpy.prof.time_range('step'):
+    ...         y = x * 2
+    >>> clpy.backend.profiler.export_chrome_trace('trace.json')
+
+    Args:
+        file (str or file-like object): Path of the output file or a
+            writable text file object.
+
+    .. seealso:: :func:`get_chrome_trace`
+
+    """
+    trace = get_chrome_trace()
+    if isinstance(file, six.string_types):
+        with open(file, 'w') as f:
+            json.dump(trace, f)
+    else:
+        json.dump(trace, file)
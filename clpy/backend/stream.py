@@ -1,4 +1,22 @@
-# from clpy.backend import runtime
+import threading
+
+from clpy.backend.opencl import api
+from clpy.backend.opencl import env
+from clpy.backend.opencl import utility
+
+
+_thread_local = threading.local()
+
+
+def get_current_stream():
+    """Gets the current stream of the thread.
+
+    Returns:
+        clpy.cuda.Stream: The current stream. :attr:`Stream.null` is returned
+        if no stream is made current.
+
+    """
+    return getattr(_thread_local, 'current_stream', Stream.null)
 
 
 class Event(object):
@@ -8,6 +26,9 @@ class Event(object):
     This class handles the CUDA event handle in RAII way, i.e., when an Event
     instance is destroyed by the GC, its handle is also destroyed.
 
+    An event is backed by ``cl_event`` of a marker enqueued to the command
+    queue of a stream, which is created when the event is recorded.
+
     Args:
         block (bool): If ``True``, the event blocks on the
             :meth:`~clpy.cuda.Event.synchronize` method.
@@ -17,63 +38,67 @@ class Event(object):
             processes.
 
     Attributes:
-        ptr (clpy.cuda.runtime.Stream): Raw stream handle. It can be passed to
-            the CUDA Runtime API via ctypes.
+        ptr (int): Raw ``cl_event`` handle, which is 0 until the event is
+            recorded.
 
     """
 
     def __init__(self, block=False, disable_timing=False, interprocess=False):
         self.ptr = 0
-        raise NotImplementedError("clpy does not supoort this")
-
-        # if interprocess and not disable_timing:
-        #     raise ValueError(
-        #         'Timing must be disabled for interprocess events')
-        # flag = ((block and runtime.eventBlockingSync) |
-        #         (disable_timing and runtime.eventDisableTiming) |
-        #         (interprocess and runtime.eventInterprocess))
-        # self.ptr = runtime.eventCreateWithFlags(flag)
+        if interprocess:
+            raise NotImplementedError("clpy does not supoort this")
+        self.block = block
+        self.disable_timing = disable_timing
 
     def __del__(self):
         if self.ptr:
-            raise NotImplementedError("clpy does not supoort this")
-            # runtime.eventDestroy(self.ptr)
+            utility.ReleaseEvent(self.ptr)
+            self.ptr = 0
 
     @property
     def done(self):
         """True if the event is done."""
-        raise NotImplementedError("clpy does not supoort this")
-        # return runtime.eventQuery(self.ptr) == 0  # cudaSuccess
+        if self.ptr == 0:
+            return True
+        return utility.IsEventComplete(self.ptr)
 
     def record(self, stream=None):
         """Records the event to a stream.
 
         Args:
-            stream (clpy.cuda.Stream): CUDA stream to record event. The null
+            stream (clpy.cuda.Stream): CUDA stream to record event. The current
                 stream is used by default.
 
         .. seealso:: :meth:`clpy.cuda.Stream.record`
 
         """
         if stream is None:
-            stream = Stream.null
-        raise NotImplementedError("clpy does not supoort this")
-        # runtime.eventRecord(self.ptr, stream.ptr)
+            stream = get_current_stream()
+        ptr = utility.EnqueueMarker(stream.ptr)
+        # The marker is issued to the device, since neither another queue
+        # waiting for the event nor polling its status flushes the queue.
+        env.flush(stream.ptr)
+        if self.ptr:
+            utility.ReleaseEvent(self.ptr)
+        self.ptr = ptr
 
     def synchronize(self):
         """Synchronizes all device work to the event.
 
-        If the event is created as a blocking event, it also blocks the CPU
-        thread until the event is done.
+        The CPU thread waits until the event is done without holding GIL.
 
         """
-        raise NotImplementedError("clpy does not supoort this")
-        # runtime.eventSynchronize(self.ptr)
+        if self.ptr:
+            utility.WaitForEvent(self.ptr)
 
 
 def get_elapsed_time(start_event, end_event):
     """Gets the elapsed time between two events.
 
+    The command queues must be created with profiling enabled by
+    ``CLPY_QUEUE_PROFILING=1`` (see
+    :func:`clpy.backend.opencl.env.is_queue_profiling_enabled`).
+
     Args:
         start_event (Event): Earlier event.
         end_event (Event): Later event.
@@ -82,8 +107,14 @@ def get_elapsed_time(start_event, end_event):
         float: Elapsed time in milliseconds.
 
     """
-    raise NotImplementedError("clpy does not supoort this")
-    # return runtime.eventElapsedTime(start_event.ptr, end_event.ptr)
+    if start_event.disable_timing or end_event.disable_timing:
+        raise ValueError('Timing is disabled for the events')
+    end_event.synchronize()
+    start = utility.GetEventProfilingInfo(
+        start_event.ptr, api.PROFILING_COMMAND_END)
+    end = utility.GetEventProfilingInfo(
+        end_event.ptr, api.PROFILING_COMMAND_END)
+    return (end - start) * 1e-6
 
 
 class Stream(object):
@@ -93,48 +124,80 @@ class Stream(object):
     This class handles the CUDA stream handle in RAII way, i.e., when an Stream
     instance is destroyed by the GC, its handle is also destroyed.
 
+    A stream is backed by an in-order OpenCL command queue created on the
+    current device, so it must be used while the device is current. Kernels
+    and memory copies are enqueued to the command queue of the current
+    stream, which is switched by :meth:`use` or the *with* statement.
+    Commands on different streams may run concurrently; use
+    :meth:`wait_event` to order them. Note that the memory pool is shared by
+    all streams, so an array must be kept alive until the commands of other
+    streams using it are completed. A destroyed stream waits for its
+    commands, and then its free memory blocks are reused by other streams.
+
     Args:
         null (bool): If ``True``, the stream is a null stream (i.e. the default
-            stream that synchronizes with all streams). Otherwise, a plain new
-            stream is created.
-        non_blocking (bool): If ``True``, the stream does not synchronize with
-            the NULL stream.
+            stream). Otherwise, a plain new stream is created. Unlike CUDA,
+            the null stream does not synchronize with the other streams. The
+            null stream is backed by the default command queue of each thread
+            if ``CLPY_PER_THREAD_DEFAULT_QUEUE=1``.
+        non_blocking (bool): Ignored since OpenCL command queues never
+            synchronize with each other implicitly.
 
     Attributes:
-        ptr (clpy.cuda.runtime.Stream): Raw stream handle. It can be passed to
-            the CUDA Runtime API via ctypes.
+        ptr (int): Raw ``cl_command_queue`` handle, which is 0 for the null
+            stream.
 
     """
 
     null = None
 
     def __init__(self, null=False, non_blocking=False):
+        self._callbacks = []
+        self._callbacks_lock = threading.Lock()
         if null:
             self.ptr = 0
-        elif non_blocking:
-            raise NotImplementedError("clpy does not supoort this")
-            # self.ptr = runtime.streamCreateWithFlags(
-            #     runtime.streamNonBlocking)
         else:
-            raise NotImplementedError("clpy does not supoort this")
-            # self.ptr = runtime.streamCreate()
+            self.ptr = env.create_command_queue(
+                profiling=env.is_queue_profiling_enabled())
 
     def __del__(self):
         if self.ptr:
-            raise NotImplementedError("clpy does not supoort this")
-            # runtime.streamDestroy(self.ptr)
+            env.release_command_queue(self.ptr)
+            self.ptr = 0
+
+    def __enter__(self):
+        if not hasattr(_thread_local, 'prev_stream_stack'):
+            _thread_local.prev_stream_stack = []
+        _thread_local.prev_stream_stack.append(get_current_stream())
+        self.use()
+        return self
+
+    def __exit__(self, *args):
+        _thread_local.prev_stream_stack.pop().use()
+
+    def use(self):
+        """Makes this stream current in the thread.
+
+        If you want to switch a stream temporarily, use the *with* statement.
+
+        """
+        _thread_local.current_stream = self
+        env.set_current_command_queue(self.ptr)
+        return self
 
     @property
     def done(self):
         """True if all work on this stream has been done."""
-        raise NotImplementedError("clpy does not supoort this")
-        # return runtime.streamQuery(self.ptr) == 0  # cudaSuccess
+        return self.record().done
 
     def synchronize(self):
         """Waits for the stream completing all queued work."""
-        # TODO(LWisteria): Implement async/multi-commandqueue operation
-        pass
-        # runtime.streamSynchronize(self.ptr)
+        env.finish(self.ptr)
+        with self._callbacks_lock:
+            callbacks = self._callbacks
+            self._callbacks = []
+        for done in callbacks:
+            done.wait()
 
     def add_callback(self, callback, arg):
         """Adds a callback that is called when all queued work is done.
@@ -146,10 +209,20 @@ class Stream(object):
             arg (object): Argument to the callback.
 
         """
-        def f(stream, status, dummy):
-            callback(self, status, arg)
-        raise NotImplementedError("clpy does not supoort this")
-        # runtime.streamAddCallback(self.ptr, f, 0)
+        done = threading.Event()
+        event = self.record()
+
+        # the event is kept alive until the callback is called
+        def f(status, event=event):
+            try:
+                callback(self, status, arg)
+            finally:
+                done.set()
+
+        with self._callbacks_lock:
+            self._callbacks = [d for d in self._callbacks if not d.is_set()]
+            self._callbacks.append(done)
+        utility.SetEventCallback(event.ptr, f)
 
     def record(self, event=None):
         """Records an event on the stream.
@@ -166,8 +239,7 @@ class Stream(object):
         """
         if event is None:
             event = Event()
-        raise NotImplementedError("clpy does not supoort this")
-        # runtime.eventRecord(event.ptr, self.ptr)
+        event.record(self)
         return event
 
     def wait_event(self, event):
@@ -179,8 +251,8 @@ class Stream(object):
             event (clpy.cuda.Event): CUDA event.
 
         """
-        raise NotImplementedError("clpy does not supoort this")
-        # runtime.streamWaitEvent(self.ptr, event.ptr)
+        if event.ptr:
+            utility.EnqueueWaitForEvents(self.ptr, [event.ptr])
 
 
 Stream.null = Stream(null=True)
@@ -0,0 +1,2 @@
+from clpy.backend.ultima.translator import translate  # NOQA
+from clpy.backend.ultima.translator import translate_many  # NOQA
@@ -0,0 +1,197 @@
+import atexit
+import multiprocessing
+import os
+import subprocess
+import tempfile
+import threading
+import time
+
+import six
+
+import clpy
+from clpy.backend.ultima import exceptions
+
+
+_timeout = 15
+
+
+def _get_ultima_path():
+    root_dir = os.path.join(clpy.__path__[0], '..')
+    return os.path.join(root_dir, 'ultima', 'ultima')
+
+
+def _get_include_path():
+    return os.path.join(clpy.__path__[0], 'core', 'include')
+
+
+def _read_exactly(stream, size):
+    data = stream.read(size)
+    if len(data) != size:
+        raise EOFError('ultima worker terminated unexpectedly')
+    return data
+
+
+class _UltimaWorker(object):
+
+    """Long-lived ultima process which translates sources sent via a pipe.
+
+    Spawning ultima and initializing clang for each kernel dominates the
+    translation time of small kernels, so a single process started with
+    ``--server`` option is reused for all translations. The worker is
+    restarted if it dies or exceeds the timeout.
+    """
+
+    def __init__(self):
+        self._proc = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        self._proc = subprocess.Popen(
+            [_get_ultima_path(), '--server', '-I', _get_include_path()],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE)
+
+    def translate(self, source):
+        data = source.encode('utf-8')
+        with self._lock:
+            if self._proc is None or self._proc.poll() is not None:
+                self._start()
+            proc = self._proc
+            # kill the worker on timeout, which makes the read below fail
+            timer = threading.Timer(_timeout, proc.kill)
+            timer.start()
+            try:
+                proc.stdin.write(('%d\n' % len(data)).encode('ascii'))
+                proc.stdin.write(data)
+                proc.stdin.flush()
+                header = proc.stdout.readline().split()
+                if len(header) != 3:
+                    raise EOFError('ultima worker terminated unexpectedly')
+                status, output_size, diagnostics_size = map(int, header)
+                output = _read_exactly(proc.stdout, output_size)
+                diagnostics = _read_exactly(proc.stdout, diagnostics_size)
+            except (IOError, OSError, EOFError) as e:
+                self._proc = None
+                proc.kill()
+                proc.wait()
+                raise exceptions.UltimaRuntimeError(proc.returncode, str(e))
+            finally:
+                timer.cancel()
+
+        if status != 0 and len(diagnostics) > 0:
+            raise exceptions.UltimaRuntimeError(
+                status, diagnostics.decode('utf-8'))
+        return output.decode('utf-8')
+
+    def close(self):
+        with self._lock:
+            proc = self._proc
+            self._proc = None
+        if proc is not None and proc.poll() is None:
+            proc.stdin.close()
+            proc.wait()
+
+
+_max_workers = multiprocessing.cpu_count()
+_workers = []
+_workers_lock = threading.Lock()
+# the most recently used worker is reused first
+_idle_workers = six.moves.queue.LifoQueue()
+
+
+@atexit.register
+def _close_worker():
+    for worker in _workers:
+        worker.close()
+
+
+def _acquire_worker():
+    try:
+        return _idle_workers.get_nowait()
+    except six.moves.queue.Empty:
+        pass
+    with _workers_lock:
+        if len(_workers) < _max_workers:
+            worker = _UltimaWorker()
+            _workers.append(worker)
+            return worker
+    return _idle_workers.get()
+
+
+def _save_source(source):
+    if os.getenv('CLPY_SAVE_PRE_KERNEL_SOURCE') == '1':
+        filename = os.path.join(
+            tempfile.gettempdir(), str(time.monotonic()) + '.cpp')
+        with open(filename, 'w') as f:
+            f.write(source)
+
+
+def translate(source):
+    """Translates a kernel source written in C++ into OpenCL C.
+
+    The source is passed to a reused ultima process through a pipe, so that
+    neither a temporary file nor a new process is required for each kernel.
+    Up to the number of CPUs processes are started when called from multiple
+    threads.
+
+    Args:
+        source (str): Kernel source.
+
+    Returns:
+        str: Translated OpenCL C source.
+
+    """
+    _save_source(source)
+    worker = _acquire_worker()
+    try:
+        return worker.translate(source)
+    finally:
+        _idle_workers.put(worker)
+
+
+def _translate_jobs(jobs, results):
+    while True:
+        try:
+            i, source = jobs.pop()
+        except IndexError:
+            return
+        try:
+            results[i] = translate(source)
+        except Exception as e:
+            results[i] = e
+
+
+def translate_many(sources, max_workers=None):
+    """Translates kernel sources concurrently.
+
+    The sources are distributed over up to ``max_workers`` ultima processes,
+    which are kept alive and reused as :func:`translate` does.
+
+    Args:
+        sources (list of str): Kernel sources.
+        max_workers (int): Maximum number of concurrent translations. The
+            number of CPUs is used by default.
+
+    Returns:
+        list of str: Translated OpenCL C sources in the same order as
+        ``sources``.
+
+    """
+    if max_workers is None:
+        max_workers = _max_workers
+    n_threads = max(1, min(max_workers, len(sources)))
+
+    jobs = list(enumerate(sources))
+    results = [None] * len(sources)
+    threads = [threading.Thread(target=_translate_jobs, args=(jobs, results))
+               for _ in range(n_threads - 1)]
+    for thread in threads:
+        thread.start()
+    _translate_jobs(jobs, results)
+    for thread in threads:
+        thread.join()
+
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+    return results
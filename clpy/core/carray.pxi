@@ -1,19 +1,20 @@
 import functools
 import operator
 import os
-import subprocess
-import tempfile
-import time
 import warnings
 
 
 from clpy import backend
+from clpy.backend import compiler
+from clpy.backend import ultima
 from clpy.backend cimport function
 # from clpy.backend cimport runtime
 cimport clpy.backend.opencl.api
 cimport clpy.backend.opencl.utility
 import clpy.backend.opencl.env
 cimport clpy.backend.opencl.env
+import clpy.backend.opencl.exceptions
+from clpy.backend.opencl.types cimport cl_program
 
 
 cdef class Indexer:
@@ -131,19 +132,6 @@ cpdef str _get_cuda_path():
     return _cuda_path
 
 
-class TempFile(object):
-    def __init__(self, filename, source):
-        self.fn = filename
-        self.s = source
-
-    def __enter__(self):
-        with open(self.fn, 'w') as f:
-            f.write(self.s)
-
-    def __exit__(self, exception_type, exception_value, traceback):
-        if os.getenv("CLPY_SAVE_PRE_KERNEL_SOURCE") != "1":
-            os.remove(self.fn)
-
 cpdef function.Module compile_with_cache(
         str source, tuple options=(), arch=None, cachd_dir=None):
     source = _clpy_header + '\n' \
@@ -153,45 +141,151 @@ cpdef function.Module compile_with_cache(
         'static void __clpy_end_print_out()' \
         '__attribute__((annotate("clpy_end_print_out")));\n'
 
-    filename = tempfile.gettempdir() + "/" + str(time.monotonic()) + ".cpp"
-
-    with TempFile(filename, source) as tf:
-        root_dir = os.path.join(clpy.__path__[0], "..")
-        proc = subprocess.Popen('{} {} -- -I {}'
-                                .format(os.path.join(root_dir,
-                                                     "ultima",
-                                                     "ultima"),
-                                        filename,
-                                        os.path.join(root_dir,
-                                                     "clpy",
-                                                     "core",
-                                                     "include"))
-                                .strip().split(" "),
-                                stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE,
-                                universal_newlines=True)
-        try:
-            source, errstream = proc.communicate(timeout=15)
-            proc.wait()
-        except subprocess.TimeoutExpired:
-            proc.kill()
-            source, errstream = proc.communicate()
-
-        if proc.returncode != 0 and len(errstream) > 0:
-            raise clpy.backend.ultima.exceptions.UltimaRuntimeError(
-                proc.returncode, errstream)
-
-    extra_source = _get_header_source()
+    cdef function.Module module = function.Module()
+    # identifies the kernels across processes for the auto-tuner
+    module.key = compiler.get_cache_key(source, options)
+    entry = (module, source, options, cachd_dir)
+    batch = compiler.get_current_batch()
+    if batch is None:
+        _build_programs([entry])
+    else:
+        module.batch = batch
+        batch.add(entry)
+    return module
+
+
+cpdef _build_programs(list entries):
+    """Translates and builds the sources of modules.
+
+    Args:
+        entries (list): Tuples of a module, its source, options and cache
+            directory. The sources which are not cached are translated by
+            concurrent ultima processes, and each distinct program is built
+            only once.
+
+    """
+    cdef function.Module module
+    cdef bint use_cache = compiler.is_cache_enabled()
+    translated = {}
+    cache_entries = {}
+    pending = []
+
+    # The translated source is cached on disk and shared between processes.
+    # The key covers everything which can change the output of ultima.
+    if use_cache:
+        header_hash = compiler.get_dir_hash(_get_header_dir_path())
+        ultima_hash = compiler.get_file_hash(
+            ultima.translator._get_ultima_path())
+    for _, source, options, cache_dir in entries:
+        key = (source, options)
+        if key in translated or key in cache_entries:
+            continue
+        if use_cache:
+            name = '%s.cl' % compiler.get_cache_key(
+                source, options, header_hash, ultima_hash)
+            cache_entries[key] = (name, cache_dir)
+            cached = compiler.load_from_cache(name, cache_dir)
+            if cached is not None:
+                translated[key] = cached.decode('utf-8')
+                continue
+        else:
+            cache_entries[key] = None
+        pending.append(key)
+
+    if pending:
+        results = ultima.translate_many([source for source, _ in pending])
+        for key, result in zip(pending, results):
+            translated[key] = result
+            if use_cache:
+                name, cache_dir = cache_entries[key]
+                compiler.save_to_cache(
+                    name, result.encode('utf-8'), cache_dir)
+
+    programs = {}
+    for module, source, options, _ in entries:
+        key = (source, options)
+        if key not in programs:
+            programs[key] = _create_program(translated[key], options)
+        module.set(<cl_program><size_t>programs[key])
+
+
+# library programs of the devices, which are 0 if they cannot be built
+cdef dict _device_libraries = {}
+
+
+cpdef bint _is_device_library_supported() except *:
+    # clCompileProgram and clLinkProgram are available since OpenCL 1.2
+    version = clpy.backend.opencl.utility.GetDeviceIdentity(
+        clpy.backend.opencl.env.get_primary_device())[3].split()
+    try:
+        major, minor = version[1].split('.')[:2]
+        return (int(major), int(minor)) >= (1, 2)
+    except (IndexError, ValueError):
+        return False
+
+
+cdef cl_program _get_device_library() except *:
+    """Returns the library of the common device functions.
+
+    The functions defined with ``__CLPY_LIBRARY_FUNCTION`` in
+    ``clpy/carray.clh`` are compiled once for each device into the library,
+    so that each kernel only declares them and links against the library.
+    The library is enabled by ``CLPY_USE_DEVICE_LIBRARY=1`` on OpenCL 1.2 or
+    later devices. Returns NULL if it is disabled or cannot be built.
+    """
+    cdef int device_id
+    cdef size_t library
+    # The variable is read on each build, since the library is cached per
+    # device regardless of it.
+    if os.getenv('CLPY_USE_DEVICE_LIBRARY') != '1':
+        return NULL
+    device_id = clpy.backend.opencl.env.get_current_device_id()
+    if device_id in _device_libraries:
+        return <cl_program><size_t>_device_libraries[device_id]
+    if not _is_device_library_supported():
+        _device_libraries[device_id] = 0
+        return NULL
+
+    header_path = os.path.join(_get_header_dir_path(), 'clpy', 'carray.clh')
+    with open(header_path) as header_file:
+        source = '#define __CLPY_DEVICE_LIBRARY\n' + header_file.read()
+    options = ('-I%s' % _get_header_dir_path()
+               + ' -cl-fp32-correctly-rounded-divide-sqrt')
+    try:
+        library = <size_t>clpy.backend.opencl.utility.CreateLibrary(
+            [source.encode('utf-8')],
+            clpy.backend.opencl.env.get_context(),
+            clpy.backend.opencl.env.get_primary_device(),
+            options.encode('utf-8'))
+    except clpy.backend.opencl.exceptions.OpenCLRuntimeError as e:
+        warnings.warn('Failed to build the device library, so the common '
+                      'device functions are compiled into each kernel: '
+                      '{}'.format(e))
+        library = 0
+    _device_libraries[device_id] = library
+    return <cl_program>library
+
+
+cpdef bint _uses_device_library() except *:
+    """Returns ``True`` if kernels built now are linked against the library.
+
+    The library of the current device is built if it is not built yet.
+    """
+    return _get_device_library() != NULL
+
+
+cdef size_t _create_program(str source, tuple options) except *:
+    cdef cl_program library = _get_device_library()
     options += ('-I%s' % _get_header_dir_path(),)
     options += (' -cl-fp32-correctly-rounded-divide-sqrt', )
+    if library != NULL:
+        options += (' -D__CLPY_USE_DEVICE_LIBRARY', )
     optionStr = functools.reduce(operator.add, options)
 
-    program = clpy.backend.opencl.utility.CreateProgram(
+    return <size_t>clpy.backend.opencl.utility.CreateProgram(
         [source.encode('utf-8')],
         clpy.backend.opencl.env.get_context(),
-        clpy.backend.opencl.env.num_devices,
+        1,
         clpy.backend.opencl.env.get_devices_ptrs(),
-        optionStr.encode('utf-8'))
-    cdef function.Module module = function.Module()
-    module.set(program)
-    return module
+        optionStr.encode('utf-8'),
+        library)
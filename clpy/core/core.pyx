@@ -22,7 +22,7 @@ from libcpp cimport vector
 from clpy.core cimport internal
 cimport clpy.backend.opencl.blas
 from clpy.backend cimport function
-# from clpy.backend cimport pinned_memory
+from clpy.backend cimport pinned_memory
 # from clpy.backend cimport runtime
 from clpy.backend cimport memory
 
@@ -443,10 +443,15 @@ cdef class ndarray:
                     'non-scalar numpy.ndarray cannot be used for fill')
             value = value.item()
 
-#        if value == 0 and self._c_contiguous:
-#            self.data.memset_async(0, self.nbytes, stream.Stream(True))
-#        else:
-        elementwise_copy(value, self, dtype=self.dtype)
+        if ((self._c_contiguous or self._f_contiguous) and
+                self.data.cl_mem_offset() % self.itemsize == 0 and
+                (self.dtype.kind == 'c' or not numpy.iscomplexobj(value))):
+            # contiguous arrays are filled by clEnqueueFillBuffer without
+            # compiling and launching a kernel
+            pattern = numpy.array(value).astype(self.dtype).tobytes()
+            self.data.fill(pattern, self.nbytes)
+        else:
+            elementwise_copy(value, self, dtype=self.dtype)
 
     # -------------------------------------------------------------------------
     # Shape manipulation
@@ -1679,25 +1684,34 @@ cdef class ndarray:
 
         Args:
             stream (clpy.backend.Stream): CUDA stream object. If it is given,
-                the copy runs asynchronously. Otherwise, the copy is
-                synchronous.
+                the copy runs asynchronously and the returned array must not
+                be read until the stream is synchronized. Otherwise, the copy
+                is synchronous.
 
         Returns:
-            numpy.ndarray: Copy of the array on host memory.
+            numpy.ndarray: Copy of the array on host memory. If ``stream`` is
+            given, it is a view of a pinned memory allocated by
+            :func:`clpy.backend.alloc_pinned_memory`, which is returned to
+            the pool when the array is released if the allocator is
+            :meth:`clpy.backend.PinnedMemoryPool.malloc`.
 
         """
         if self.size == 0:
             return numpy.ndarray(self.shape, dtype=self.dtype)
 
-#        with self.device:
-#            a_gpu = ascontiguousarray(self)
-        a_gpu = ascontiguousarray(self)
-        a_cpu = numpy.empty(self._shape, dtype=self.dtype)
-        ptr = a_cpu.ctypes.get_as_parameter()
-        if stream is None:
-            a_gpu.data.copy_to_host(ptr, a_gpu.nbytes)
-        else:
-            a_gpu.data.copy_to_host_async(ptr, a_gpu.nbytes, stream)
+        with self.device:
+            a_gpu = ascontiguousarray(self)
+            if stream is None:
+                a_cpu = numpy.empty(self._shape, dtype=self.dtype)
+                ptr = a_cpu.ctypes.get_as_parameter()
+                a_gpu.data.copy_to_host(ptr, a_gpu.nbytes)
+            else:
+                mem = pinned_memory.alloc_pinned_memory(a_gpu.nbytes)
+                a_cpu = numpy.frombuffer(mem, self.dtype, self.size).reshape(
+                    self._shape)
+                ptr = a_cpu.ctypes.get_as_parameter()
+                a_gpu.data.copy_to_host_async(ptr, a_gpu.nbytes, stream)
+                pinned_memory._add_to_watch_list(stream.record(), a_cpu)
         return a_cpu
 
     cpdef set(self, arr, stream=None):
@@ -1706,7 +1720,8 @@ cdef class ndarray:
         Args:
             arr (numpy.ndarray): The source array on the host memory.
             stream (clpy.backend.Stream): CUDA stream object. If it is given,
-                the copy runs asynchronously. Otherwise, the copy is
+                the copy runs asynchronously and ``arr`` must not be modified
+                until the stream is synchronized. Otherwise, the copy is
                 synchronous.
 
         """
@@ -1726,11 +1741,16 @@ cdef class ndarray:
         else:
             raise RuntimeError('Cannot set to non-contiguous array')
 
+        if self.size == 0:
+            return
+
         ptr = arr.ctypes.get_as_parameter()
-        if stream is None:
-            self.data.copy_from_host(ptr, self.nbytes)
-        else:
-            self.data.copy_from_host_async(ptr, self.nbytes, stream)
+        with self.device:
+            if stream is None:
+                self.data.copy_from_host(ptr, self.nbytes)
+            else:
+                self.data.copy_from_host_async(ptr, self.nbytes, stream)
+                pinned_memory._add_to_watch_list(stream.record(), arr)
 
     cpdef ndarray reduced_view(self, dtype=None):
         """Returns a view of the array with minimum number of dimensions.
@@ -2214,6 +2234,14 @@ cdef _argmax = create_reduction_func(
 # Array creation routines
 # -----------------------------------------------------------------------------
 
+cdef bint _can_share_host_memory(a_cpu) except *:
+    return (memory.is_zero_copy_enabled() and
+            a_cpu.size > 0 and
+            a_cpu.flags.c_contiguous and
+            a_cpu.flags.writeable and
+            a_cpu.ctypes.data % memory.get_subbuffer_alignment() == 0)
+
+
 cpdef ndarray array(obj, dtype=None, bint copy=True, str order='K',
                     bint subok=False, Py_ssize_t ndmin=0):
     # TODO(beam2d): Support subok options
@@ -2226,15 +2254,11 @@ cpdef ndarray array(obj, dtype=None, bint copy=True, str order='K',
         if dtype is None:
             dtype = src.dtype
 
-        # --- device is not implemented ---
-        # dev = src.data.device
-        # if dev is None or dev.id == device.get_device_id():
-        #     a = src.astype(dtype, order=order, copy=copy)
-        # else:
-        #     a = src.copy(order=order).astype(dtype, copy=False)
-        # --- device is not implemented ---
-
-        a = src.astype(dtype, order=order, copy=copy)
+        dev = src.data.device
+        if dev is None or dev.id == device.get_device_id():
+            a = src.astype(dtype, order=order, copy=copy)
+        else:
+            a = src.copy(order=order).astype(dtype, copy=False)
 
         ndim = a._shape.size()
         if ndmin > ndim:
@@ -2251,20 +2275,29 @@ cpdef ndarray array(obj, dtype=None, bint copy=True, str order='K',
         a_dtype = a_cpu.dtype
         if a_dtype.char not in '?bhilqBHILQefdFD':
             raise ValueError('Unsupported dtype %s' % a_dtype)
+        if not copy and _can_share_host_memory(a_cpu):
+            return ndarray(a_cpu.shape, dtype=a_dtype,
+                           memptr=memory.MemoryPointer(
+                               memory.HostMemory(a_cpu), 0))
         a = ndarray(a_cpu.shape, dtype=a_dtype, order=order)
         if a_cpu.ndim == 0:
             a.fill(a_cpu[()])
             return a
-        a.set(a_cpu)
-        # TODO(LWisteria): Use ALLOC_HOST_PTR and clEnqueueMapBuffer
-        #                  instead of above set()
-#        mem = pinned_memory.alloc_pinned_memory(a.nbytes)
-#        src_cpu = numpy.frombuffer(mem, a_cpu.dtype,
-#                                   a_cpu.size).reshape(a_cpu.shape)
-#        src_cpu[...] = a_cpu
-#        stream = cuda.Stream.null
-#        a.set(src_cpu, stream)
-#        pinned_memory._add_to_watch_list(stream.record(), mem)
+        stream = clpy.backend.stream.get_current_stream()
+        if pinned_memory._is_allocator_pooled():
+            mem = pinned_memory.alloc_pinned_memory(a.nbytes)
+            src_cpu = numpy.frombuffer(mem, a_cpu.dtype,
+                                       a_cpu.size).reshape(a_cpu.shape)
+            src_cpu[...] = a_cpu
+            a.set(src_cpu, stream)
+            pinned_memory._add_to_watch_list(stream.record(), mem)
+        else:
+            # The source is copied unless it is a private array, since the
+            # caller may modify it before the asynchronous copy is done.
+            # ndarray.set keeps it alive until then.
+            if a_cpu is obj or a_cpu.base is not None:
+                a_cpu = numpy.array(a_cpu, order=order)
+            a.set(a_cpu, stream)
     return a
 
 
@@ -4381,7 +4414,11 @@ cpdef ndarray scan(ndarray a, ndarray out=None):
     if a.ndim != 1:
         raise TypeError("Input array should be 1D array.")
 
-    block_size = 256
+    # Each block of 2 * block_size elements is scanned in the local memory,
+    # and the blocked sums are added by work-groups of 2 * block_size - 1.
+    info = clpy.backend.device.get_device_info()
+    block_size = info.get_work_group_size(
+        min(256, (info.max_work_group_size + 1) // 2), 2 * a.itemsize)
 
     if out is None:
         out = ndarray(a.shape, dtype=a.dtype)
@@ -1,3 +1,4 @@
+import re
 import string
 
 import numpy
@@ -13,6 +14,17 @@ cimport clpy.backend.opencl.api
 import clpy.backend.opencl.types
 cimport clpy.backend.opencl.utility
 
+
+# Jump statements in an operation would leave the loop over the elements of
+# a work-item instead of the operation of an element, so such an operation is
+# launched with one element per work-item.
+cdef object _jump_statement = re.compile(r'\b(?:return|break|continue)\b')
+
+
+cdef bint _has_jump_statement(str operation) except *:
+    return _jump_statement.search(operation) is not None
+
+
 cpdef _get_simple_elementwise_kernel(
         params, operation, name, preamble,
         loop_prep='', after_loop='', options=(),
@@ -25,13 +37,19 @@ cpdef _get_simple_elementwise_kernel(
     __kernel void ${name}(${params}) {
       ${clpy_variables_declaration}
       ${loop_prep};
-      // TODO: Add offset and/or stride
-      const size_t i = get_global_id(0);
-      __attribute__((annotate("clpy_elementwise_tag"))) \
-        void __clpy_elementwise_preprocess();
-      ${operation};
-      __attribute__((annotate("clpy_elementwise_tag"))) \
-        void __clpy_elementwise_postprocess();
+      // The grid-stride loop allows any number of work-items, so that the
+      // launch configuration can be tuned.
+      for (size_t _i = get_global_id(0); ; _i += get_global_size(0)) {
+        const size_t i = _i;
+        __attribute__((annotate("clpy_elementwise_tag"))) \
+          void __clpy_elementwise_preprocess();
+        if (i >= _ind.size()) {
+          break;
+        }
+        ${operation};
+        __attribute__((annotate("clpy_elementwise_tag"))) \
+          void __clpy_elementwise_postprocess();
+      }
       ${after_loop};
     }
     ''').substitute(
@@ -43,7 +61,160 @@ cpdef _get_simple_elementwise_kernel(
         after_loop=after_loop,
         clpy_variables_declaration=clpy_variables_declaration)
     module = compile_with_cache(module_code, options)
-    return module.get_function(name)
+    cdef function.Function kern = module.get_function(name)
+    kern.tunable = not _has_jump_statement(operation)
+    return kern
+
+
+cdef Py_ssize_t _vector_width = 4
+
+
+cdef str _get_contiguous_element(
+        tuple variables, operation, str index, str load, str store):
+    # load and store are formatted with the name of the variable and the type
+    # of the array elements
+    code = ['const size_t i = %s;' % index,
+            '__attribute__((annotate("clpy_elementwise_tag"))) '
+            'void __clpy_elementwise_preprocess();']
+    for n, t, array_type, is_input, loaded in variables:
+        if loaded:
+            # inputs are const in OpenCL C as the variables declared by
+            # clpy_elementwise_tag
+            code.append('%s%s %s = %s;' % (
+                '__attribute__((annotate("clpy_const"))) ' if is_input else '',
+                t, n, load.format(n=n, t=array_type)))
+        else:
+            code.append('%s %s;' % (t, n))
+    code.append(operation + ';')
+    for n, t, array_type, is_input, loaded in variables:
+        if not is_input:
+            code.append(store.format(n=n, t=array_type))
+    return '{\n' + '\n'.join(code) + '\n}'
+
+
+cpdef _get_contiguous_elementwise_kernel(
+        params, tuple variables, operation, name, preamble, Py_ssize_t width,
+        loop_prep='', after_loop='', options=(),
+        clpy_variables_declaration=''):
+    """Generates an elementwise kernel specialized for contiguous arrays.
+
+    The element variables are loaded from and stored to the data of the
+    arrays indexed by ``i`` directly instead of by ``CArray``. If ``width`` is
+    larger than 1, ``width`` elements are loaded and stored at once by
+    ``vload`` and ``vstore`` and the operation is unrolled for them.
+
+    Args:
+        variables (tuple): Tuples of the name, the type of the variable, the
+            type of the array elements, whether the variable is an input and
+            whether the variable is loaded from the array, for each non-raw
+            array.
+        width (int): Number of the elements loaded by a vector.
+
+    """
+    if loop_prep != '' or after_loop != '':
+        raise NotImplementedError("clpy does not support this")
+
+    cdef Py_ssize_t k
+    data = '{n}_data + {n}_info.offset / sizeof({t})'
+    vector_loop = ''
+    if width > 1:
+        code = []
+        for n, t, array_type, is_input, loaded in variables:
+            if loaded:
+                code.append('%s%s%d _%s_v = vload%d(_j, %s);' % (
+                    'const ' if is_input else '', array_type, width, n,
+                    width, data.format(n=n, t=array_type)))
+            else:
+                code.append('%s%d _%s_v;' % (array_type, width, n))
+        for k in range(width):
+            code.append(_get_contiguous_element(
+                variables, operation, '_j * %d + %d' % (width, k),
+                '_{n}_v.s%d' % k, '_{n}_v.s%d = {n};' % k))
+        for n, t, array_type, is_input, loaded in variables:
+            if not is_input:
+                code.append('vstore%d(_%s_v, _j, %s);' % (
+                    width, n, data.format(n=n, t=array_type)))
+        vector_loop = string.Template('''
+      for (size_t _j = get_global_id(0); _j < _n / ${width};
+           _j += get_global_size(0)) {
+        ${code}
+      }
+    ''').substitute(width=width, code='\n'.join(code))
+
+    scalar_loop = _get_contiguous_element(
+        variables, operation, '_i',
+        '{n}_data[{n}_info.offset / sizeof({t}) + i]',
+        '{n}_data[{n}_info.offset / sizeof({t}) + i] = {n};')
+
+    module_code = string.Template('''
+    ${preamble}
+    __kernel void ${name}(${params}) {
+      ${clpy_variables_declaration}
+      const size_t _n = ${size};
+      ${vector_loop}
+      for (size_t _i = _n / ${width} * ${width} + get_global_id(0); _i < _n;
+           _i += get_global_size(0)) {
+        ${scalar_loop}
+      }
+    }
+    ''').substitute(
+        params=params,
+        name=name,
+        preamble=preamble,
+        size='%s_info.size_' % variables[0][0],
+        width=width,
+        vector_loop=vector_loop,
+        scalar_loop=scalar_loop,
+        clpy_variables_declaration=clpy_variables_declaration)
+    module = compile_with_cache(module_code, options)
+    cdef function.Function kern = module.get_function(name)
+    kern.tunable = True
+    return kern
+
+
+cpdef Py_ssize_t _get_contiguous_width(list args, tuple params) except -1:
+    """Decides the specialization of an elementwise kernel for the arguments.
+
+    Returns:
+        int: Number of the elements loaded by a vector if all the non-raw
+        arrays are one-dimensional and C-contiguous, e.g. arrays of the same
+        shape reduced by ``_reduce_dims``, which is 1 if any of them is not
+        aligned to the vector. Otherwise 0.
+
+    """
+    cdef ParameterInfo p
+    cdef ndarray arr
+    cdef Py_ssize_t i, width = 0
+    for i in range(len(args)):
+        p = params[i]
+        if p.raw or not isinstance(args[i], ndarray):
+            continue
+        arr = args[i]
+        if arr._shape.size() != 1 or arr._strides[0] != arr.itemsize:
+            return 0
+        if width == 0:
+            width = _vector_width
+        if arr.data.cl_mem_offset() % (arr.itemsize * _vector_width) != 0:
+            width = 1
+    return width
+
+
+cdef tuple _get_contiguous_precompile_widths(tuple params, Py_ssize_t ndim):
+    # contiguous arrays, whose dimensions are reduced to one, are launched
+    # with the specializations decided by _get_contiguous_width
+    cdef ParameterInfo p
+    if ndim == 1:
+        for p in params:
+            if not p.raw:
+                return _vector_width, 1
+    return ()
+
+
+cdef Py_ssize_t _get_launch_size(Py_ssize_t size, Py_ssize_t width):
+    # each work-item of a contiguous kernel processes a vector
+    if width <= 1:
+        return size
+    return (size + width - 1) // width
 
 
 cdef dict _typenames_base = {
@@ -135,20 +306,18 @@ cpdef list _preprocess_args(args):
     - Converts Python scalars into NumPy scalars
     """
     cdef list ret = []
-#    cdef int dev_id = device.get_device_id()
+    cdef int dev_id = device.get_device_id()
     cdef type typ
 
     for arg in args:
         typ = type(arg)
         if typ is ndarray:
-            pass
-            # TODO(LWisteria): Implement OpenCL device check
-#            arr_dev = (<ndarray?>arg).data.device
-#            if arr_dev is not None and arr_dev.id != dev_id:
-#                raise ValueError(
-#                    'Array device must be same as the current '
-#                    'device: array device = %d while current = %d'
-#                    % (arr_dev.id, dev_id))
+            arr_dev = (<ndarray?>arg).data.device
+            if arr_dev is not None and arr_dev.id != dev_id:
+                raise ValueError(
+                    'Array device must be same as the current '
+                    'device: array device = %d while current = %d'
+                    % (arr_dev.id, dev_id))
         elif typ in _python_scalar_type_set:
             arg = _python_scalar_to_numpy_scalar(arg)
         elif typ in _numpy_scalar_type_set:
@@ -458,7 +627,7 @@ cdef list _get_out_args_with_params(
 
 @util.memoize(for_each_device=True)
 def _get_elementwise_kernel(args_info, types, params, operation, name,
-                            preamble, kwargs):
+                            preamble, kwargs, width=0):
     kernel_params, ndims = _get_kernel_params(params, args_info)
     ndim = ndims['_ind']
     types_preamble = '\n'.join(
@@ -467,6 +636,7 @@ def _get_elementwise_kernel(args_info, types, params, operation, name,
 
     op = []
     clvd = []
+    variables = []
     for p, a in zip(params, args_info):
         if a[0] == ndarray:
             if not p.raw:
@@ -475,10 +645,17 @@ def _get_elementwise_kernel(args_info, types, params, operation, name,
                 op.append(fmt.format(t=p.ctype, n=p.name))
                 clvd.append('__attribute__((annotate("clpy_ignore"))) '
                             '{t}* {n}_data;'.format(t=p.ctype, n=p.name))
+                variables.append(
+                    (p.name, p.ctype, _get_typename(a[1]), p.is_const, True))
             clvd.append('__attribute__((annotate("clpy_ignore"))) '
                         'CArray_{ndim} {n}_info;'.format(n=p.name, ndim=a[2]))
-    operation = '\n'.join(op) + operation
     clpy_variables_declaration = '\n'.join(clvd)
+    if width != 0:
+        return _get_contiguous_elementwise_kernel(
+            kernel_params, tuple(variables), operation, name, preamble,
+            width, **dict(kwargs),
+            clpy_variables_declaration=clpy_variables_declaration)
+    operation = '\n'.join(op) + operation
     return _get_simple_elementwise_kernel(
         kernel_params, operation, name,
         preamble, **dict(kwargs),
@@ -502,7 +679,11 @@ cdef class ElementwiseKernel:
     Args:
         in_params (str): Input argument list.
         out_params (str): Output argument list.
-        operation (str): The body in the loop written in CUDA-C/C++.
+        operation (str): The body in the loop written in CUDA-C/C++. If it
+            contains ``return``, ``break`` or ``continue``, the kernel is
+            launched with one element per work-item, i.e. it is neither
+            vectorized nor auto-tuned, and ``break`` and ``continue`` must
+            be in a loop of the operation.
         name (str): Name of the kernel function. It should be set for
             readability of the performance profiling.
         reduce_dims (bool): If ``False``, the shapes of array arguments are
@@ -533,6 +714,7 @@ cdef class ElementwiseKernel:
         readonly bint reduce_dims
         readonly str preamble
         readonly object kwargs
+        bint _has_jump
 
     def __init__(self, in_params, out_params, operation,
                  name='kernel', reduce_dims=True, preamble='', **kwargs):
@@ -549,6 +731,7 @@ cdef class ElementwiseKernel:
         self.params = self.in_params + self.out_params + param_rest
 
         self.operation = operation
+        self._has_jump = _has_jump_statement(operation)
         self.name = name
         self.reduce_dims = reduce_dims
         self.preamble = preamble
@@ -624,34 +807,79 @@ cdef class ElementwiseKernel:
             inout_args, shape = _reduce_dims(
                 inout_args, self.params, shape)
         indexer = Indexer(shape)
+        if self._has_jump:
+            width = 0
+        else:
+            width = _get_contiguous_width(inout_args, self.params)
         inout_args.append(indexer)
 
         args_info = _get_args_info(inout_args)
 
         kern = _get_elementwise_kernel(
             args_info, types, self.params, self.operation,
-            self.name, self.preamble, self.kwargs)
-        kern.linear_launch(indexer.size, inout_args)
+            self.name, self.preamble, self.kwargs, width)
+        kern.linear_launch(_get_launch_size(indexer.size, width), inout_args)
         return ret
 
+    def _get_precompile_specs(self, dtypes, ndims):
+        """Lists specializations for :mod:`clpy.backend.precompile`."""
+        specs = []
+        for dtype in dtypes:
+            if not isinstance(dtype, tuple):
+                dtype = (dtype,) * self.nin
+            chars = tuple([numpy.dtype(t).char for t in dtype])
+            for ndim in ndims:
+                specs.append((chars, ndim))
+        return specs
+
+    def compile_async(self, dtypes, ndims=(1,)):
+        """Same as :func:`clpy.backend.compile_async` for this kernel."""
+        return compiler.compile_async(self, dtypes, ndims)
+
+    def _precompile(self, spec):
+        """Compiles a specialization for arrays without invoking it."""
+        chars, ndim = spec
+        in_ndarray_types = tuple([numpy.dtype(c).type for c in chars])
+        in_types, out_types, types = _decide_params_type(
+            self.in_params, self.out_params, in_ndarray_types, ())
+        args_info = tuple(
+            [(ndarray, t, ndim) for t in in_types + out_types] +
+            [(Indexer, None, ndim)])
+        kern = _get_elementwise_kernel(
+            args_info, types, self.params, self.operation,
+            self.name, self.preamble, self.kwargs, 0)
+        if not self._has_jump:
+            for width in _get_contiguous_precompile_widths(self.params, ndim):
+                _get_elementwise_kernel(
+                    args_info, types, self.params, self.operation,
+                    self.name, self.preamble, self.kwargs, width)
+        return kern
+
 
 @util.memoize(for_each_device=True)
 def _get_ufunc_kernel(
-        in_types, out_types, routine, args_info, params, name, preamble):
+        in_types, out_types, routine, args_info, params, name, preamble,
+        width=0):
     kernel_params, ndims = _get_kernel_params(params, args_info)
 
     types = []
     op = []
     clvd = []
+    variables = []
     for i, x in enumerate(in_types):
         types.append('typedef %s in%d_type;' % (_get_typename(x), i))
         if args_info[i][0] is ndarray:
             op.append('__attribute__((annotate("clpy_elementwise_tag"))) '
                       'in{0}_type in{0};'.format(i))
+            # the array may have another type than the routine
+            array_type = _get_typename(args_info[i][1])
             clvd.append('__attribute__((annotate("clpy_ignore")))'
-                        'in{0}_type* in{0}_data;'
+                        '{2}* in{0}_data;'
                         '__attribute__((annotate("clpy_ignore")))'
-                        'CArray_{1} in{0}_info;'.format(i, args_info[i][2]))
+                        'CArray_{1} in{0}_info;'.format(
+                            i, args_info[i][2], array_type))
+            variables.append(
+                ('in%d' % i, 'in%d_type' % i, array_type, True, True))
 
     for i, x in enumerate(out_types):
         types.append('typedef %s out%d_type;' % (
@@ -664,19 +892,35 @@ def _get_ufunc_kernel(
                         '__attribute__((annotate("clpy_ignore")))'
                         'CArray_{1} out{0}_info;'
                         .format(i, args_info[i + len(in_types)][2]))
-
-    operation = '\n'.join(op) + routine
+            variables.append(
+                ('out%d' % i, 'out%d_type' % i,
+                 _get_typename(args_info[i + len(in_types)][1]), False,
+                 not _is_write_only(routine, 'out%d' % i)))
 
     types.append(preamble)
     preamble = '\n'.join(types)
 
     clpy_variables_declaration = '\n'.join(clvd)
 
+    if width != 0:
+        return _get_contiguous_elementwise_kernel(
+            kernel_params, tuple(variables), routine, name, preamble, width,
+            clpy_variables_declaration=clpy_variables_declaration)
+
+    operation = '\n'.join(op) + routine
+
     return _get_simple_elementwise_kernel(
         kernel_params, operation, name, preamble,
         clpy_variables_declaration=clpy_variables_declaration)
 
 
+cdef bint _is_write_only(str routine, str name):
+    # the old value of the output is not read if the routine assigns it first
+    # and never refers to it again, e.g. 'out0 = in0 + in1'
+    return (re.match(r'\s*%s\s*=[^=]' % name, routine) is not None and
+            len(re.findall(r'\b%s\b' % name, routine)) == 1)
+
+
 cdef tuple _guess_routine_from_in_types(list ops, tuple in_types):
     cdef Py_ssize_t i, n
     cdef tuple op, op_types
@@ -868,16 +1112,49 @@ class ufunc(object):
         inout_args.extend(out_args)
         inout_args, shape = _reduce_dims(inout_args, self._params, shape)
         indexer = Indexer(shape)
+        width = _get_contiguous_width(inout_args, self._params)
         inout_args.append(indexer)
         args_info = _get_args_info(inout_args)
 
         kern = _get_ufunc_kernel(
             in_types, out_types, routine, args_info,
-            self._params, self.name, self._preamble)
+            self._params, self.name, self._preamble, width)
 
-        kern.linear_launch(indexer.size, inout_args)
+        kern.linear_launch(_get_launch_size(indexer.size, width), inout_args)
         return ret
 
+    def _get_precompile_specs(self, dtypes, ndims):
+        """Lists specializations for :mod:`clpy.backend.precompile`."""
+        if dtypes is not None:
+            dtypes = [numpy.dtype(t).type for t in dtypes]
+        specs = []
+        for i, op in enumerate(self._ops):
+            if dtypes is not None and op[0][0] not in dtypes:
+                continue
+            for ndim in ndims:
+                specs.append((i, ndim))
+        return specs
+
+    def compile_async(self, dtypes=None, ndims=(1,)):
+        """Same as :func:`clpy.backend.compile_async` for this kernel."""
+        return compiler.compile_async(self, dtypes, ndims)
+
+    def _precompile(self, spec):
+        """Compiles a specialization for arrays without invoking it."""
+        i, ndim = spec
+        in_types, out_types, routine = self._ops[i]
+        args_info = tuple(
+            [(ndarray, t, ndim) for t in in_types + out_types] +
+            [(Indexer, None, ndim)])
+        kern = _get_ufunc_kernel(
+            in_types, out_types, routine, args_info,
+            self._params, self.name, self._preamble, 0)
+        for width in _get_contiguous_precompile_widths(self._params, ndim):
+            _get_ufunc_kernel(
+                in_types, out_types, routine, args_info,
+                self._params, self.name, self._preamble, width)
+        return kern
+
 
 cpdef create_ufunc(name, ops, routine=None, preamble='', doc=''):
     _ops = []
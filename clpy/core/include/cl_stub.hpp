@@ -168,7 +168,23 @@ __attribute__((annotate("clpy_no_mangle"))) static float trunc(float);
 __attribute__((annotate("clpy_no_mangle"))) size_t get_local_id(uint);
 __attribute__((annotate("clpy_no_mangle"))) size_t get_group_id(uint);
 __attribute__((annotate("clpy_no_mangle"))) size_t get_global_id(uint);
+__attribute__((annotate("clpy_no_mangle"))) size_t get_global_size(uint);
 __attribute__((annotate("clpy_no_mangle"))) size_t get_num_groups(uint);
+#define CLPY_DECLARE_VECTOR4(T) \
+typedef struct { T s0, s1, s2, s3; } T##4; \
+__attribute__((annotate("clpy_no_mangle"))) T##4 vload4(size_t, const T*); \
+__attribute__((annotate("clpy_no_mangle"))) void vstore4(T##4, size_t, T*);
+CLPY_DECLARE_VECTOR4(char)
+CLPY_DECLARE_VECTOR4(uchar)
+CLPY_DECLARE_VECTOR4(short)
+CLPY_DECLARE_VECTOR4(ushort)
+CLPY_DECLARE_VECTOR4(int)
+CLPY_DECLARE_VECTOR4(uint)
+CLPY_DECLARE_VECTOR4(long)
+CLPY_DECLARE_VECTOR4(ulong)
+CLPY_DECLARE_VECTOR4(float)
+CLPY_DECLARE_VECTOR4(double)
+#undef CLPY_DECLARE_VECTOR4
 typedef enum{
   CLK_LOCAL_MEM_FENCE,
   CLK_GLOBAL_MEM_FENCE
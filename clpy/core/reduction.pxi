@@ -6,6 +6,7 @@ import numpy
 # from clpy.backend import compiler
 from clpy import util
 
+import clpy.backend.device
 cimport clpy.backend.opencl.api
 import clpy.backend.opencl.types
 cimport clpy.backend.opencl.utility
@@ -178,9 +179,21 @@ def _get_simple_reduction_function(
         options, clpy_variables_declaration)
 
 
+_max_reduction_local_size = 256
+
+
+cdef Py_ssize_t _get_reduction_local_size() except -1:
+    # The work-group size is a power of 2 fitting the device, and each
+    # work-item uses 32 bytes of the local memory, which is enough for any
+    # reduce type.
+    return clpy.backend.device.get_device_info().get_work_group_size(
+        _max_reduction_local_size, 32)
+
+
 class simple_reduction_function(object):
 
-    _local_size = 256  # TODO(LWisteria): GetDeviceInfo
+    # upper bound of the work-group size
+    _local_size = _max_reduction_local_size
     _block_size = _local_size  # to keep compatibility with clpy
 
     def __init__(self, name, ops, identity, preamble, default=False):
@@ -252,7 +265,7 @@ class simple_reduction_function(object):
         in_args, in_shape = _get_trans_args(
             in_args, laxis + raxis, a_shape, None)
 
-        local_size = self._local_size
+        local_size = _get_reduction_local_size()
         in_indexer = Indexer(in_shape)
         out_indexer = Indexer(out_shape)
         # Rounding Up to the Next Power of 2
@@ -284,6 +297,55 @@ class simple_reduction_function(object):
             return out_args[0]
         return tuple(out_args)
 
+    def _get_precompile_specs(self, dtypes, ndims):
+        """Lists specializations for :mod:`clpy.backend.precompile`."""
+        if dtypes is not None:
+            dtypes = [numpy.dtype(t).type for t in dtypes]
+        specs = []
+        for i, op in enumerate(self._ops):
+            if dtypes is not None and op[0][0] not in dtypes:
+                continue
+            for in_ndim, out_ndim in _get_reduction_ndims(ndims):
+                specs.append((i, in_ndim, out_ndim))
+        return specs
+
+    def compile_async(self, dtypes=None, ndims=(1,)):
+        """Same as :func:`clpy.backend.compile_async` for this kernel."""
+        return compiler.compile_async(self, dtypes, ndims)
+
+    def _precompile(self, spec):
+        """Compiles a specialization for arrays without invoking it."""
+        i, in_ndim, out_ndim = spec
+        in_types, out_types, routine = self._ops[i]
+        args_info = _get_reduction_args_info(
+            in_types, out_types, in_ndim, out_ndim)
+        return _get_simple_reduction_function(
+            routine, self._params, args_info,
+            in_types[0], out_types[0], out_types,
+            self.name, _get_reduction_local_size(), self.identity,
+            self._input_expr, self._output_expr, self._output_store,
+            self._preamble, (), self._clpy_variables_declaration)
+
+
+cdef list _get_reduction_ndims(ndims):
+    ret = []
+    for ndim in ndims:
+        if isinstance(ndim, tuple):
+            ret.append(ndim)
+        else:
+            ret.extend([(ndim, out_ndim) for out_ndim in range(ndim)])
+    return ret
+
+
+cdef tuple _get_reduction_args_info(
+        tuple in_types, tuple out_types, Py_ssize_t in_ndim,
+        Py_ssize_t out_ndim):
+    return tuple(
+        [(ndarray, t, in_ndim) for t in in_types] +
+        [(ndarray, t, out_ndim) for t in out_types] +
+        [(Indexer, None, in_ndim), (Indexer, None, out_ndim),
+         (Size_t, None, 1), (LocalMem, None, 1)])
+
 
 @util.memoize(for_each_device=True)
 def _get_reduction_kernel(
@@ -451,7 +513,7 @@ class ReductionKernel(object):
         in_args, in_shape = _get_trans_args(
             in_args, axis + raxis, broad_shape, self.in_params)
 
-        local_size = 256  # TODO(LWisteria): GetDeviceInfo
+        local_size = _get_reduction_local_size()
         in_indexer = Indexer(in_shape)
         out_indexer = Indexer(out_shape)
         # Rounding Up to the Next Power of 2
@@ -480,6 +542,36 @@ class ReductionKernel(object):
             inout_args, shared_mem, local_size)
         return out_args[0]
 
+    def _get_precompile_specs(self, dtypes, ndims):
+        """Lists specializations for :mod:`clpy.backend.precompile`."""
+        specs = []
+        for dtype in dtypes:
+            if not isinstance(dtype, tuple):
+                dtype = (dtype,) * self.nin
+            chars = tuple([numpy.dtype(t).char for t in dtype])
+            for in_ndim, out_ndim in _get_reduction_ndims(ndims):
+                specs.append((chars, in_ndim, out_ndim))
+        return specs
+
+    def compile_async(self, dtypes, ndims=(1,)):
+        """Same as :func:`clpy.backend.compile_async` for this kernel."""
+        return compiler.compile_async(self, dtypes, ndims)
+
+    def _precompile(self, spec):
+        """Compiles a specialization for arrays without invoking it."""
+        chars, in_ndim, out_ndim = spec
+        in_ndarray_types = tuple([numpy.dtype(c).type for c in chars])
+        in_types, out_types, types = _decide_params_type(
+            self.in_params, self.out_params, in_ndarray_types, ())
+        args_info = _get_reduction_args_info(
+            in_types, out_types, in_ndim, out_ndim)
+        local_size = _get_reduction_local_size()
+        return _get_reduction_kernel(
+            self.params, args_info, types,
+            self.name, local_size, self.reduce_type, self.identity,
+            self.map_expr, self.reduce_expr, self.post_map_expr,
+            self.preamble, self.options)
+
 
 cpdef create_reduction_func(name, ops, routine=None, identity=None,
                             preamble='', default=False):
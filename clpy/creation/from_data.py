@@ -53,7 +53,12 @@ def asarray(a, dtype=None):
 
     Returns:
         clpy.ndarray: An array on the current device. If ``a`` is already on
-        the device, no copy is performed.
+        the device, no copy is performed. If the zero-copy mode is enabled
+        (see :func:`clpy.backend.memory.is_zero_copy_enabled`) and ``a`` is
+        a C-contiguous and suitably aligned :class:`numpy.ndarray`, the
+        returned array shares the memory with ``a``, which is kept alive by
+        it. ``a`` must not be accessed while kernels using the returned
+        array are queued.
 
     .. seealso:: :func:`numpy.asarray`
 
@@ -0,0 +1,5 @@
+from clpy.backend.precompile import main
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,12 @@
 import contextlib
 import functools
 
-# from clpy import backend
-# from clpy.backend import runtime
+from clpy import backend
+
+
+def _check_color(color_id, argb_color):
+    if color_id is not None and argb_color is not None:
+        raise ValueError('Only either color_id or argb_color can be specified')
 
 
 @contextlib.contextmanager
@@ -14,45 +18,40 @@ def time_range(message, color_id=None, argb_color=None, sync=False):
     ...    # do something you want to measure
     ...    pass
 
+    Kernels and memory transfers recorded by :mod:`clpy.backend.profiler`
+    in the block are tagged with the message, and the block itself is
+    recorded as a range measured by the host clock.
+
     Args:
         message: Name of a range.
         color_id: range color ID
         argb_color: range color in ARGB (e.g. 0xFF00FF00 for green)
         sync (bool): If ``True``, waits for completion of all outstanding
-            processing on GPU before calling :func:`clpy.cuda.nvtx.RangePush()`
-            or :func:`clpy.cuda.nvtx.RangePop()`
+            processing on GPU before starting or ending the range.
+
+    .. note::
+       Colors are accepted for compatibility with CuPy and are not used.
 
-    .. seealso:: :func:`clpy.cuda.nvtx.RangePush`
-        :func:`clpy.cuda.nvtx.RangePop`
+    .. seealso:: :func:`clpy.backend.profiler.push_range`
+        :func:`clpy.backend.profiler.pop_range`
     """
-    raise NotImplementedError("clpy does not support this")
-    # if not cuda.nvtx_enabled:
-    #     raise RuntimeError('nvtx is not installed')
-
-    # if color_id is not None and argb_color is not None:
-    #     raise ValueError('Only either color_id or'
-    #                      ' argb_color can be specified')
-
-    # if sync:
-    #     runtime.deviceSynchronize()
-    # if argb_color is not None:
-    #     cuda.nvtx.RangePushC(message, argb_color)
-    # else:
-    #     if color_id is None:
-    #         color_id = -1
-    #     cuda.nvtx.RangePush(message, color_id)
-    # try:
-    #     yield
-    # finally:
-    #     if sync:
-    #         runtime.deviceSynchronize()
-    #     cuda.nvtx.RangePop()
+    _check_color(color_id, argb_color)
+    if sync:
+        backend.Device().synchronize()
+    backend.profiler.push_range(message)
+    try:
+        yield
+    finally:
+        if sync:
+            backend.Device().synchronize()
+        backend.profiler.pop_range()
 
 
 class TimeRangeDecorator(object):
-    """Decorator to mark function calls with range in NVIDIA profiler
+    """Decorator to mark function calls with range in the profiler
 
-    Decorated function calls are marked as ranges in NVIDIA profiler timeline.
+    Decorated function calls are marked as ranges in the profile records of
+    :mod:`clpy.backend.profiler`.
 
     >>> from clpy import prof
     >>> @clpy.prof.TimeRangeDecorator()
@@ -64,50 +63,34 @@ class TimeRangeDecorator(object):
         color_id: range color ID
         argb_color: range color in ARGB (e.g. 0xFF00FF00 for green)
         sync (bool): If ``True``, waits for completion of all outstanding
-            processing on GPU before calling :func:`clpy.cuda.nvtx.RangePush()`
-            or :func:`clpy.cuda.nvtx.RangePop()`
+            processing on GPU before starting or ending the range.
 
-    .. seealso:: :func:`clpy.nvtx.range`
-        :func:`clpy.cuda.nvtx.RangePush`
-        :func:`clpy.cuda.nvtx.RangePop`
+    .. seealso:: :func:`clpy.prof.time_range`
     """
 
     def __init__(self, message=None, color_id=None, argb_color=None,
                  sync=False):
-        raise NotImplementedError("clpy does not support this")
-        # if not cuda.nvtx_enabled:
-        #     raise RuntimeError('nvtx is not installed')
-
-        # if color_id is not None and argb_color is not None:
-        #     raise ValueError(
-        #         'Only either color_id or argb_color can be specified'
-        #     )
-        # self.message = message
-        # self.color_id = color_id if color_id is not None else -1
-        # self.argb_color = argb_color
-        # self.sync = sync
+        _check_color(color_id, argb_color)
+        self.message = message
+        self.color_id = color_id if color_id is not None else -1
+        self.argb_color = argb_color
+        self.sync = sync
 
     def __enter__(self):
-        # if self.sync:
-        #     runtime.deviceSynchronize()
-        # if self.argb_color is not None:
-        #     cuda.nvtx.RangePushC(self.message, self.argb_color)
-        # else:
-        #     cuda.nvtx.RangePush(self.message, self.color_id)
-        # return self
-        pass
+        if self.sync:
+            backend.Device().synchronize()
+        backend.profiler.push_range(self.message)
+        return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        # if self.sync:
-        #     runtime.deviceSynchronize()
-        # cuda.nvtx.RangePop()
-        pass
+        if self.sync:
+            backend.Device().synchronize()
+        backend.profiler.pop_range()
 
     def _recreate_cm(self, message):
-        # if self.message is None:
-        #     self.message = message
-        # return self
-        pass
+        if self.message is None:
+            self.message = message
+        return self
 
     def __call__(self, func):
         @functools.wraps(func)
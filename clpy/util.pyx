@@ -2,6 +2,7 @@
 
 import atexit
 import functools
+import threading
 import warnings
 
 import clpy
@@ -25,20 +26,40 @@ def memoize(bint for_each_device=False):
     def decorator(f):
         memo = {}
         _memos.append(memo)
+        # events of the results being computed by other threads
+        pending = {}
+        lock = threading.Lock()
 
         @functools.wraps(f)
         def ret(*args, **kwargs):
             cdef int id = -1
             cdef dict m = memo
-            # TODO(LWisteria): implement me for multi device environment
-#            if for_each_device:
-#                id = device.get_device_id()
+            if for_each_device:
+                id = device.get_device_id()
             arg_key = (id, args, frozenset(kwargs.items()))
             if arg_key in m:
-                result = m[arg_key]
-            else:
+                return m[arg_key]
+
+            # Waits for another thread computing the same result, e.g. a
+            # kernel compiled in background, instead of computing it twice.
+            while True:
+                with lock:
+                    if arg_key in m:
+                        return m[arg_key]
+                    event = pending.get(arg_key)
+                    if event is None:
+                        event = threading.Event()
+                        pending[arg_key] = event
+                        break
+                event.wait()
+
+            try:
                 result = f(*args, **kwargs)
                 m[arg_key] = result
+            finally:
+                with lock:
+                    del pending[arg_key]
+                event.set()
             return result
 
         return ret
@@ -98,10 +98,10 @@ MODULES = [
             'clpy.backend.device',
             # 'clpy.backend.driver',
             'clpy.backend.memory',
-            # 'clpy.backend.memory_hook',
+            'clpy.backend.memory_hook',
             # 'clpy.backend.nvrtc',
             'clpy.backend.pinned_memory',
-            # 'clpy.backend.profiler',
+            'clpy.backend.profiler',
             # 'clpy.backend.nvtx',
             'clpy.backend.function',
             # 'clpy.backend.runtime',
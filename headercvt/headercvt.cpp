@@ -565,7 +565,8 @@ int main(int argc, const char** argv){
     preprocessor_defines_ostream << indent_str << "cdef enum:\n";
     preprocessor_defines_indentation ++;
 
-    func_decl_ostream << "cdef extern from \"CL/cl.h\":\n";
+    // nogil allows to release GIL while building programs
+    func_decl_ostream << "cdef extern from \"CL/cl.h\" nogil:\n";
     func_decl_indentation ++;
 
     types_ostream << "cdef extern from \"CL/cl.h\":\n";
@@ -45,7 +45,7 @@ packages_clpy = [
     'clpy.creation',
     'clpy.backend',
     'clpy.backend.ultima',
-    #   'clpy.backend.memory_hooks',
+    'clpy.backend.memory_hooks',
     'clpy.ext',
     'clpy.indexing',
     'clpy.io',
@@ -55,7 +55,7 @@ packages_clpy = [
     'clpy.math',
     'clpy.backend.opencl',
     'clpy.padding',
-    #   'clpy.prof',
+    'clpy.prof',
     'clpy.random',
     'clpy.sorting',
     'clpy.sparse',
@@ -80,7 +80,7 @@ packages_cupy_alias = [
     'cupy_alias.backend.opencl',
     'cupy_alias.cuda',
     'cupy_alias.padding',
-    #   'cupy_alias.prof',
+    'cupy_alias.prof',
     'cupy_alias.random',
     'cupy_alias.sorting',
     'cupy_alias.sparse',
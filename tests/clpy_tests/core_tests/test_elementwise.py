@@ -135,6 +135,78 @@ class TestElementwiseType(unittest.TestCase):
         return a + b
 
 
+@testing.gpu
+class TestContiguousElementwise(unittest.TestCase):
+    """test class of the kernels specialized for contiguous arrays"""
+
+    @testing.for_all_dtypes()
+    @testing.numpy_clpy_array_equal()
+    def test_aligned(self, xp, dtype):
+        a = testing.shaped_arange((4, 258), xp, dtype)
+        b = testing.shaped_reverse_arange((4, 258), xp, dtype)
+        return a + b
+
+    @testing.for_all_dtypes()
+    @testing.numpy_clpy_array_equal()
+    def test_unaligned(self, xp, dtype):
+        a = testing.shaped_arange((1031,), xp, dtype)
+        b = testing.shaped_reverse_arange((1031,), xp, dtype)
+        return a[1:] * b[:-1]
+
+    @testing.for_all_dtypes_combination(names=['dtype1', 'dtype2'])
+    @testing.numpy_clpy_array_equal()
+    def test_mixed_dtypes(self, xp, dtype1, dtype2):
+        a = testing.shaped_arange((1027,), xp, dtype1)
+        b = testing.shaped_reverse_arange((1027,), xp, dtype2)
+        return a + b
+
+    @testing.for_all_dtypes()
+    @testing.numpy_clpy_array_equal()
+    def test_inplace(self, xp, dtype):
+        a = testing.shaped_arange((1025,), xp, dtype)
+        a *= a
+        return a
+
+    @testing.numpy_clpy_array_equal()
+    def test_copy_where(self, xp):
+        a = testing.shaped_arange((1030,), xp, numpy.float32)
+        b = testing.shaped_reverse_arange((1030,), xp, numpy.float32)
+        xp.copyto(a, b, where=a > b)
+        return a
+
+    def test_elementwise_kernel(self):
+        x_np = numpy.arange(1029, dtype=numpy.float32)
+        y_np = numpy.arange(1029, dtype=numpy.float32)
+        x = clpy.array(x_np)
+        y = clpy.array(y_np)
+
+        kernel = clpy.ElementwiseKernel(
+            'T x',
+            'T y',
+            'y += x * T(i)',
+            'contiguous_accumulate')
+        kernel(x, y)
+        kernel(x[2:], y[1:-1])
+
+        y_np += x_np * numpy.arange(1029, dtype=numpy.float32)
+        y_np[1:-1] += x_np[2:] * numpy.arange(1027, dtype=numpy.float32)
+        self.assertTrue(numpy.allclose(y.get(), y_np))
+
+    def test_jump_statement(self):
+        # return must not skip the other elements of a vector
+        x_np = numpy.arange(1029, dtype=numpy.int32)
+        x = clpy.array(x_np)
+        y = clpy.zeros(1029, dtype=numpy.int32)
+        kernel = clpy.ElementwiseKernel(
+            'T x',
+            'raw T y',
+            'if (x % 2 == 0) return; y[i] = x',
+            'contiguous_return')
+        kernel(x, y)
+        self.assertTrue(numpy.array_equal(
+            y.get(), numpy.where(x_np % 2 == 0, 0, x_np)))
+
+
 class TestClpyElementwiseKernel(unittest.TestCase):
     def test_vectoradd(self):
         x_np = numpy.array([0.1, 0.2, 0.3], dtype="float32")
@@ -363,7 +435,8 @@ class TestClpyElementwiseKernelwithChunk(unittest.TestCase):
         # create chunk and free to prepare chunk in pool
         self.pool = clpy.backend.memory.SingleDeviceMemoryPool()
         clpy.backend.memory.set_allocator(self.pool.malloc)
-        self.pooled_chunk_size = clpy.backend.memory.subbuffer_alignment * 2
+        self.pooled_chunk_size = (
+            clpy.backend.memory.get_subbuffer_alignment() * 2)
         self.tmp = self.pool.malloc(self.pooled_chunk_size)
         self.pool.free(self.tmp.buf, self.pooled_chunk_size, 0)
 
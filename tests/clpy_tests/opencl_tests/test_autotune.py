@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+import clpy
+from clpy.backend import autotune
+from clpy.backend import compiler
+
+
+class TestCandidates(unittest.TestCase):
+    """test class of the candidate launch configurations"""
+
+    def test_size_bucket(self):
+        self.assertEqual(autotune.get_size_bucket(1), 1)
+        self.assertEqual(autotune.get_size_bucket(4096),
+                         autotune.get_size_bucket(8191))
+        self.assertNotEqual(autotune.get_size_bucket(4095),
+                            autotune.get_size_bucket(4096))
+
+    def test_candidates(self):
+        info = clpy.backend.get_device_info()
+        candidates = autotune.get_candidates(info, 1024)
+        self.assertIn(autotune._default_config, candidates)
+        for local_size, items in candidates:
+            self.assertLessEqual(local_size, info.max_work_group_size)
+            self.assertEqual(
+                local_size % info.preferred_work_group_size_multiple, 0)
+            self.assertGreaterEqual(items, 1)
+
+    def test_candidates_limited_by_kernel(self):
+        info = clpy.backend.get_device_info()
+        candidates = autotune.get_candidates(
+            info, info.preferred_work_group_size_multiple)
+        self.assertEqual(
+            set(local_size for local_size, _ in candidates),
+            {0, info.preferred_work_group_size_multiple})
+
+
+@unittest.skipUnless(
+    clpy.backend.opencl.env.is_queue_profiling_enabled(),
+    'requires CLPY_AUTOTUNE=1 or CLPY_QUEUE_PROFILING=1')
+class TestAutotune(unittest.TestCase):
+    """test class of the auto-tuning of elementwise kernels"""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.old_cache_dir = os.environ.get('CLPY_CACHE_DIR')
+        os.environ['CLPY_CACHE_DIR'] = self.cache_dir
+        self.old_enabled = autotune.is_enabled()
+        autotune.clear()
+        autotune.set_enabled(True)
+
+    def tearDown(self):
+        autotune.set_enabled(self.old_enabled)
+        autotune.clear()
+        if self.old_cache_dir is None:
+            del os.environ['CLPY_CACHE_DIR']
+        else:
+            os.environ['CLPY_CACHE_DIR'] = self.old_cache_dir
+        shutil.rmtree(self.cache_dir)
+
+    def _get_tuned_files(self):
+        return [f for f in os.listdir(self.cache_dir)
+                if f.endswith('.json') and 'autotune-' in f]
+
+    def test_tune(self):
+        x_np = numpy.arange(100000, dtype=numpy.float32)
+        x = clpy.array(x_np)
+        for _ in range(1000):
+            y = x * 3
+            self.assertTrue(numpy.array_equal(y.get(), x_np * 3))
+            if self._get_tuned_files():
+                break
+        files = self._get_tuned_files()
+        self.assertEqual(len(files), 1)
+        configs = json.loads(
+            compiler.load_from_cache(files[0]).decode('utf-8'))
+        self.assertNotEqual(len(configs), 0)
+        candidates = autotune.get_candidates(
+            clpy.backend.get_device_info(), autotune._max_local_size)
+        for local_size, items in configs.values():
+            self.assertIn((local_size, items), candidates)
+
+        # the tuned configuration is loaded by a new tuner
+        autotune.clear()
+        y = x * 3
+        self.assertTrue(numpy.array_equal(y.get(), x_np * 3))
+
+    def test_get_tuned_config_does_not_create_tuner(self):
+        self.assertIsNone(autotune.get_tuned_config('kernel', 1 << 20))
+        self.assertEqual(autotune._tuners, {})
+
+    def test_small_size_is_not_tuned(self):
+        x = clpy.arange(100, dtype=numpy.float32)
+        for _ in range(100):
+            y = x + 1
+        self.assertTrue(numpy.array_equal(
+            y.get(), numpy.arange(100, dtype=numpy.float32) + 1))
+        self.assertEqual(self._get_tuned_files(), [])
+
+    def test_non_contiguous(self):
+        x_np = numpy.arange(300000, dtype=numpy.float32).reshape(300, 1000)
+        x = clpy.array(x_np)
+        for _ in range(20):
+            y = x[:, ::3] * 2
+            self.assertTrue(numpy.array_equal(y.get(), x_np[:, ::3] * 2))
+
+
+@unittest.skipIf(
+    clpy.backend.opencl.env.is_queue_profiling_enabled(),
+    'requires queues without profiling')
+class TestAutotuneWithoutQueueProfiling(unittest.TestCase):
+    """test class of the auto-tuner on queues without profiling"""
+
+    def test_set_enabled(self):
+        with self.assertRaises(RuntimeError):
+            autotune.set_enabled(True)
+        self.assertFalse(autotune.is_enabled())
+        autotune.set_enabled(False)
+
+
+if __name__ == "__main__":
+    unittest.main()
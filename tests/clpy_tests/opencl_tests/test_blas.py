@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import threading
 import unittest
 
 import numpy
@@ -739,7 +740,7 @@ class TestBlas3Sgemm(unittest.TestCase):
         # create chunk and free to prepare chunk in pool
         pool = clpy.backend.memory.SingleDeviceMemoryPool()
         clpy.backend.memory.set_allocator(pool.malloc)
-        pooled_chunk_size = clpy.backend.memory.subbuffer_alignment * 2
+        pooled_chunk_size = clpy.backend.memory.get_subbuffer_alignment() * 2
         tmp = pool.malloc(pooled_chunk_size)
         pool.free(tmp.buf, pooled_chunk_size, 0)
 
@@ -798,7 +799,7 @@ class TestBlas3Sgemm(unittest.TestCase):
         # create chunk and free to prepare chunk in pool
         pool = clpy.backend.memory.SingleDeviceMemoryPool()
         clpy.backend.memory.set_allocator(pool.malloc)
-        pooled_chunk_size = clpy.backend.memory.subbuffer_alignment * 2
+        pooled_chunk_size = clpy.backend.memory.get_subbuffer_alignment() * 2
         tmp = pool.malloc(pooled_chunk_size)
         pool.free(tmp.buf, pooled_chunk_size, 0)
 
@@ -857,7 +858,7 @@ class TestBlas3Sgemm(unittest.TestCase):
         # create chunk and free to prepare chunk in pool
         pool = clpy.backend.memory.SingleDeviceMemoryPool()
         clpy.backend.memory.set_allocator(pool.malloc)
-        pooled_chunk_size = clpy.backend.memory.subbuffer_alignment * 2
+        pooled_chunk_size = clpy.backend.memory.get_subbuffer_alignment() * 2
         tmp = pool.malloc(pooled_chunk_size)
         pool.free(tmp.buf, pooled_chunk_size, 0)
 
@@ -1258,7 +1259,7 @@ class TestBlas3Sgeam(unittest.TestCase):
         # create chunk and free to prepare chunk in pool
         pool = clpy.backend.memory.SingleDeviceMemoryPool()
         clpy.backend.memory.set_allocator(pool.malloc)
-        pooled_chunk_size = clpy.backend.memory.subbuffer_alignment * 2
+        pooled_chunk_size = clpy.backend.memory.get_subbuffer_alignment() * 2
         tmp = pool.malloc(pooled_chunk_size)
         pool.free(tmp.buf, pooled_chunk_size, 0)
 
@@ -1316,7 +1317,7 @@ class TestBlas3Sgeam(unittest.TestCase):
         # create chunk and free to prepare chunk in pool
         pool = clpy.backend.memory.SingleDeviceMemoryPool()
         clpy.backend.memory.set_allocator(pool.malloc)
-        pooled_chunk_size = clpy.backend.memory.subbuffer_alignment * 2
+        pooled_chunk_size = clpy.backend.memory.get_subbuffer_alignment() * 2
         tmp = pool.malloc(pooled_chunk_size)
         pool.free(tmp.buf, pooled_chunk_size, 0)
 
@@ -1374,7 +1375,7 @@ class TestBlas3Sgeam(unittest.TestCase):
         # create chunk and free to prepare chunk in pool
         pool = clpy.backend.memory.SingleDeviceMemoryPool()
         clpy.backend.memory.set_allocator(pool.malloc)
-        pooled_chunk_size = clpy.backend.memory.subbuffer_alignment * 2
+        pooled_chunk_size = clpy.backend.memory.get_subbuffer_alignment() * 2
         tmp = pool.malloc(pooled_chunk_size)
         pool.free(tmp.buf, pooled_chunk_size, 0)
 
@@ -1480,5 +1481,27 @@ class TestBlas3Sgeam(unittest.TestCase):
         self.assertTrue(numpy.allclose(expectedC, actualC))
 
 
+class TestBlasKernelCache(unittest.TestCase):
+    """test class of the kernels reused between BLAS calls"""
+
+    def _dot(self):
+        a = numpy.arange(6, dtype='float32').reshape(2, 3)
+        b = numpy.arange(12, dtype='float32').reshape(3, 4)
+        c = clpy.dot(clpy.array(a), clpy.array(b))
+        return numpy.allclose(c.get(), numpy.dot(a, b))
+
+    def test_repeated_calls(self):
+        for _ in range(3):
+            self.assertTrue(self._dot())
+
+    def test_other_thread(self):
+        results = []
+        thread = threading.Thread(target=lambda: results.append(self._dot()))
+        thread.start()
+        thread.join()
+        self.assertEqual(results, [True])
+        self.assertTrue(self._dot())
+
+
 if __name__ == '__main__':
     unittest.main()
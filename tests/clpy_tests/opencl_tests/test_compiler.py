@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+
+import gc
+import os
+import shutil
+import tempfile
+import unittest
+import warnings
+
+import numpy
+
+import clpy
+from clpy.backend import compiler
+from clpy.backend.opencl import utility
+from clpy.backend.ultima.exceptions import UltimaRuntimeError
+
+
+class TestKernelCache(unittest.TestCase):
+    """test class of the persistent kernel cache"""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_save_and_load(self):
+        compiler.save_to_cache('a.cl', b'kernel source', self.cache_dir)
+        self.assertEqual(
+            compiler.load_from_cache('a.cl', self.cache_dir),
+            b'kernel source')
+
+    def test_load_missing(self):
+        self.assertIsNone(compiler.load_from_cache('none.cl', self.cache_dir))
+
+    def test_load_corrupted(self):
+        compiler.save_to_cache('a.cl', b'kernel source', self.cache_dir)
+        with open(os.path.join(self.cache_dir, 'a.cl'), 'ab') as f:
+            f.write(b'garbage')
+        self.assertIsNone(compiler.load_from_cache('a.cl', self.cache_dir))
+
+    def test_save_failure_removes_temporary_file(self):
+        # the rename fails since the destination is a directory
+        os.mkdir(os.path.join(self.cache_dir, 'a.cl'))
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            compiler.save_to_cache('a.cl', b'kernel source', self.cache_dir)
+        self.assertEqual(len(w), 1)
+        self.assertEqual(os.listdir(self.cache_dir), ['a.cl'])
+
+    def test_cache_key(self):
+        key = compiler.get_cache_key('source', ('-O3',))
+        self.assertEqual(key, compiler.get_cache_key('source', ('-O3',)))
+        self.assertNotEqual(key, compiler.get_cache_key('source', ()))
+
+    def test_compile_with_cache(self):
+        code = '''
+__kernel void test_kernel(__global int* x){
+  x[get_global_id(0)] = 1;
+}
+'''
+        clpy.core.core.compile_with_cache(code, (), None, self.cache_dir)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+        # the second compilation must hit the cache without ultima
+        clpy.core.core.compile_with_cache(code, (), None, self.cache_dir)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+
+class TestProgramBinaryCache(unittest.TestCase):
+    """test class of the OpenCL program binary cache"""
+
+    code = '''
+__kernel void test_kernel(__global int* x){
+  x[get_global_id(0)] = 1;
+}
+'''
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.old_cache_dir = os.environ.get('CLPY_CACHE_DIR')
+        os.environ['CLPY_CACHE_DIR'] = self.cache_dir
+
+    def tearDown(self):
+        if self.old_cache_dir is None:
+            del os.environ['CLPY_CACHE_DIR']
+        else:
+            os.environ['CLPY_CACHE_DIR'] = self.old_cache_dir
+        shutil.rmtree(self.cache_dir)
+
+    def _binaries(self):
+        return [f for f in os.listdir(self.cache_dir) if f.endswith('.bin')]
+
+    def test_save_binary(self):
+        clpy.core.core.compile_with_cache(self.code)
+        self.assertEqual(len(self._binaries()), 1)
+        module = clpy.core.core.compile_with_cache(self.code)
+        module.get_function('test_kernel')
+        self.assertEqual(len(self._binaries()), 1)
+
+    def test_fallback_from_stale_binary(self):
+        clpy.core.core.compile_with_cache(self.code)
+        name, = self._binaries()
+        compiler.save_to_cache(name, b'stale binary', self.cache_dir)
+        module = clpy.core.core.compile_with_cache(self.code)
+        module.get_function('test_kernel')
+        self.assertNotEqual(
+            compiler.load_from_cache(name, self.cache_dir), b'stale binary')
+
+
+class TestCompileBatch(unittest.TestCase):
+    """test class of the batched kernel compilation"""
+
+    code = '''
+__kernel void test_kernel%d(__global int* x){
+  x[get_global_id(0)] = %d;
+}
+'''
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def _compile(self, i):
+        return clpy.core.core.compile_with_cache(
+            self.code % (i, i), (), None, self.cache_dir)
+
+    def test_compile_batch(self):
+        with clpy.backend.compile_batch():
+            modules = [self._compile(i) for i in range(3)]
+            functions = [module.get_function('test_kernel%d' % i)
+                         for i, module in enumerate(modules)]
+            self.assertEqual(len(os.listdir(self.cache_dir)), 0)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 3)
+        x = clpy.empty(4, dtype=numpy.int32)
+        for i, f in enumerate(functions):
+            f.linear_launch(x.size, [x])
+            self.assertTrue(numpy.all(x.get() == i))
+
+    def test_launch_in_batch(self):
+        kernel = clpy.ElementwiseKernel(
+            'T x', 'T y', 'y = x + 1', 'test_batch_increment')
+        x = clpy.arange(4, dtype=numpy.int32)
+        with clpy.backend.compile_batch():
+            y = kernel(x)
+        self.assertTrue(numpy.array_equal(
+            y.get(), numpy.arange(1, 5, dtype=numpy.int32)))
+
+    def test_nested(self):
+        with clpy.backend.compile_batch():
+            with clpy.backend.compile_batch():
+                module = self._compile(0)
+            self.assertEqual(len(os.listdir(self.cache_dir)), 0)
+        module.get_function('test_kernel0')
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+    def test_failure_in_batch(self):
+        broken = '''
+__kernel void test_broken_kernel(__global int* x){
+  x[get_global_id(0)] = undefined_variable;
+}
+'''
+        with self.assertRaises(UltimaRuntimeError):
+            with clpy.backend.compile_batch():
+                module = self._compile(0)
+                broken_module = clpy.core.core.compile_with_cache(
+                    broken, (), None, self.cache_dir)
+        # the modules are built again on their launches
+        x = clpy.empty(4, dtype=numpy.int32)
+        module.get_function('test_kernel0').linear_launch(x.size, [x])
+        self.assertTrue(numpy.all(x.get() == 0))
+        f = broken_module.get_function('test_broken_kernel')
+        with self.assertRaises(UltimaRuntimeError):
+            f.linear_launch(x.size, [x])
+
+
+class TestCachedKernel(unittest.TestCase):
+    """test class of the kernel cache of threads"""
+
+    code = '''
+__kernel void test_cached_kernel(__global int* x){
+  x[get_global_id(0)] = 1;
+}
+'''
+
+    def test_release_with_module(self):
+        module = clpy.core.core.compile_with_cache(self.code)
+        x = clpy.empty(4, dtype=numpy.int32)
+        module.get_function('test_cached_kernel').linear_launch(x.size, [x])
+        self.assertTrue(numpy.all(x.get() == 1))
+        kernels = utility._thread_local.kernel_cache.kernels
+        n = len(kernels)
+        del module
+        gc.collect()
+        self.assertEqual(len(kernels), n - 1)
+
+
+class TestCompileAsync(unittest.TestCase):
+    """test class of the background kernel compilation"""
+
+    def test_elementwise_kernel(self):
+        kernel = clpy.ElementwiseKernel(
+            'T x', 'T y', 'y = x * 3', 'test_async_triple')
+        futures = kernel.compile_async([numpy.float32, numpy.int32])
+        self.assertEqual(len(futures), 2)
+        for future in futures:
+            self.assertIsInstance(future.result(), clpy.backend.Function)
+        x = clpy.arange(4, dtype=numpy.int32)
+        self.assertTrue(numpy.array_equal(
+            kernel(x).get(), numpy.arange(4, dtype=numpy.int32) * 3))
+
+    def test_launch_while_compiling(self):
+        kernel = clpy.ElementwiseKernel(
+            'T x', 'T y', 'y = x - 1', 'test_async_decrement')
+        future, = kernel.compile_async([numpy.int32])
+        # the launch waits for the background compilation
+        x = clpy.arange(4, dtype=numpy.int32)
+        y = kernel(x)
+        future.result()
+        self.assertTrue(numpy.array_equal(
+            y.get(), numpy.arange(-1, 3, dtype=numpy.int32)))
+
+    def test_ufunc(self):
+        futures = clpy.backend.compile_async(
+            clpy.subtract, [numpy.float64], [1, 2])
+        self.assertEqual(len(futures), 2)
+        for future in futures:
+            future.result()
+
+
+class TestDeviceLibrary(unittest.TestCase):
+    """test class of kernels linked against the device library"""
+
+    def setUp(self):
+        self.old_env = os.environ.get('CLPY_USE_DEVICE_LIBRARY')
+        os.environ['CLPY_USE_DEVICE_LIBRARY'] = '1'
+
+    def tearDown(self):
+        if self.old_env is None:
+            del os.environ['CLPY_USE_DEVICE_LIBRARY']
+        else:
+            os.environ['CLPY_USE_DEVICE_LIBRARY'] = self.old_env
+
+    def test_linked(self):
+        if not clpy.core.core._is_device_library_supported():
+            self.skipTest('requires OpenCL 1.2 or later')
+        self.assertTrue(clpy.core.core._uses_device_library())
+        kernel = clpy.ElementwiseKernel(
+            'T x', 'T y', 'y = x * 5', 'test_device_library_quintuple')
+        x_np = numpy.arange(24, dtype=numpy.int32).reshape(4, 6)
+        y = kernel(clpy.array(x_np)[:, ::2])
+        self.assertTrue(numpy.array_equal(y.get(), x_np[:, ::2] * 5))
+
+    def test_disabled(self):
+        os.environ['CLPY_USE_DEVICE_LIBRARY'] = '0'
+        self.assertFalse(clpy.core.core._uses_device_library())
+
+    def test_floor_divide(self):
+        x_np = numpy.arange(-12, 12, dtype=numpy.int32).reshape(4, 6)
+        x = clpy.array(x_np)
+        # non-contiguous operands use the library functions for indexing
+        y = clpy.floor_divide(x[:, ::2], 5)
+        self.assertTrue(numpy.array_equal(
+            y.get(), numpy.floor_divide(x_np[:, ::2], 5)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import numpy
+
+import clpy
+
+
+class TestDevice(unittest.TestCase):
+    """test class of switching the current device"""
+
+    def test_device_count(self):
+        self.assertGreaterEqual(clpy.backend.get_device_count(), 1)
+
+    def test_default_device(self):
+        self.assertEqual(clpy.backend.get_device_id(), 0)
+        self.assertEqual(clpy.backend.Device().id, 0)
+
+    def test_with_device(self):
+        n = clpy.backend.get_device_count()
+        with clpy.backend.Device(n - 1):
+            self.assertEqual(clpy.backend.get_device_id(), n - 1)
+            with clpy.backend.Device(0):
+                self.assertEqual(clpy.backend.get_device_id(), 0)
+            self.assertEqual(clpy.backend.get_device_id(), n - 1)
+        self.assertEqual(clpy.backend.get_device_id(), 0)
+
+    def test_invalid_device(self):
+        with self.assertRaises(ValueError):
+            clpy.backend.Device(clpy.backend.get_device_count()).use()
+        self.assertEqual(clpy.backend.get_device_id(), 0)
+
+    def test_compute_on_each_device(self):
+        expected = numpy.arange(10, dtype=numpy.float32) * 2
+        for i in range(clpy.backend.get_device_count()):
+            with clpy.backend.Device(i):
+                x = clpy.arange(10, dtype=numpy.float32)
+                self.assertEqual(x.device.id, i)
+                y = x * 2
+                self.assertEqual(y.device.id, i)
+                self.assertTrue(numpy.array_equal(y.get(), expected))
+                self.assertEqual(float(x.sum()), 45)
+
+    @unittest.skipIf(clpy.backend.get_device_count() < 2,
+                     'requires multiple devices')
+    def test_copy_between_devices(self):
+        with clpy.backend.Device(1):
+            x = clpy.arange(10, dtype=numpy.float32)
+        with clpy.backend.Device(0):
+            y = x.copy()
+        self.assertEqual(y.device.id, 0)
+        self.assertTrue(numpy.array_equal(
+            y.get(), numpy.arange(10, dtype=numpy.float32)))
+        # get works regardless of the current device
+        self.assertTrue(numpy.array_equal(
+            x.get(), numpy.arange(10, dtype=numpy.float32)))
+
+    @unittest.skipIf(clpy.backend.get_device_count() < 2,
+                     'requires multiple devices')
+    def test_array_of_other_device(self):
+        with clpy.backend.Device(1):
+            x = clpy.arange(10, dtype=numpy.float32)
+        with self.assertRaises(ValueError):
+            x * 2
+
+
+class TestPartitionDevice(unittest.TestCase):
+    """test class of sub-devices created by clCreateSubDevices"""
+
+    def _partition(self, **kwargs):
+        try:
+            return clpy.backend.partition_device(device=0, **kwargs)
+        except clpy.backend.opencl.exceptions.OpenCLRuntimeError as e:
+            self.skipTest('the device cannot be partitioned: %s' % e)
+
+    def test_partition_equally(self):
+        n = clpy.backend.get_device_count()
+        devices = self._partition(equally=1)
+        self.assertGreaterEqual(len(devices), 1)
+        self.assertEqual([d.id for d in devices],
+                         list(range(n, n + len(devices))))
+        self.assertEqual(clpy.backend.get_device_count(), n + len(devices))
+        for d in devices:
+            self.assertEqual(d.parent, clpy.backend.Device(0))
+        self.assertIsNone(clpy.backend.Device(0).parent)
+
+    def test_partition_by_counts(self):
+        devices = self._partition(counts=[1])
+        self.assertEqual(len(devices), 1)
+
+    def test_compute_on_sub_devices(self):
+        expected = numpy.arange(10, dtype=numpy.float32) * 2
+        for d in self._partition(equally=1)[:2]:
+            with d:
+                x = clpy.arange(10, dtype=numpy.float32)
+                self.assertEqual(x.device, d)
+                self.assertTrue(numpy.array_equal((x * 2).get(), expected))
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            clpy.backend.partition_device()
+        with self.assertRaises(ValueError):
+            clpy.backend.partition_device(equally=1, counts=[1])
+        with self.assertRaises(ValueError):
+            clpy.backend.partition_device(counts=[0])
+
+
+class TestDeviceInfo(unittest.TestCase):
+    """test class of the capabilities of devices"""
+
+    def test_cached(self):
+        info = clpy.backend.get_device_info()
+        self.assertIs(clpy.backend.get_device_info(0), info)
+        self.assertIs(clpy.backend.Device().info, info)
+        self.assertEqual(info.device_id, 0)
+
+    def test_capabilities(self):
+        info = clpy.backend.get_device_info()
+        self.assertGreaterEqual(info.max_work_group_size, 1)
+        self.assertGreaterEqual(len(info.max_work_item_sizes), 3)
+        self.assertGreaterEqual(info.preferred_work_group_size_multiple, 1)
+        self.assertGreater(info.local_mem_size, 0)
+        self.assertGreaterEqual(info.max_compute_units, 1)
+        self.assertGreaterEqual(info.native_vector_widths['float'], 1)
+        self.assertEqual(info.mem_base_addr_align,
+                         clpy.backend.memory.get_subbuffer_alignment())
+
+    def test_work_group_size(self):
+        info = clpy.backend.get_device_info()
+        size = info.get_work_group_size(256, 32)
+        self.assertLessEqual(size, 256)
+        self.assertLessEqual(size, info.max_work_group_size)
+        self.assertLessEqual(size * 32, info.local_mem_size)
+        self.assertEqual(size & (size - 1), 0)
+        self.assertEqual(info.get_work_group_size(1), 1)
+
+    def test_invalid_device(self):
+        with self.assertRaises(ValueError):
+            clpy.backend.get_device_info(clpy.backend.get_device_count())
+
+
+if __name__ == "__main__":
+    unittest.main()
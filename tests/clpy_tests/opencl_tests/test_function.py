@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import numpy
+
+import clpy
+
+
+class TestArgumentPlan(unittest.TestCase):
+    """test class of the argument marshalling of kernel launches"""
+
+    def setUp(self):
+        self.kernel = clpy.ElementwiseKernel(
+            'T x, T a', 'T y', 'y = x * a', 'test_plan_scale')
+
+    def test_repeated_launch(self):
+        x = clpy.arange(6, dtype=numpy.float32)
+        y = clpy.empty_like(x)
+        for a in range(3):
+            # the output array is unchanged and only the scalar changes
+            self.kernel(x, numpy.float32(a), y)
+            self.assertTrue(numpy.array_equal(
+                y.get(), numpy.arange(6, dtype=numpy.float32) * a))
+
+    def test_change_array(self):
+        x1 = clpy.arange(6, dtype=numpy.int32)
+        x2 = clpy.arange(6, 12, dtype=numpy.int32)
+        y = self.kernel(x1, numpy.int32(2))
+        self.assertTrue(numpy.array_equal(
+            y.get(), numpy.arange(6, dtype=numpy.int32) * 2))
+        y = self.kernel(x2, numpy.int32(2))
+        self.assertTrue(numpy.array_equal(
+            y.get(), numpy.arange(6, 12, dtype=numpy.int32) * 2))
+
+    def test_change_view(self):
+        x = clpy.arange(12, dtype=numpy.int32).reshape(3, 4)
+        expected = numpy.arange(12, dtype=numpy.int32).reshape(3, 4) * 3
+        for view, expected_view in ((x, expected),
+                                    (x[:, 1:], expected[:, 1:]),
+                                    (x[1:, ::2], expected[1:, ::2])):
+            y = self.kernel(view, numpy.int32(3))
+            self.assertTrue(numpy.array_equal(y.get(), expected_view))
+
+    def test_python_scalar(self):
+        kernel = clpy.ElementwiseKernel(
+            'T x, int32 a', 'T y', 'y = x + a', 'test_plan_add')
+        x = clpy.arange(4, dtype=numpy.int32)
+        for a in (1, numpy.int32(2), 3):
+            y = kernel(x, a)
+            self.assertTrue(numpy.array_equal(
+                y.get(), numpy.arange(4, dtype=numpy.int32) + a))
+
+    def test_reduction(self):
+        x = clpy.arange(10, dtype=numpy.float32)
+        self.assertEqual(float(x.sum()), 45)
+        self.assertEqual(float(x[1:].sum()), 45)
+        self.assertEqual(float(x[::2].sum()), 20)
+
+
+class TestAsyncLaunch(unittest.TestCase):
+    """test class of the launches without waiting for kernels"""
+
+    def test_chain(self):
+        x = clpy.zeros(1000, dtype=numpy.float32)
+        for _ in range(100):
+            x += 1
+        self.assertEqual(float(x.sum()), 100000)
+
+    def test_synchronize(self):
+        x = clpy.arange(1000, dtype=numpy.float32)
+        y = x * 2
+        clpy.backend.Stream.null.synchronize()
+        clpy.backend.Device().synchronize()
+        self.assertTrue(numpy.array_equal(
+            y.get(), numpy.arange(1000, dtype=numpy.float32) * 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
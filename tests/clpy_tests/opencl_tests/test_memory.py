@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+import gc
+import threading
 import unittest
 
 import numpy
@@ -87,6 +89,196 @@ class TestSingleDeviceMemoryPool(unittest.TestCase):
         self.assertTrue(numpy.all(expected1 == actual1))
 
 
+class TestMemoryPoolThreadSafety(unittest.TestCase):
+    """test class of SingleDeviceMemoryPool used by multiple threads"""
+
+    def setUp(self):
+        self.pool = clpy.backend.memory.SingleDeviceMemoryPool()
+
+    def test_malloc_free(self):
+        unit = clpy.backend.memory.get_subbuffer_alignment()
+        errors = []
+
+        def run(seed):
+            try:
+                rs = numpy.random.RandomState(seed)
+                for _ in range(100):
+                    ptrs = [self.pool.malloc(int(rs.randint(1, 8)) * unit)
+                            for _ in range(4)]
+                    del ptrs
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(self.pool.used_bytes(), 0)
+
+
+def _chunk_address(memptr):
+    return memptr.buf.get(), memptr.mem.offset
+
+
+class TestMemoryPoolCommandQueues(unittest.TestCase):
+    """test class of SingleDeviceMemoryPool used by multiple command queues"""
+
+    def setUp(self):
+        self.pool = clpy.backend.memory.SingleDeviceMemoryPool()
+        self.size = clpy.backend.memory.get_subbuffer_alignment() * 4
+
+    def test_reuse_on_same_queue(self):
+        ptr = self.pool.malloc(self.size)
+        address = _chunk_address(ptr)
+        del ptr
+        ptr = self.pool.malloc(self.size)
+        self.assertEqual(_chunk_address(ptr), address)
+
+    def test_no_reuse_on_stream(self):
+        ptr = self.pool.malloc(self.size)
+        address = _chunk_address(ptr)
+        del ptr
+        with clpy.backend.Stream():
+            ptr = self.pool.malloc(self.size)
+            self.assertNotEqual(_chunk_address(ptr), address)
+            del ptr
+            self.assertEqual(self.pool.n_free_blocks(), 2)
+
+    def test_reuse_after_stream_is_released(self):
+        stream = clpy.backend.Stream()
+        with stream:
+            ptr = self.pool.malloc(self.size)
+            address = _chunk_address(ptr)
+            del ptr
+        del stream
+        gc.collect()
+        ptr = self.pool.malloc(self.size)
+        self.assertEqual(_chunk_address(ptr), address)
+        self.assertEqual(self.pool.n_free_blocks(), 0)
+
+    def test_free_after_stream_is_released(self):
+        stream = clpy.backend.Stream()
+        with stream:
+            ptr = self.pool.malloc(self.size)
+            address = _chunk_address(ptr)
+        del stream
+        gc.collect()
+        del ptr
+        ptr = self.pool.malloc(self.size)
+        self.assertEqual(_chunk_address(ptr), address)
+
+    def test_free_all_blocks(self):
+        ptr = self.pool.malloc(self.size)
+        with clpy.backend.Stream():
+            ptr2 = self.pool.malloc(self.size)
+        del ptr, ptr2
+        self.assertEqual(self.pool.free_bytes(), self.size * 2)
+        self.pool.free_all_blocks()
+        self.assertEqual(self.pool.n_free_blocks(), 0)
+        self.assertEqual(self.pool.total_bytes(), 0)
+
+    @unittest.skipUnless(
+        clpy.backend.opencl.env.is_per_thread_default_queue_enabled(),
+        'requires CLPY_PER_THREAD_DEFAULT_QUEUE=1')
+    def test_reuse_while_kernel_is_pending(self):
+        n = self.size // 4
+        freed = threading.Event()
+        addresses = {}
+        results = {}
+
+        def run_first():
+            ptr = self.pool.malloc(self.size)
+            addresses['first'] = _chunk_address(ptr)
+            x = clpy.ndarray((n,), numpy.float32, ptr)
+            x.fill(1)
+            y = clpy.zeros(n, dtype=numpy.float32)
+            for _ in range(1000):
+                y += x
+            # the kernels reading x are still pending
+            del x, ptr
+            freed.set()
+            results['first'] = y.get()
+
+        def run_second():
+            freed.wait()
+            ptr = self.pool.malloc(self.size)
+            addresses['second'] = _chunk_address(ptr)
+            z = clpy.ndarray((n,), numpy.float32, ptr)
+            z.fill(-1)
+            results['second'] = z.get()
+
+        threads = [threading.Thread(target=run_first),
+                   threading.Thread(target=run_second)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertNotEqual(addresses['first'], addresses['second'])
+        self.assertTrue(numpy.array_equal(
+            results['first'], numpy.full(n, 1000, dtype=numpy.float32)))
+        self.assertTrue(numpy.array_equal(
+            results['second'], numpy.full(n, -1, dtype=numpy.float32)))
+
+
+class TestMemoryPoolLimit(unittest.TestCase):
+    """test class of the limit and statistics of SingleDeviceMemoryPool"""
+
+    def setUp(self):
+        self.pool = clpy.backend.memory.SingleDeviceMemoryPool()
+        self.unit = self.pool._allocation_unit_size
+
+    def test_set_limit(self):
+        self.pool.set_limit(size=self.unit * 4)
+        self.assertEqual(self.pool.get_limit(), self.unit * 4)
+        p = self.pool.malloc(self.unit * 4)
+        with self.assertRaises(clpy.backend.memory.OutOfMemoryError):
+            self.pool.malloc(self.unit)
+        del p
+        # the free block is reused
+        self.pool.malloc(self.unit * 4)
+
+    def test_limit_releases_free_blocks(self):
+        self.pool.set_limit(size=self.unit * 4)
+        p = self.pool.malloc(self.unit * 3)
+        del p
+        # the free block of 3 units is released to allocate 4 units
+        self.pool.malloc(self.unit * 4)
+        self.assertEqual(self.pool.total_bytes(), self.unit * 4)
+
+    def test_set_limit_fraction(self):
+        self.pool.set_limit(fraction=0.5)
+        self.assertGreater(self.pool.get_limit(), 0)
+        self.pool.set_limit()
+        self.assertEqual(self.pool.get_limit(), 0)
+        with self.assertRaises(ValueError):
+            self.pool.set_limit(fraction=1.5)
+        with self.assertRaises(ValueError):
+            self.pool.set_limit(size=1, fraction=0.5)
+
+    def test_statistics(self):
+        p1 = self.pool.malloc(self.unit * 2)
+        del p1
+        p2 = self.pool.malloc(self.unit)
+        p3 = self.pool.malloc(self.unit)
+        del p2, p3
+        stats = self.pool.get_statistics()
+        self.assertEqual(stats['peak_bytes'], self.unit * 2)
+        self.assertEqual(stats['used_bytes'], 0)
+        self.assertEqual(stats['total_bytes'], self.unit * 2)
+        bin1 = stats['bins'][self.unit]
+        self.assertEqual(bin1['allocations'], 2)
+        self.assertEqual(bin1['hits'], 2)
+        self.assertEqual(bin1['misses'], 0)
+        self.assertEqual(bin1['splits'], 1)
+        self.assertEqual(bin1['merges'], 1)
+        self.assertEqual(bin1['peak_bytes'], self.unit * 2)
+        bin2 = stats['bins'][self.unit * 2]
+        self.assertEqual(bin2['allocations'], 1)
+        self.assertEqual(bin2['misses'], 1)
+
+
 class TestMemoryPointer(unittest.TestCase):
     """test class of MemoryPointer"""
 
@@ -192,6 +384,174 @@ class TestMemoryPointer(unittest.TestCase):
         self.assertTrue(numpy.all(actual == expected))
 
 
+class TestAsyncCopy(unittest.TestCase):
+    """test class of asynchronous copies on streams"""
+
+    def setUp(self):
+        self.stream = clpy.backend.Stream()
+
+    def test_get(self):
+        x = clpy.arange(1000, dtype=numpy.float32)
+        actual = x.get(stream=self.stream)
+        self.stream.synchronize()
+        self.assertTrue(numpy.array_equal(
+            actual, numpy.arange(1000, dtype=numpy.float32)))
+
+    def test_set(self):
+        expected = numpy.arange(1000, dtype=numpy.float32)
+        x = clpy.empty(1000, dtype=numpy.float32)
+        x.set(expected.copy(), stream=self.stream)
+        self.stream.synchronize()
+        self.assertTrue(numpy.array_equal(x.get(), expected))
+
+    def test_copy_from_device_async(self):
+        x = clpy.arange(100, dtype=numpy.int32)
+        y = clpy.empty_like(x)
+        y.data.copy_from_device_async(x.data, x.nbytes, self.stream)
+        self.stream.synchronize()
+        self.assertTrue(numpy.array_equal(
+            y.get(), numpy.arange(100, dtype=numpy.int32)))
+
+    def test_memset(self):
+        x = clpy.empty(100, dtype=numpy.uint8)
+        x.data.memset(3, 100)
+        clpy.backend.Stream.null.synchronize()
+        x.data.memset_async(5, 50, self.stream)
+        self.stream.synchronize()
+        actual = x.get()
+        self.assertTrue(numpy.all(actual[:50] == 5))
+        self.assertTrue(numpy.all(actual[50:] == 3))
+
+    def test_overlap(self):
+        xs = [clpy.arange(1000, dtype=numpy.float32) * i for i in range(4)]
+        clpy.backend.Stream.null.synchronize()
+        streams = [clpy.backend.Stream() for _ in xs]
+        outs = [x.get(stream=s) for x, s in zip(xs, streams)]
+        for s in streams:
+            s.synchronize()
+        for i, out in enumerate(outs):
+            self.assertTrue(numpy.array_equal(
+                out, numpy.arange(1000, dtype=numpy.float32) * i))
+
+
+class TestFill(unittest.TestCase):
+    """test class of filling memory by clEnqueueFillBuffer"""
+
+    def test_fill_pattern(self):
+        x = clpy.empty(100, dtype=numpy.int32)
+        x.data.fill(numpy.int32(7).tobytes(), x.nbytes)
+        self.assertTrue(numpy.all(x.get() == 7))
+
+    def test_fill_offset(self):
+        x = clpy.zeros(100, dtype=numpy.float64)
+        y = x[10:20]
+        y.data.fill(numpy.float64(1.5).tobytes(), y.nbytes)
+        expected = numpy.zeros(100, dtype=numpy.float64)
+        expected[10:20] = 1.5
+        self.assertTrue(numpy.array_equal(x.get(), expected))
+
+    def test_invalid_pattern(self):
+        x = clpy.empty(100, dtype=numpy.uint8)
+        with self.assertRaises(ValueError):
+            x.data.fill(b'abc', 99)
+        with self.assertRaises(ValueError):
+            x.data.fill(b'ab', 99)
+
+    def test_ndarray_fill(self):
+        for dtype in (numpy.bool_, numpy.int8, numpy.uint16, numpy.int64,
+                      numpy.float32, numpy.float64, numpy.complex64):
+            x = clpy.empty((3, 4), dtype=dtype)
+            x.fill(1)
+            self.assertTrue(numpy.array_equal(
+                x.get(), numpy.ones((3, 4), dtype=dtype)))
+
+    def test_ndarray_fill_non_contiguous(self):
+        x = clpy.zeros((3, 4), dtype=numpy.float32)
+        x[:, ::2].fill(2)
+        expected = numpy.zeros((3, 4), dtype=numpy.float32)
+        expected[:, ::2] = 2
+        self.assertTrue(numpy.array_equal(x.get(), expected))
+
+    def test_zeros(self):
+        x = clpy.full(100, 3, dtype=numpy.int32)
+        self.assertTrue(numpy.all(x.get() == 3))
+        y = clpy.zeros_like(x)
+        self.assertTrue(numpy.all(y.get() == 0))
+
+
+class TestMappedMemory(unittest.TestCase):
+    """test class of MappedMemory"""
+
+    def test_array_interface(self):
+        x = clpy.arange(100, dtype=numpy.int32)
+        mapped = clpy.backend.memory.MappedMemory(x.data, x.nbytes)
+        actual = numpy.asarray(mapped).view(numpy.int32)
+        self.assertTrue(numpy.array_equal(
+            actual, numpy.arange(100, dtype=numpy.int32)))
+
+    def test_unmap(self):
+        x = clpy.arange(100, dtype=numpy.int32)
+        mapped = clpy.backend.memory.MappedMemory(x.data, x.nbytes)
+        numpy.asarray(mapped).view(numpy.int32)[...] = 1
+        mapped.unmap()
+        self.assertEqual(mapped.ptr, 0)
+        self.assertTrue(numpy.array_equal(
+            x.get(), numpy.ones(100, dtype=numpy.int32)))
+        mapped.unmap()
+
+    def test_host_memory(self):
+        a = numpy.arange(100, dtype=numpy.float32)
+        mem = clpy.backend.memory.HostMemory(a)
+        x = clpy.ndarray(a.shape, a.dtype, clpy.backend.MemoryPointer(mem, 0))
+        self.assertTrue(numpy.array_equal((x * 2).get(), a * 2))
+
+
+@unittest.skipUnless(clpy.backend.memory.is_zero_copy_enabled(),
+                     'zero-copy mode is not enabled')
+class TestZeroCopy(unittest.TestCase):
+    """test class of the zero-copy mode"""
+
+    def test_asnumpy(self):
+        x = clpy.arange(100, dtype=numpy.float32) * 2
+        actual = clpy.asnumpy(x)
+        self.assertTrue(numpy.array_equal(
+            actual, numpy.arange(100, dtype=numpy.float32) * 2))
+
+    def _aligned_array(self):
+        alignment = clpy.backend.memory.get_subbuffer_alignment()
+        buf = numpy.empty(400 + alignment, dtype=numpy.uint8)
+        offset = -buf.ctypes.data % alignment
+        a = buf[offset:offset + 400].view(numpy.float32)
+        a[...] = numpy.arange(100, dtype=numpy.float32)
+        return a
+
+    def test_asnumpy_alias(self):
+        if not clpy.backend.memory.is_zero_copy_enabled():
+            self.skipTest('requires the zero-copy mode')
+        x = clpy.arange(100, dtype=numpy.float32)
+        actual = clpy.asnumpy(x)
+        actual[0] = -1
+        del actual
+        self.assertEqual(x[0].get(), -1)
+
+    def test_asarray_alias(self):
+        if not clpy.backend.memory.is_zero_copy_enabled():
+            self.skipTest('requires the zero-copy mode')
+        a = self._aligned_array()
+        x = clpy.asarray(a)
+        self.assertIsInstance(x.data.mem, clpy.backend.memory.HostMemory)
+        self.assertTrue(numpy.array_equal((x + 1).get(), a + 1))
+
+    def test_array_copies(self):
+        a = self._aligned_array()
+        x = clpy.array(a)
+        self.assertNotIsInstance(x.data.mem, clpy.backend.memory.HostMemory)
+        clpy.backend.Stream.null.synchronize()
+        a[...] = 0
+        self.assertTrue(numpy.array_equal(
+            x.get(), numpy.arange(100, dtype=numpy.float32)))
+
+
 class TestSingleDeviceMemoryPoolwithChunk(unittest.TestCase):
     """test class of SingleDeviceMemoryPool"""
 
@@ -199,7 +559,8 @@ class TestSingleDeviceMemoryPoolwithChunk(unittest.TestCase):
         # create chunk and free to prepare chunk in pool
         self.pool = clpy.backend.memory.SingleDeviceMemoryPool()
         clpy.backend.memory.set_allocator(self.pool.malloc)
-        self.pooled_chunk_size = clpy.backend.memory.subbuffer_alignment * 2
+        self.pooled_chunk_size = (
+            clpy.backend.memory.get_subbuffer_alignment() * 2)
         self.tmp = self.pool.malloc(self.pooled_chunk_size)
         self.pool.free(self.tmp.buf, self.pooled_chunk_size, 0)
 
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+import json
+import unittest
+
+import six
+
+import clpy
+from clpy.backend import memory_hooks
+
+
+class SimpleMemoryHook(clpy.backend.MemoryHook):
+    name = 'SimpleMemoryHook'
+
+    def __init__(self):
+        self.history = []
+
+    def alloc_preprocess(self, **kwargs):
+        self.history.append(('alloc_preprocess', kwargs))
+
+    def alloc_postprocess(self, **kwargs):
+        self.history.append(('alloc_postprocess', kwargs))
+
+    def malloc_preprocess(self, **kwargs):
+        self.history.append(('malloc_preprocess', kwargs))
+
+    def malloc_postprocess(self, **kwargs):
+        self.history.append(('malloc_postprocess', kwargs))
+
+    def free_preprocess(self, **kwargs):
+        self.history.append(('free_preprocess', kwargs))
+
+    def free_postprocess(self, **kwargs):
+        self.history.append(('free_postprocess', kwargs))
+
+
+class TestMemoryHook(unittest.TestCase):
+    """test class of MemoryHook on the memory pool"""
+
+    def setUp(self):
+        self.pool = clpy.backend.MemoryPool()
+        self.unit = clpy.backend.memory.get_subbuffer_alignment()
+
+    def test_hook(self):
+        hook = SimpleMemoryHook()
+        with hook:
+            mem = self.pool.malloc(1)
+            ptr1, pmem1 = mem.buf.get(), id(mem.mem)
+            del mem
+            mem = self.pool.malloc(1)
+            ptr2, pmem2 = mem.buf.get(), id(mem.mem)
+            del mem
+        device_id = clpy.backend.get_device_id()
+        self.assertEqual(ptr1, ptr2)
+        self.assertEqual(hook.history, [
+            ('malloc_preprocess', {'device_id': device_id, 'size': 1,
+                                   'mem_size': self.unit}),
+            ('alloc_preprocess', {'device_id': device_id,
+                                  'mem_size': self.unit}),
+            ('alloc_postprocess', {'device_id': device_id,
+                                   'mem_size': self.unit, 'mem_ptr': ptr1}),
+            ('malloc_postprocess', {'device_id': device_id, 'size': 1,
+                                    'mem_size': self.unit, 'mem_ptr': ptr1,
+                                    'pmem_id': pmem1}),
+            ('free_preprocess', {'device_id': device_id,
+                                 'mem_size': self.unit, 'mem_ptr': ptr1,
+                                 'pmem_id': pmem1}),
+            ('free_postprocess', {'device_id': device_id,
+                                  'mem_size': self.unit, 'mem_ptr': ptr1,
+                                  'pmem_id': pmem1}),
+            ('malloc_preprocess', {'device_id': device_id, 'size': 1,
+                                   'mem_size': self.unit}),
+            ('malloc_postprocess', {'device_id': device_id, 'size': 1,
+                                    'mem_size': self.unit, 'mem_ptr': ptr2,
+                                    'pmem_id': pmem2}),
+            ('free_preprocess', {'device_id': device_id,
+                                 'mem_size': self.unit, 'mem_ptr': ptr2,
+                                 'pmem_id': pmem2}),
+            ('free_postprocess', {'device_id': device_id,
+                                  'mem_size': self.unit, 'mem_ptr': ptr2,
+                                  'pmem_id': pmem2}),
+        ])
+
+    def test_duplicated_hook(self):
+        with SimpleMemoryHook():
+            with self.assertRaises(KeyError):
+                with SimpleMemoryHook():
+                    pass
+
+
+class TestDebugPrintHook(unittest.TestCase):
+    """test class of DebugPrintHook"""
+
+    def test_print(self):
+        io = six.StringIO()
+        pool = clpy.backend.MemoryPool()
+        unit = clpy.backend.memory.get_subbuffer_alignment()
+        with memory_hooks.DebugPrintHook(file=io):
+            mem = pool.malloc(1)
+            ptr, pmem = mem.buf.get(), id(mem.mem)
+            del mem
+        device_id = clpy.backend.get_device_id()
+        lines = [json.loads(line) for line in io.getvalue().splitlines()]
+        self.assertEqual(lines, [
+            {'hook': 'alloc', 'device_id': device_id, 'mem_size': unit,
+             'mem_ptr': ptr},
+            {'hook': 'malloc', 'device_id': device_id, 'size': 1,
+             'mem_size': unit, 'mem_ptr': ptr, 'pmem_id': hex(pmem)},
+            {'hook': 'free', 'device_id': device_id, 'mem_size': unit,
+             'mem_ptr': ptr, 'pmem_id': hex(pmem)},
+        ])
+
+
+class TestLineProfileHook(unittest.TestCase):
+    """test class of LineProfileHook"""
+
+    def test_report(self):
+        pool = clpy.backend.MemoryPool()
+        unit = clpy.backend.memory.get_subbuffer_alignment()
+        hook = memory_hooks.LineProfileHook()
+        with hook:
+            mem = pool.malloc(unit * 2)
+            del mem
+            mem = pool.malloc(unit)
+            del mem
+        io = six.StringIO()
+        hook.print_report(file=io)
+        lines = io.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith('_root'))
+        self.assertIn(':test_report (', io.getvalue())
+        self.assertEqual(hook._root.used_bytes, unit * 3)
+        self.assertEqual(hook._root.acquired_bytes, unit * 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import numpy
+
+import clpy
+
+
+class TestPinnedMemory(unittest.TestCase):
+    """test class of pinned memory mapped from OpenCL buffers"""
+
+    def test_alloc(self):
+        p = clpy.backend.alloc_pinned_memory(1024)
+        self.assertNotEqual(int(p), 0)
+        self.assertNotEqual(p.mem.buf, 0)
+        self.assertEqual(p.size(), 1024)
+        a = numpy.frombuffer(p, numpy.int32, 256)
+        a[...] = numpy.arange(256, dtype=numpy.int32)
+        self.assertTrue(numpy.array_equal(
+            a, numpy.arange(256, dtype=numpy.int32)))
+
+    def test_copy(self):
+        p = clpy.backend.alloc_pinned_memory(400)
+        src = numpy.frombuffer(p, numpy.float32, 100)
+        src[...] = numpy.arange(100, dtype=numpy.float32)
+        x = clpy.empty(100, dtype=numpy.float32)
+        x.set(src)
+        self.assertTrue(numpy.array_equal(
+            x.get(), numpy.arange(100, dtype=numpy.float32)))
+
+    def test_array_in_stream(self):
+        self.assertFalse(clpy.backend.pinned_memory._is_allocator_pooled())
+        a = numpy.arange(1000, dtype=numpy.int64)
+        stream = clpy.backend.Stream()
+        with stream:
+            x = clpy.array(a)
+            # the source can be modified before the copy is done
+            a[...] = 0
+        stream.synchronize()
+        self.assertTrue(numpy.array_equal(
+            x.get(), numpy.arange(1000, dtype=numpy.int64)))
+
+
+class TestPinnedMemoryPool(unittest.TestCase):
+    """test class of PinnedMemoryPool"""
+
+    def setUp(self):
+        self.pool = clpy.backend.PinnedMemoryPool()
+        clpy.backend.set_pinned_memory_allocator(self.pool.malloc)
+
+    def tearDown(self):
+        clpy.backend.set_pinned_memory_allocator()
+
+    def test_pooled(self):
+        self.assertTrue(clpy.backend.pinned_memory._is_allocator_pooled())
+        clpy.backend.set_pinned_memory_allocator()
+        self.assertFalse(clpy.backend.pinned_memory._is_allocator_pooled())
+
+    def test_reuse(self):
+        p1 = self.pool.malloc(1000)
+        ptr = int(p1)
+        del p1
+        self.assertEqual(self.pool.n_free_blocks(), 1)
+        p2 = self.pool.malloc(1000)
+        self.assertEqual(int(p2), ptr)
+
+    def test_asnumpy_stream(self):
+        stream = clpy.backend.Stream()
+        x = clpy.arange(1000, dtype=numpy.float32)
+        clpy.backend.Stream.null.synchronize()
+        a = clpy.asnumpy(x, stream=stream)
+        stream.synchronize()
+        self.assertTrue(numpy.array_equal(
+            a, numpy.arange(1000, dtype=numpy.float32)))
+
+    def test_array(self):
+        a = numpy.arange(1000, dtype=numpy.int64)
+        x = clpy.array(a)
+        self.assertTrue(numpy.array_equal(x.get(), a))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+import clpy
+from clpy.backend import precompile
+
+
+class TestWarmup(unittest.TestCase):
+    """test class of the bulk kernel compilation"""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.old_cache_dir = os.environ.get('CLPY_CACHE_DIR')
+        os.environ['CLPY_CACHE_DIR'] = self.cache_dir
+
+    def tearDown(self):
+        if self.old_cache_dir is None:
+            del os.environ['CLPY_CACHE_DIR']
+        else:
+            os.environ['CLPY_CACHE_DIR'] = self.old_cache_dir
+        shutil.rmtree(self.cache_dir)
+
+    def test_ufunc(self):
+        n = clpy.backend.warmup(
+            [clpy.add], dtypes=[numpy.float32], ndims=[1, 2], processes=1)
+        self.assertEqual(n, 2)
+        self.assertNotEqual(len(os.listdir(self.cache_dir)), 0)
+
+    def test_reduction(self):
+        n = clpy.backend.warmup(
+            [clpy.core.core._sum], dtypes=[numpy.float32], ndims=[2],
+            processes=1)
+        self.assertEqual(n, 2)
+
+    def test_elementwise_kernel(self):
+        kernel = clpy.ElementwiseKernel(
+            'T x', 'T y', 'y = x * 2', 'test_warmup_double')
+        n = clpy.backend.warmup(
+            [kernel], dtypes=[numpy.float32, numpy.int32], processes=1)
+        self.assertEqual(n, 2)
+        x = clpy.arange(4, dtype=numpy.float32)
+        self.assertTrue(numpy.array_equal(
+            kernel(x).get(), numpy.arange(4, dtype=numpy.float32) * 2))
+
+    def test_launch_after_warmup(self):
+        kernel = clpy.ElementwiseKernel(
+            'T x', 'T y', 'y = x * 3', 'test_warmup_triple')
+        clpy.backend.warmup([kernel], dtypes=[numpy.float32], processes=1)
+        files = sorted(os.listdir(self.cache_dir))
+        x_np = numpy.arange(1001, dtype=numpy.float32)
+        x = clpy.array(x_np)
+        # aligned and unaligned contiguous arrays
+        self.assertTrue(numpy.array_equal(kernel(x).get(), x_np * 3))
+        self.assertTrue(numpy.array_equal(
+            kernel(x[1:]).get(), x_np[1:] * 3))
+        self.assertEqual(sorted(os.listdir(self.cache_dir)), files)
+
+    def test_ufunc_launch_after_warmup(self):
+        clpy.backend.warmup(
+            ['clpy.subtract'], dtypes=[numpy.float32], processes=2)
+        files = sorted(os.listdir(self.cache_dir))
+        x_np = numpy.arange(1001, dtype=numpy.float32)
+        x = clpy.array(x_np)
+        self.assertTrue(numpy.array_equal(
+            clpy.subtract(x, x).get(), x_np - x_np))
+        self.assertTrue(numpy.array_equal(
+            clpy.subtract(x[1:], x[:-1]).get(), x_np[1:] - x_np[:-1]))
+        self.assertEqual(sorted(os.listdir(self.cache_dir)), files)
+
+    def test_elementwise_kernel_without_dtypes(self):
+        kernel = clpy.ElementwiseKernel(
+            'T x', 'T y', 'y = x * 2', 'test_warmup_double')
+        with self.assertRaises(ValueError):
+            clpy.backend.warmup([kernel], processes=1)
+
+    def test_process_pool(self):
+        n = clpy.backend.warmup(
+            ['clpy.multiply'], dtypes=[numpy.float32, numpy.int32],
+            processes=2)
+        self.assertEqual(n, 2)
+        self.assertNotEqual(len(os.listdir(self.cache_dir)), 0)
+
+    def test_resolve(self):
+        self.assertIs(precompile._resolve('clpy.add'), clpy.add)
+        self.assertIs(precompile._resolve('clpy:add'), clpy.add)
+
+    def test_default_kernels(self):
+        kernels = precompile.get_default_kernels()
+        self.assertIn('clpy.add', kernels)
+        self.assertIn('clpy.core.core._sum', kernels)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+import json
+import unittest
+
+import numpy
+import six
+
+import clpy
+from clpy import prof
+from clpy.backend import profiler
+
+
+@unittest.skipUnless(
+    clpy.backend.opencl.env.is_queue_profiling_enabled(),
+    'requires CLPY_QUEUE_PROFILING=1')
+class TestProfiler(unittest.TestCase):
+    """test class of the event-based profiler"""
+
+    def setUp(self):
+        profiler.clear()
+
+    def tearDown(self):
+        profiler.stop()
+        profiler.clear()
+
+    def test_disabled(self):
+        x = clpy.arange(10, dtype=numpy.float32)
+        x * 2
+        self.assertEqual(profiler.get_records(), [])
+
+    def test_kernel(self):
+        x = clpy.arange(10, dtype=numpy.float32)
+        with clpy.backend.profile():
+            x * 2
+        records = profiler.get_records()
+        self.assertEqual(len(records), 1)
+        record, = records
+        self.assertEqual(record.category, 'kernel')
+        self.assertIn('multiply', record.name)
+        self.assertLessEqual(record.queued, record.submit)
+        self.assertLessEqual(record.submit, record.start)
+        self.assertLessEqual(record.start, record.end)
+
+    def test_memcpy(self):
+        with clpy.backend.profile():
+            x = clpy.array(numpy.arange(10, dtype=numpy.float32))
+            x.get()
+        names = [r.name for r in profiler.get_records()
+                 if r.category == 'memcpy']
+        self.assertEqual(names, ['copy_from_host', 'copy_to_host'])
+
+    def test_blas(self):
+        a = clpy.ones((4, 4), dtype=numpy.float32)
+        with clpy.backend.profile():
+            a.dot(a)
+        self.assertIn('sgemm', [r.name for r in profiler.get_records()
+                                if r.category == 'blas'])
+
+    def test_time_range(self):
+        x = clpy.arange(10, dtype=numpy.float32)
+        with clpy.backend.profile():
+            with prof.time_range('outer'):
+                with prof.time_range('inner'):
+                    x * 2
+        record, = profiler.get_records()
+        self.assertEqual(record.ranges, ('outer', 'inner'))
+        self.assertEqual([r.name for r in profiler.get_host_records()],
+                         ['inner', 'outer'])
+
+    def test_time_range_decorator(self):
+        @prof.TimeRangeDecorator()
+        def f(x):
+            return x * 2
+
+        with clpy.backend.profile():
+            f(clpy.arange(10))
+        self.assertIn(('f',), [r.ranges for r in profiler.get_records()])
+
+    def test_chrome_trace(self):
+        x = clpy.arange(10, dtype=numpy.float32)
+        with clpy.backend.profile():
+            with prof.time_range('step'):
+                x * 2
+        out = six.StringIO()
+        profiler.export_chrome_trace(out)
+        trace = json.loads(out.getvalue())
+        names = [e['name'] for e in trace['traceEvents'] if e['ph'] == 'X']
+        self.assertIn('step', names)
+        self.assertEqual(len(names), 2)
+
+
+@unittest.skipIf(
+    clpy.backend.opencl.env.is_queue_profiling_enabled(),
+    'requires queues without profiling')
+class TestProfilerWithoutQueueProfiling(unittest.TestCase):
+    """test class of the profiler on queues without profiling"""
+
+    def test_start(self):
+        with self.assertRaises(RuntimeError):
+            profiler.start()
+        self.assertFalse(profiler.is_enabled())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -152,7 +152,8 @@ class TestReductionKernelwithChunk(unittest.TestCase):
         # create chunk and free to prepare chunk in pool
         self.pool = cp.backend.memory.SingleDeviceMemoryPool()
         cp.backend.memory.set_allocator(self.pool.malloc)
-        self.pooled_chunk_size = cp.backend.memory.subbuffer_alignment * 2
+        self.pooled_chunk_size = (
+            cp.backend.memory.get_subbuffer_alignment() * 2)
         self.tmp = self.pool.malloc(self.pooled_chunk_size)
         self.pool.free(self.tmp.buf, self.pooled_chunk_size, 0)
 
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+import unittest
+
+import numpy
+
+import clpy
+
+
+class TestStream(unittest.TestCase):
+    """test class of streams backed by command queues"""
+
+    def test_current_stream(self):
+        self.assertIs(clpy.backend.get_current_stream(),
+                      clpy.backend.Stream.null)
+        stream1 = clpy.backend.Stream()
+        stream2 = clpy.backend.Stream()
+        with stream1:
+            self.assertIs(clpy.backend.get_current_stream(), stream1)
+            with stream2:
+                self.assertIs(clpy.backend.get_current_stream(), stream2)
+            self.assertIs(clpy.backend.get_current_stream(), stream1)
+        self.assertIs(clpy.backend.get_current_stream(),
+                      clpy.backend.Stream.null)
+
+    def test_launch_on_stream(self):
+        stream = clpy.backend.Stream()
+        x = clpy.arange(1000, dtype=numpy.float32)
+        x_np = x.get()
+        with stream:
+            y = x * 2 + 1
+            stream.synchronize()
+            self.assertTrue(stream.done)
+            self.assertTrue(numpy.array_equal(y.get(), x_np * 2 + 1))
+
+    def test_wait_event(self):
+        stream1 = clpy.backend.Stream()
+        stream2 = clpy.backend.Stream()
+        x = clpy.zeros(1000, dtype=numpy.float32)
+        clpy.backend.Stream.null.synchronize()
+        with stream1:
+            for _ in range(10):
+                x += 1
+            event = stream1.record()
+        stream2.wait_event(event)
+        with stream2:
+            y = x * 2
+            self.assertTrue(numpy.array_equal(
+                y.get(), numpy.full(1000, 20, dtype=numpy.float32)))
+        self.assertTrue(event.done)
+
+    def test_add_callback(self):
+        stream = clpy.backend.Stream()
+        out = []
+        with stream:
+            for i in range(10):
+                clpy.arange(10) * i
+                stream.add_callback(
+                    lambda s, status, arg: out.append((s, status, arg)), i)
+        stream.synchronize()
+        self.assertEqual(out, [(stream, 0, i) for i in range(10)])
+
+
+class TestEvent(unittest.TestCase):
+    """test class of events backed by cl_event"""
+
+    def test_not_recorded(self):
+        event = clpy.backend.Event()
+        self.assertTrue(event.done)
+        event.synchronize()
+
+    def test_synchronize(self):
+        stream = clpy.backend.Stream()
+        event = clpy.backend.Event()
+        with stream:
+            clpy.arange(1000) * 2
+            event.record()
+        event.synchronize()
+        self.assertTrue(event.done)
+
+    def test_poll_done(self):
+        stream = clpy.backend.Stream()
+        with stream:
+            clpy.arange(1000) * 2
+            event = stream.record()
+        deadline = time.time() + 60
+        while not event.done:
+            self.assertLess(time.time(), deadline)
+            time.sleep(0.001)
+
+    @unittest.skipUnless(
+        clpy.backend.opencl.env.is_queue_profiling_enabled(),
+        'requires CLPY_QUEUE_PROFILING=1')
+    def test_elapsed_time(self):
+        stream = clpy.backend.Stream()
+        start = clpy.backend.Event()
+        end = clpy.backend.Event()
+        with stream:
+            start.record()
+            clpy.arange(1000) * 2
+            end.record()
+        self.assertGreaterEqual(
+            clpy.backend.get_elapsed_time(start, end), 0)
+
+    @unittest.skipUnless(
+        clpy.backend.opencl.env.is_queue_profiling_enabled(),
+        'requires CLPY_QUEUE_PROFILING=1')
+    def test_elapsed_time_on_null_stream(self):
+        start = clpy.backend.Stream.null.record()
+        clpy.arange(1000) * 2
+        end = clpy.backend.Stream.null.record()
+        self.assertGreaterEqual(
+            clpy.backend.get_elapsed_time(start, end), 0)
+
+    @unittest.skipIf(
+        clpy.backend.opencl.env.is_queue_profiling_enabled(),
+        'requires queues without profiling')
+    def test_elapsed_time_without_profiling(self):
+        start = clpy.backend.Stream.null.record()
+        end = clpy.backend.Stream.null.record()
+        with self.assertRaises(
+                clpy.backend.opencl.exceptions.OpenCLRuntimeError):
+            clpy.backend.get_elapsed_time(start, end)
+
+    def test_disable_timing(self):
+        stream = clpy.backend.Stream()
+        start = stream.record(clpy.backend.Event(disable_timing=True))
+        end = stream.record(clpy.backend.Event(disable_timing=True))
+        with self.assertRaises(ValueError):
+            clpy.backend.get_elapsed_time(start, end)
+
+
+@unittest.skipUnless(
+    clpy.backend.opencl.env.is_per_thread_default_queue_enabled(),
+    'requires CLPY_PER_THREAD_DEFAULT_QUEUE=1')
+class TestPerThreadDefaultQueue(unittest.TestCase):
+    """test class of the default command queues of threads"""
+
+    def test_compute_in_threads(self):
+        results = {}
+
+        def run(i):
+            x = clpy.arange(1000, dtype=numpy.float32)
+            results[i] = ((x * i).get(), clpy.backend.Stream.null.done)
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for i in range(4):
+            y, done = results[i]
+            self.assertTrue(numpy.array_equal(
+                y, numpy.arange(1000, dtype=numpy.float32) * i))
+            self.assertTrue(done)
+
+    def test_synchronize_between_threads(self):
+        x = clpy.zeros(1000, dtype=numpy.float32)
+        x += 1
+        clpy.backend.Stream.null.synchronize()
+        out = []
+        t = threading.Thread(target=lambda: out.append(float(x.sum())))
+        t.start()
+        t.join()
+        self.assertEqual(out, [1000])
+
+
+if __name__ == "__main__":
+    unittest.main()
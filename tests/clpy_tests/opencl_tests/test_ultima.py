@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import clpy
+from clpy.backend import ultima
+
+
+def _translate(code):
+    return ultima.translate(
+        'static void __clpy_begin_print_out() '
+        '__attribute__((annotate("clpy_begin_print_out")));\n' +
+        code + '\n'
+        'static void __clpy_end_print_out() '
+        '__attribute__((annotate("clpy_end_print_out")));\n')
+
+
+class TestTranslate(unittest.TestCase):
+    """test class of the in-process ultima translator"""
+
+    def test_translate(self):
+        source = _translate('''
+__kernel void test_kernel(__global int* x){
+  x[get_global_id(0)] = 1;
+}
+''')
+        self.assertIn('test_kernel', source)
+
+    def test_reuse_worker(self):
+        for i in range(3):
+            source = _translate('static int f%d(){return %d;}' % (i, i))
+            self.assertIn('f%d' % i, source)
+
+    def test_error(self):
+        with self.assertRaises(clpy.backend.ultima.exceptions.
+                               UltimaRuntimeError):
+            _translate('this is not C++')
+        # the worker must still be usable after an error
+        self.assertIn('g', _translate('static int g(){return 0;}'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -80,6 +80,33 @@ class TestNotAvailable(unittest.TestCase):
         self.assertFalse(available)
 
 
+class TestLazyInitialization(unittest.TestCase):
+
+    def _run_with_env(self, name, value):
+        return _run_script('''
+import os
+os.environ[{!r}] = {!r}
+import clpy
+try:
+    clpy.backend.get_device_count()
+except Exception as e:
+    print(type(e).__name__)
+'''.format(name, value))
+
+    def test_invalid_device_type(self):
+        # the selection is checked on the first use, not on import
+        returncode, stdoutdata, stderrdata = self._run_with_env(
+            'CLPY_DEVICE_TYPE', 'invalid')
+        self.assertEqual(returncode, 0, 'stderr: {!r}'.format(stderrdata))
+        self.assertIn(stdoutdata, (b'ValueError\n', b'ValueError\r\n'))
+
+    def test_no_platform(self):
+        returncode, stdoutdata, stderrdata = self._run_with_env(
+            'CLPY_PLATFORM', 'no such platform')
+        self.assertEqual(returncode, 0, 'stderr: {!r}'.format(stderrdata))
+        self.assertIn(stdoutdata, (b'RuntimeError\n', b'RuntimeError\r\n'))
+
+
 # This is copied from chainer/testing/__init__.py, so should be replaced in
 # some way.
 if __name__ == '__main__':
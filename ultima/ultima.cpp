@@ -2,6 +2,7 @@
 #include "clang/Frontend/FrontendActions.h"
 #include "clang/Frontend/CompilerInstance.h"
 #include "clang/Lex/Preprocessor.h"
+#include "clang/Frontend/TextDiagnosticPrinter.h"
 #include "clang/Tooling/CommonOptionsParser.h"
 #include "clang/Tooling/Tooling.h"
 #include "llvm/Support/CommandLine.h"
@@ -20,7 +21,9 @@
 #include "clang/Basic/CharInfo.h"
 #include "llvm/ADT/SmallString.h"
 #include "llvm/Support/Format.h"
+#include <iostream>
 #include <memory>
+#include <string>
 #include <utility>
 #include <sstream>
 
@@ -76,11 +79,12 @@ struct ostreams{
 };
 
 class preprocessor : public clang::PPCallbacks{
+  llvm::raw_ostream& os;
   void output(char start, llvm::StringRef filename, char end){
-    llvm::outs() << start << filename << end << '\n';
+    os << start << filename << end << '\n';
   }
  public:
-  constexpr preprocessor() = default;
+  explicit preprocessor(llvm::raw_ostream& os) : os(os){}
   void InclusionDirective(
     clang::SourceLocation,
     const clang::Token&,
@@ -94,7 +98,7 @@ class preprocessor : public clang::PPCallbacks{
   )override{
     if(filename == "cuda_stub.hpp" || filename == "cl_stub.hpp")
       return;
-    llvm::outs() << "#include";
+    os << "#include";
     std::string fn;
     static constexpr const char cupy_dir[] = "cupy/";
     static constexpr std::size_t cupy_dir_length = sizeof(cupy_dir)-1;
@@ -2731,6 +2735,10 @@ public:
           is_const = var_info->is_input;
           init_str = " = " + var_info->name + "_data[get_CArrayIndex_" + std::to_string(var_info->ndim) + "(&" + var_info->name + "_info, &_ind)/sizeof(" + var_info->type + ")]";
         }
+        else if(!parameter && x == "clpy_const"){
+          // const only in OpenCL C, e.g. an element of an input array loaded explicitly
+          is_const = true;
+        }
         else if(!parameter && x.find(clpy_simple_reduction_tag) == 0){
           static constexpr std::size_t tag_length = sizeof(clpy_simple_reduction_tag)-1;
           auto var_info = std::find_if(func_arg_info.back().begin(), func_arg_info.back().end(), [D](const function_special_argument_info& t){
@@ -3139,8 +3147,8 @@ class ast_consumer : public clang::ASTConsumer{
     return pp;
   }
  public:
-  explicit ast_consumer(clang::CompilerInstance& ci) : visit{new decl_visitor{llvm::outs(), ppolicy(ci.getASTContext().getPrintingPolicy())}}{
-    ci.getPreprocessor().addPPCallbacks(llvm::make_unique<preprocessor>());
+  ast_consumer(clang::CompilerInstance& ci, llvm::raw_ostream& os) : visit{new decl_visitor{os, ppolicy(ci.getASTContext().getPrintingPolicy())}}{
+    ci.getPreprocessor().addPPCallbacks(llvm::make_unique<preprocessor>(os));
   }
   virtual void HandleTranslationUnit(clang::ASTContext& context)override{
     visit->Visit(context.getTranslationUnitDecl());
@@ -3148,28 +3156,89 @@ class ast_consumer : public clang::ASTConsumer{
 };
 
 struct ast_frontend_action : clang::SyntaxOnlyAction{
+  llvm::raw_ostream* os;
+  ast_frontend_action() : os{&llvm::outs()}{}
+  explicit ast_frontend_action(llvm::raw_ostream& os) : os{&os}{}
   virtual std::unique_ptr<clang::ASTConsumer> CreateASTConsumer(clang::CompilerInstance& ci, clang::StringRef)override{
-    return llvm::make_unique<ast_consumer>(ci);
+    return llvm::make_unique<ast_consumer>(ci, *os);
   }
 };
 
+struct ast_frontend_action_factory : clang::tooling::FrontendActionFactory{
+  llvm::raw_ostream& os;
+  explicit ast_frontend_action_factory(llvm::raw_ostream& os) : os(os){}
+  virtual clang::FrontendAction* create()override{
+    return new ast_frontend_action{os};
+  }
+};
+
+}
+
+static std::vector<std::string> default_arguments(){
+  return {
+    "-D__ULTIMA=1",
+    "-xc++",
+    "-std=c++14",
+    "-w",
+    "-Wno-narrowing",
+    "-includecl_stub.hpp",
+    "-includecuda_stub.hpp",
+  };
+}
+
+// Server mode: translates sources sent through stdin one after another,
+// so that a client can reuse one process instead of spawning ultima for
+// each source.
+//
+// request:  "<source length>\n<source>"
+// response: "<status> <output length> <diagnostics length>\n<output><diagnostics>"
+static int serve(int argc, const char** argv){
+  static constexpr const char source_path[] = "/__ultima_input.cpp";
+  std::vector<std::string> arguments(argv, argv+argc);
+  for(auto&& arg : default_arguments())
+    arguments.emplace_back(arg);
+  std::string line;
+  while(std::getline(std::cin, line)){
+    if(line.empty())
+      continue;
+    std::string source(std::stoul(line), '\0');
+    if(!std::cin.read(&source[0], static_cast<std::streamsize>(source.size())))
+      return 1;
+    std::string output;
+    std::string diagnostics;
+    int status;
+    {
+      llvm::raw_string_ostream output_stream(output);
+      llvm::raw_string_ostream diagnostics_stream(diagnostics);
+      clang::tooling::FixedCompilationDatabase compilations(".", arguments);
+      clang::tooling::ClangTool tool(compilations, {source_path});
+      tool.mapVirtualFile(source_path, source);
+      clang::TextDiagnosticPrinter printer(diagnostics_stream, new clang::DiagnosticOptions);
+      tool.setDiagnosticConsumer(&printer);
+      registrar::ast_frontend_action_factory factory(output_stream);
+      status = tool.run(&factory);
+      output_stream.flush();
+      diagnostics_stream.flush();
+    }
+    std::cout << status << ' ' << output.size() << ' ' << diagnostics.size() << '\n' << output << diagnostics;
+    std::cout.flush();
+  }
+  return 0;
 }
 
 }
 
 int main(int argc, const char** argv){
+  if(argc >= 2 && std::string(argv[1]) == "--server")
+    return ultima::serve(argc-2, argv+2);
   llvm::cl::OptionCategory tool_category("ultima options");
   llvm::cl::extrahelp common_help(clang::tooling::CommonOptionsParser::HelpMessage);
   std::vector<const char*> params;
   params.reserve(argc+1);
   std::copy(argv, argv+argc, std::back_inserter(params));
-  params.emplace_back("-D__ULTIMA=1");
-  params.emplace_back("-xc++");
-  params.emplace_back("-std=c++14");
-  params.emplace_back("-w");
-  params.emplace_back("-Wno-narrowing");
-  params.emplace_back("-includecl_stub.hpp");
-  params.emplace_back("-includecuda_stub.hpp");
+  const auto arguments = ultima::default_arguments();
+  for(auto&& arg : arguments)
+    params.emplace_back(arg.c_str());
   clang::tooling::CommonOptionsParser options_parser(argc = static_cast<int>(params.size()), params.data(), tool_category);
   clang::tooling::ClangTool tool(options_parser.getCompilations(), options_parser.getSourcePathList());
   return tool.run(clang::tooling::newFrontendActionFactory<ultima::registrar::ast_frontend_action>().get());